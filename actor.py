@@ -0,0 +1,119 @@
+import collections
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+
+import bitacora
+import metricas
+import trazas
+
+MAX_COMANDOS_POR_TURNO = 64  # Tras este número de comandos el actor cede el hilo a otras salas
+
+registro = bitacora.bitacora_por_defecto()
+
+
+class EjecutorActores:
+    """Pool de hilos compartido por todos los actores del proceso"""
+
+    def __init__(self, num_hilos=None):
+        self.num_hilos = num_hilos or min(32, (os.cpu_count() or 1) * 4)
+        self.pool = ThreadPoolExecutor(max_workers=self.num_hilos, thread_name_prefix="actor")
+
+    def programar(self, funcion):
+        self.pool.submit(funcion)
+
+    def detener(self):
+        self.pool.shutdown(wait=True)
+
+
+_ejecutor_por_defecto = None
+_bloqueo_ejecutor = threading.Lock()
+
+
+def ejecutor_por_defecto():
+    global _ejecutor_por_defecto
+    with _bloqueo_ejecutor:
+        if _ejecutor_por_defecto is None:
+            _ejecutor_por_defecto = EjecutorActores()
+        return _ejecutor_por_defecto
+
+
+class Actor:
+    """Ejecuta los comandos de su buzón de uno en uno y en orden.
+
+    El estado del actor solo se toca desde sus comandos, así que no necesita bloqueos:
+    los hilos de E/S solo encolan y vuelven a leer de su socket.
+    """
+
+    def __init__(self, ejecutor=None):
+        self.ejecutor = ejecutor or ejecutor_por_defecto()
+        self._buzon = collections.deque()
+        self._bloqueo_buzon = threading.Lock()  # Solo protege el buzón y la bandera de programación
+        self._programado = False
+
+    def enviar(self, funcion, *args):
+        """Encola un comando sin esperar a que se ejecute"""
+        self._encolar((funcion, args, None, time.perf_counter(), trazas.actual()))
+
+    def pedir(self, funcion, *args):
+        """Encola un comando y devuelve un Future con su resultado"""
+        futuro = Future()
+        self._encolar((funcion, args, futuro, time.perf_counter(), trazas.actual()))
+        return futuro
+
+    def comandos_pendientes(self):
+        return len(self._buzon)
+
+    def antes_de_comando(self):
+        """Se llama antes de ejecutar cada comando del buzón"""
+
+    def despues_de_comando(self):
+        """Se llama después de cada comando, incluso si falló"""
+
+    def _encolar(self, comando):
+        with self._bloqueo_buzon:
+            self._buzon.append(comando)
+            if self._programado:
+                return
+            self._programado = True
+        self.ejecutor.programar(self._procesar)
+
+    def _procesar(self):
+        for _ in range(MAX_COMANDOS_POR_TURNO):
+            try:
+                funcion, args, futuro, encolado, traza = self._buzon.popleft()
+            except IndexError:
+                break
+            nombre = getattr(funcion, "__name__", "?")
+            inicio = time.perf_counter()
+            metricas.observar("espera_buzon_segundos", nombre, inicio - encolado)
+            if traza is not None:
+                # El comando viene de un mensaje muestreado: lo que se envíe durante él cuelga de su traza
+                traza.flecha("f", inicio)
+                traza.tramo("buzon", encolado, inicio)
+                anterior = trazas.activar(traza)
+            try:
+                self.antes_de_comando()
+                try:
+                    resultado = funcion(*args)
+                finally:
+                    self.despues_de_comando()
+                    metricas.observar("comando_segundos", nombre, time.perf_counter() - inicio)
+                    if traza is not None:
+                        trazas.activar(anterior)
+                        traza.tramo(nombre, inicio)
+            except Exception as e:
+                registro.error("actor", "error ejecutando comando", comando=nombre, error=repr(e))
+                if futuro is not None:
+                    futuro.set_exception(e)
+            else:
+                if futuro is not None:
+                    futuro.set_result(resultado)
+
+        with self._bloqueo_buzon:
+            if not self._buzon:
+                self._programado = False
+                return
+        # Quedan comandos: se vuelve a la cola del pool para no acaparar un hilo
+        self.ejecutor.programar(self._procesar)
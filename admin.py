@@ -0,0 +1,186 @@
+"""Consola de administración: órdenes JSON por un socket que solo escucha en 127.0.0.1.
+
+Usa el mismo protocolo que los clientes (un objeto JSON por línea) y responde una línea por orden.
+Corre en su propio hilo, así que atiende igual con el servidor en modo hilos o asyncio.
+
+    python prueba.py --admin 9200
+    python admin.py 9200 depurar 3              # eventos DEBUG de la sala 3
+    python admin.py 9200 depurar 3 --desactivar
+    python admin.py 9200 bitacora --nivel debug --muestreo mensaje=0.01
+    python admin.py 9200 trazas --fraccion 0.1  # con --trazas
+    python admin.py 9200 perfilar --segundos 30 --archivo /tmp/parques.folded
+"""
+
+import argparse
+import json
+import socket
+import threading
+import time
+
+import bitacora
+import perfilador
+import trazas
+from protocolo import DecodificadorMensajes, ErrorProtocolo, codificar_mensaje, recibir_mensajes
+
+
+def estado_bitacora(registro):
+    return {"tipo": "bitacora", "nivel": bitacora.NOMBRES_NIVEL.get(registro.nivel, registro.nivel),
+            "muestreo": registro.muestreo, "salas_depuracion": sorted(registro.salas_depuracion),
+            "pendientes": registro.cola.qsize()}
+
+
+def orden_depurar(mensaje):
+    """{"tipo": "depurar", "sala": 3, "activar": true}"""
+    registro = bitacora.bitacora_por_defecto()
+    registro.depurar_sala(int(mensaje["sala"]), bool(mensaje.get("activar", True)))
+    return estado_bitacora(registro)
+
+
+def orden_bitacora(mensaje):
+    """{"tipo": "bitacora", "nivel": "debug", "muestreo": {"mensaje": 0.01, "turno": null}}; sin campos solo consulta"""
+    registro = bitacora.bitacora_por_defecto()
+    muestreo = None
+    if mensaje.get("muestreo") is not None:
+        muestreo = dict(registro.muestreo)
+        for categoria, fraccion in mensaje["muestreo"].items():
+            if fraccion is None:
+                muestreo.pop(categoria, None) # Sin muestreo: se escriben todos los eventos de la categoría
+            else:
+                muestreo[categoria] = float(fraccion)
+    registro.configurar(nivel=mensaje.get("nivel"), muestreo=muestreo)
+    return estado_bitacora(registro)
+
+
+def orden_trazas(mensaje):
+    """{"tipo": "trazas", "fraccion": 0.05}: cambia la fracción de mensajes trazados (el servidor necesita --trazas)"""
+    trazador = trazas.trazador_por_defecto()
+    if trazador.destino is None:
+        return {"tipo": "error", "mensaje": "El servidor no se inició con --trazas"}
+    if mensaje.get("fraccion") is not None:
+        trazador.configurar(fraccion=float(mensaje["fraccion"]))
+    return {"tipo": "trazas", "fraccion": trazador.fraccion, "archivo": getattr(trazador.destino, "name", None)}
+
+
+def orden_perfilar(mensaje):
+    """{"tipo": "perfilar", "segundos": 30, "frecuencia": 50, "archivo": "..."}: responde al terminar el perfil"""
+    archivo = mensaje.get("archivo") or perfilador.archivo_por_defecto()
+    frecuencia = int(mensaje.get("frecuencia", perfilador.FRECUENCIA))
+    inicio = time.perf_counter()
+    try:
+        pilas, muestras = perfilador.perfilador_por_defecto().perfilar(float(mensaje.get("segundos", 10)), frecuencia)
+    except perfilador.PerfiladorOcupado as e:
+        return {"tipo": "error", "mensaje": str(e)}
+    duracion = time.perf_counter() - inicio
+    perfilador.escribir_colapsado(pilas, archivo)
+    # Las muestras tomadas, no las pedidas: con hilos ocupados en CPU el GIL puede no dar para la frecuencia
+    return {"tipo": "perfil", "archivo": archivo, "segundos": round(duracion, 3), "frecuencia": frecuencia,
+            "muestras": muestras, "muestras_por_segundo": round(muestras / duracion, 1) if duracion else 0.0,
+            "pilas": len(pilas), "mas_calientes": perfilador.funciones_mas_calientes(pilas)}
+
+
+def orden_detener_perfil(mensaje):
+    """{"tipo": "detener_perfil"}: termina antes el perfil en curso (que escribe lo muestreado hasta ahora)"""
+    perfil = perfilador.perfilador_por_defecto()
+    activo = perfil.activo
+    perfil.detener()
+    return {"tipo": "detener_perfil", "activo": activo}
+
+
+# {tipo de la orden: función(mensaje) -> respuesta}
+COMANDOS = {
+    "depurar": orden_depurar,
+    "bitacora": orden_bitacora,
+    "trazas": orden_trazas,
+    "perfilar": orden_perfilar,
+    "detener_perfil": orden_detener_perfil,
+}
+
+
+def ejecutar(mensaje):
+    if not isinstance(mensaje, dict) or mensaje.get("tipo") not in COMANDOS:
+        return {"tipo": "error", "mensaje": f"Orden desconocida. Órdenes: {', '.join(sorted(COMANDOS))}"}
+    try:
+        return COMANDOS[mensaje["tipo"]](mensaje)
+    except Exception as e:
+        return {"tipo": "error", "mensaje": f"{type(e).__name__}: {e}"}
+
+
+def atender(conn):
+    decodificador = DecodificadorMensajes()
+    with conn:
+        try:
+            while True:
+                mensajes = recibir_mensajes(conn, decodificador)
+                if mensajes is None:
+                    return
+                for mensaje in mensajes:
+                    conn.sendall(codificar_mensaje(ejecutar(mensaje)))
+        except (OSError, ErrorProtocolo):
+            pass
+
+
+def aceptar(servidor):
+    while True:
+        conn, _ = servidor.accept()
+        threading.Thread(target=atender, args=(conn,), daemon=True).start()
+
+
+def iniciar_admin(puerto, host="127.0.0.1"):
+    """Escucha órdenes en un hilo aparte. Devuelve el socket del servidor"""
+    servidor = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    servidor.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    servidor.bind((host, puerto))
+    servidor.listen(8)
+    threading.Thread(target=aceptar, args=(servidor,), name="admin", daemon=True).start()
+    print(f"[+] Administración en {host}:{puerto}")
+    return servidor
+
+
+def enviar_orden(puerto, mensaje, host="127.0.0.1", espera=10.0):
+    """Envía una orden y devuelve la respuesta"""
+    with socket.create_connection((host, puerto), timeout=espera) as conn:
+        conn.sendall(codificar_mensaje(mensaje))
+        decodificador = DecodificadorMensajes()
+        while True:
+            mensajes = recibir_mensajes(conn, decodificador)
+            if mensajes is None:
+                raise ConnectionError("El servidor cerró la conexión sin responder")
+            if mensajes:
+                return mensajes[0]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Envía una orden a la consola de administración del servidor")
+    parser.add_argument("puerto", type=int)
+    parser.add_argument("--host", default="127.0.0.1")
+    ordenes = parser.add_subparsers(dest="orden", required=True)
+    depurar = ordenes.add_parser("depurar", help="Registra (o deja de registrar) los eventos DEBUG de una sala")
+    depurar.add_argument("sala", type=int)
+    depurar.add_argument("--desactivar", action="store_true")
+    orden_bit = ordenes.add_parser("bitacora", help="Consulta o cambia el nivel y el muestreo de la bitácora")
+    orden_bit.add_argument("--nivel", choices=list(bitacora.NIVELES))
+    orden_bit.add_argument("--muestreo", nargs="*", default=None, metavar="CATEGORIA=FRACCION",
+                           help="Fracción de eventos que se escriben por categoría (CATEGORIA= la quita)")
+    orden_tr = ordenes.add_parser("trazas", help="Consulta o cambia la fracción de mensajes trazados")
+    orden_tr.add_argument("--fraccion", type=float)
+    orden_perf = ordenes.add_parser("perfilar", help="Muestrea las pilas de todos los hilos y escribe pilas colapsadas")
+    orden_perf.add_argument("--segundos", type=float, default=10)
+    orden_perf.add_argument("--frecuencia", type=int, default=perfilador.FRECUENCIA, help="Muestras por segundo")
+    orden_perf.add_argument("--archivo", default=None, help="Por defecto, uno nuevo en el directorio temporal del servidor")
+    ordenes.add_parser("detener-perfil", help="Termina antes el perfil en curso")
+    args = parser.parse_args()
+
+    if args.orden == "depurar":
+        mensaje = {"tipo": "depurar", "sala": args.sala, "activar": not args.desactivar}
+    elif args.orden == "trazas":
+        mensaje = {"tipo": "trazas", "fraccion": args.fraccion}
+    elif args.orden == "perfilar":
+        mensaje = {"tipo": "perfilar", "segundos": args.segundos, "frecuencia": args.frecuencia, "archivo": args.archivo}
+    elif args.orden == "detener-perfil":
+        mensaje = {"tipo": "detener_perfil"}
+    else:
+        mensaje = {"tipo": "bitacora", "nivel": args.nivel}
+        if args.muestreo is not None:
+            mensaje["muestreo"] = {c: (float(f) if f else None) for c, _, f in (p.partition("=") for p in args.muestreo)}
+    espera = args.segundos + 30 if args.orden == "perfilar" else 10.0 # El perfil responde al terminar
+    print(json.dumps(enviar_orden(args.puerto, mensaje, args.host, espera), ensure_ascii=False, indent=2))
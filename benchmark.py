@@ -0,0 +1,690 @@
+import argparse
+import collections
+import contextlib
+import json
+import multiprocessing
+import os
+import random
+import selectors
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import bitacora
+import diario
+import metricas
+import perfilador
+import simulador_lotes
+import trazas
+from carga import percentil
+from bots import TablaTransposicion, elegir_ficha, posicion_de
+from protocolo import DecodificadorMensajes, codificar_mensaje, recibir_mensajes
+from sala import GestorSalas, Jugador, Sala, enviar_mensaje
+from simulador import jugar_partida, politica_aleatoria, simular
+from temporizadores import RuedaTemporizadores
+from tablero import CAMINO_GLOBAL, CAMINOS_META, COLORES, LARGO_META, NUM_CASILLAS_GLOBAL
+from transiciones import fichas_movibles
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Mensajes representativos del protocolo de prueba.py
+MENSAJES_MUESTRA = [
+    {"tipo": "movimiento", "color": "red", "ficha_idx": 2, "desde": 3, "hasta": 10},
+    {"tipo": "info", "mensaje": "¡Ana ha comido la ficha 1 de Luis!"},
+    {"tipo": "turno", "mensaje": "Turno de Ana.", "es_tu_turno": False},
+    {"tipo": "dados", "dado1": 3, "dado2": 3, "total": 6, "movible_fichas": [0, 1, 2, 3]},
+]
+
+
+def bench_protocolo(num_mensajes=200000, tamano_lectura=1024):
+    """Mide mensajes/s y bytes copiados por frame al decodificar un flujo troceado como lo entrega TCP"""
+    flujo = b"".join(codificar_mensaje(MENSAJES_MUESTRA[i % len(MENSAJES_MUESTRA)]) for i in range(num_mensajes))
+    lecturas = [flujo[i:i + tamano_lectura] for i in range(0, len(flujo), tamano_lectura)]
+
+    decodificador = DecodificadorMensajes()
+    inicio = time.perf_counter()
+    total = 0
+    for datos in lecturas:
+        total += len(decodificador.alimentar(datos))
+    duracion = time.perf_counter() - inicio
+    assert total == num_mensajes, f"Se esperaban {num_mensajes} mensajes, se decodificaron {total}"
+
+    # Referencia: un json.dumps/json.loads por mensaje sin framing (lo que hacía el código anterior)
+    textos = [json.dumps(MENSAJES_MUESTRA[i % len(MENSAJES_MUESTRA)]).encode() for i in range(num_mensajes)]
+    inicio = time.perf_counter()
+    for texto in textos:
+        json.loads(texto.decode())
+    duracion_ref = time.perf_counter() - inicio
+
+    print(f"[protocolo] lecturas de {tamano_lectura} bytes, {len(flujo) / num_mensajes:.1f} bytes/frame")
+    print(f"  framing:   {num_mensajes / duracion:,.0f} mensajes/s")
+    print(f"  referencia (1 recv = 1 JSON, sin framing): {num_mensajes / duracion_ref:,.0f} mensajes/s")
+    print(f"  bytes copiados por frame: {decodificador.bytes_copiados / num_mensajes:.2f}")
+
+
+class SalidaNula:
+    """Cola de salida que solo cuenta lo encolado, para medir el costo de generar los frames"""
+
+    def __init__(self):
+        self.frames = 0
+        self.bytes = 0
+
+    def encolar(self, frame, traza=None):
+        self.frames += 1
+        self.bytes += len(frame)
+        return True
+
+    def terminar(self):
+        pass
+
+
+def bench_difusion(receptores=(4, 10, 100, 1000), repeticiones=200):
+    """CPU de serialización por difusión: un json.dumps por destinatario frente a uno por mensaje"""
+    mensaje = MENSAJES_MUESTRA[0]
+    print(f"[difusion] {repeticiones} difusiones por tamaño")
+    for n in receptores:
+        sala = Sala(0, max_jugadores=n)
+        sala.jugadores = [Jugador(None, None, f"J{i}", None, SalidaNula()) for i in range(n)]
+
+        inicio = time.process_time()
+        for _ in range(repeticiones):
+            for jugador in sala.jugadores:
+                enviar_mensaje(jugador, mensaje)
+        por_destinatario = (time.process_time() - inicio) / repeticiones
+
+        inicio = time.process_time()
+        for _ in range(repeticiones):
+            sala.enviar_a_todos(mensaje)
+        una_vez = (time.process_time() - inicio) / repeticiones
+
+        print(f"  {n:5d} receptores: codificar por receptor {por_destinatario * 1e6:9.1f} us/difusión, "
+              f"codificar una vez {una_vez * 1e6:8.1f} us/difusión ({por_destinatario / max(una_vez, 1e-9):.1f}x)")
+
+
+def movimientos_por_ramas(color, ficha_estado, ficha_pos, dado_total):
+    """Referencia: la generación de movimientos con ramas que usaba Sala antes de la tabla de transiciones"""
+    movible_fichas = []
+    for i in range(4):
+        if ficha_estado[i] == 1:
+            nueva_pos_idx = ficha_pos[i] + dado_total
+            if nueva_pos_idx >= len(CAMINO_GLOBAL):
+                pasos_en_meta = nueva_pos_idx - len(CAMINO_GLOBAL)
+                if pasos_en_meta < len(CAMINOS_META[color]):
+                    movible_fichas.append(i)
+                elif pasos_en_meta == len(CAMINOS_META[color]) - 1:
+                    movible_fichas.append(i)
+            else:
+                movible_fichas.append(i)
+        elif ficha_estado[i] == 2:
+            nueva_meta_idx = ficha_pos[i] + dado_total
+            if nueva_meta_idx < len(CAMINOS_META[color]):
+                movible_fichas.append(i)
+            elif nueva_meta_idx == len(CAMINOS_META[color]) - 1:
+                movible_fichas.append(i)
+    return movible_fichas
+
+
+def posiciones_aleatorias(n, semilla=1):
+    """n casos (color, ficha_estado, ficha_pos, dado_total) con fichas en cárcel, camino y meta"""
+    rnd = random.Random(semilla)
+    casos = []
+    for _ in range(n):
+        estados = [rnd.choice((0, 1, 1, 1, 2)) for _ in range(4)]
+        posiciones = [-1 if e == 0 else rnd.randrange(NUM_CASILLAS_GLOBAL if e == 1 else LARGO_META) for e in estados]
+        casos.append((rnd.choice(COLORES), estados, posiciones, rnd.randint(1, 6) + rnd.randint(1, 6)))
+    return casos
+
+
+def bench_movimientos(num_posiciones=200000):
+    """Generación de movimientos legales por segundo: ramas frente a tabla de transiciones"""
+    casos = posiciones_aleatorias(num_posiciones)
+    resultados = {}
+    for nombre, generar in (("ramas", movimientos_por_ramas), ("tabla", fichas_movibles)):
+        inicio = time.perf_counter()
+        for caso in casos:
+            generar(*caso)
+        resultados[nombre] = num_posiciones / (time.perf_counter() - inicio)
+    print(f"[movimientos] {num_posiciones} posiciones aleatorias")
+    print(f"  ramas: {resultados['ramas']:,.0f} generaciones/s")
+    print(f"  tabla: {resultados['tabla']:,.0f} generaciones/s ({resultados['tabla'] / resultados['ramas']:.1f}x)")
+
+
+def bench_simulador(num_partidas=2000, jugadores=4):
+    """Partidas simuladas por segundo con las reglas de la sala, en un proceso y con el pool"""
+    nombres = ["aleatoria"] * jugadores
+    print(f"[simulador] {num_partidas} partidas de {jugadores} jugadores con política aleatoria")
+    for procesos in (1, None):
+        inicio = time.perf_counter()
+        estadisticas = simular(num_partidas, nombres, procesos=procesos)
+        duracion = time.perf_counter() - inicio
+        print(f"  {procesos or os.cpu_count()} proceso(s): {num_partidas / duracion:,.0f} partidas/s, "
+              f"{estadisticas.lanzamientos / duracion:,.0f} lanzamientos/s")
+    if simulador_lotes.np is None:
+        print("  lotes: numpy no está instalado")
+        return
+    num_lote = num_partidas * 10
+    inicio = time.perf_counter()
+    lote = simulador_lotes.LotePartidas(num_lote, jugadores).jugar()
+    duracion = time.perf_counter() - inicio
+    print(f"  lotes de {num_lote} (numpy): {num_lote / duracion:,.0f} partidas/s, "
+          f"{int(lote.lanzamientos.sum()) / duracion:,.0f} lanzamientos/s")
+
+
+def decisiones_de_muestra(num_decisiones, jugadores=4, semilla=1):
+    """Decisiones reales (posición, colores, asiento, total, dobles, movibles) con más de una ficha movible"""
+    decisiones = []
+
+    def registrar(partida, jugador, movibles):
+        if len(movibles) > 1:
+            decisiones.append((posicion_de(partida.jugadores), tuple(j.color for j in partida.jugadores),
+                               partida.turno_actual_idx, jugador.ultimo_dado, partida.ultimo_dado_dobles, movibles))
+        return politica_aleatoria(partida, jugador, movibles)
+
+    rng = random.Random(semilla)
+    while len(decisiones) < num_decisiones:
+        jugar_partida([registrar] * jugadores, rng)
+    return decisiones[:num_decisiones]
+
+
+def bench_bots(num_decisiones=300, profundidades=(1, 2, 3)):
+    """Jugadas de bot por segundo en un núcleo, por profundidad de búsqueda, y aciertos de la tabla de transposición"""
+    decisiones = decisiones_de_muestra(num_decisiones)
+    print(f"[bots] {num_decisiones} decisiones tomadas de partidas simuladas")
+    for profundidad in profundidades:
+        tabla = TablaTransposicion()
+        inicio = time.process_time()
+        for decision in decisiones:
+            elegir_ficha(*decision, presupuesto=None, profundidad_maxima=profundidad, tabla=tabla)
+        duracion = time.process_time() - inicio
+        consultas = max(1, tabla.aciertos + tabla.fallos)
+        print(f"  profundidad {profundidad}: {num_decisiones / duracion:,.1f} jugadas/s "
+              f"(tabla: {tabla.aciertos / consultas:.1%} aciertos, {len(tabla.valores):,} entradas)")
+
+
+def jugar_salas(num_salas, comandos_por_sala, directorio=None, durabilidad=diario.DURABILIDAD_NINGUNA,
+                sincronizador=None, semilla=1):
+    """Juega salas de cuatro jugadores en este hilo, comando a comando como lo haría su actor.
+
+    Devuelve (comandos, sucesos anotados en el diario, segundos).
+    """
+    rng = random.Random(semilla)
+    comandos = sucesos = 0
+    duracion = 0.0
+    with open(os.devnull, "w") as nulo, contextlib.redirect_stdout(nulo): # Las salas imprimen cada turno
+        for sala_id in range(1, num_salas + 1):
+            sala = Sala(sala_id, min_jugadores_para_iniciar=4)
+            if directorio is not None:
+                sala.diario = diario.Diario(directorio, sala_id, durabilidad, sincronizador)
+            jugadores = [Jugador(None, None, f"J{i}", None, SalidaNula()) for i in range(4)]
+            inicio = time.perf_counter()
+            for jugador in jugadores:
+                sala.antes_de_comando()
+                sala.registrar_jugador(jugador)
+                sala.despues_de_comando()
+            for _ in range(comandos_por_sala):
+                if not sala.juego_iniciado:
+                    break
+                jugador = sala.jugadores[sala.turno_actual_idx]
+                sala.antes_de_comando()
+                if sala.dados_lanzados:
+                    sala.mover_ficha(jugador, rng.choice(sala.posibles_movimientos(jugador, jugador.ultimo_dado)))
+                else:
+                    sala.lanzar_dados(jugador)
+                sala.despues_de_comando()
+                comandos += 1
+            duracion += time.perf_counter() - inicio
+            if sala.diario is not None:
+                sucesos += sala.diario.sucesos
+                sala.diario.cerrar()
+    return comandos, sucesos, duracion
+
+
+def bench_diario(num_salas=200, comandos_por_sala=300, salas_recuperacion=10000):
+    """Comandos/s con el diario en cada durabilidad y tiempo de recuperar salas_recuperacion partidas en curso"""
+    print(f"[diario] {num_salas} salas de 4 jugadores, hasta {comandos_por_sala} comandos por sala")
+    comandos, _, duracion = jugar_salas(num_salas, comandos_por_sala)
+    base = comandos / duracion
+    print(f"  sin diario:        {base:10,.0f} comandos/s")
+    directorio = tempfile.mkdtemp(prefix="diario-")
+    try:
+        for durabilidad in diario.DURABILIDADES:
+            sincronizador = diario.SincronizadorDiarios() if durabilidad == diario.DURABILIDAD_LOTE else None
+            salas = num_salas if durabilidad != diario.DURABILIDAD_SIEMPRE else max(1, num_salas // 10) # Un fsync por comando
+            comandos, sucesos, duracion = jugar_salas(salas, comandos_por_sala, directorio, durabilidad, sincronizador)
+            if sincronizador is not None:
+                sincronizador.sincronizar()
+            print(f"  durabilidad {durabilidad:8s} {comandos / duracion:10,.0f} comandos/s, "
+                  f"{sucesos / duracion:10,.0f} sucesos/s ({comandos / duracion / base:.0%} de sin diario)")
+            shutil.rmtree(directorio)
+            os.makedirs(directorio)
+
+        # Recuperación: los diarios de num_salas partidas, repetidos hasta tener salas_recuperacion
+        jugar_salas(num_salas, comandos_por_sala, directorio)
+        archivos = sorted(os.listdir(directorio))
+        for sala_id in range(num_salas + 1, salas_recuperacion + 1):
+            origen = (sala_id - 1) % num_salas + 1
+            for extension in (".log", ".snap"):
+                ruta = os.path.join(directorio, f"sala-{origen}{extension}")
+                if os.path.exists(ruta):
+                    shutil.copyfile(ruta, os.path.join(directorio, f"sala-{sala_id}{extension}"))
+        tamano = sum(os.path.getsize(os.path.join(directorio, nombre)) for nombre in os.listdir(directorio))
+        # Gracia larga: las sesiones recuperadas no vencen mientras corren los demás benchmarks, cuando el
+        # directorio del diario ya se borró (cada vencimiento anotaría en un archivo que no existe)
+        gestor = GestorSalas(gracia=24 * 3600)
+        inicio = time.perf_counter()
+        recuperadas = gestor.activar_diario(directorio, durabilidad=diario.DURABILIDAD_NINGUNA)
+        duracion = time.perf_counter() - inicio
+        print(f"  recuperación: {recuperadas:,} partidas en curso de {salas_recuperacion:,} salas "
+              f"({tamano / 1e6:.1f} MB, {len(archivos) / num_salas:.1f} archivos por sala) en {duracion:.2f} s, "
+              f"{duracion / max(1, recuperadas) * 1e6:.0f} us por sala")
+    finally:
+        shutil.rmtree(directorio, ignore_errors=True)
+
+
+def bench_temporizadores(pendientes=100000, disparos=10000, segundos_inactivo=2.0):
+    """Rueda de temporizadores: costo de programar y cancelar, CPU en reposo y puntualidad"""
+    rueda = RuedaTemporizadores()
+    rng = random.Random(1)
+    plazos = [rng.uniform(30, 300) for _ in range(pendientes)] # Plazos de turno y de gracia típicos
+    inicio = time.perf_counter()
+    temporizadores = [rueda.programar(plazo, int) for plazo in plazos]
+    tiempo_programar = time.perf_counter() - inicio
+
+    cpu = time.process_time()
+    time.sleep(segundos_inactivo)
+    cpu_inactivo = (time.process_time() - cpu) / segundos_inactivo
+
+    inicio = time.perf_counter()
+    for temporizador in temporizadores:
+        rueda.cancelar(temporizador)
+    tiempo_cancelar = time.perf_counter() - inicio
+    print(f"[temporizadores] {pendientes} pendientes: programar {tiempo_programar / pendientes * 1e6:.2f} µs, "
+          f"cancelar {tiempo_cancelar / pendientes * 1e6:.2f} µs; CPU en reposo {cpu_inactivo * 100:.2f} %")
+
+    retrasos = []
+    listos = threading.Event()
+    def vencer(esperado):
+        retrasos.append(time.monotonic() - esperado)
+        if len(retrasos) == disparos:
+            listos.set()
+    for _ in range(disparos):
+        plazo = rng.uniform(0.05, 1.0)
+        rueda.programar(plazo, vencer, time.monotonic() + plazo)
+    listos.wait(10)
+    print(f"  {disparos} vencimientos: retraso p50 {percentil(retrasos, 50) * 1000:.1f} ms, "
+          f"p99 {percentil(retrasos, 99) * 1000:.1f} ms, máximo {max(retrasos) * 1000:.1f} ms (resolución {rueda.resolucion * 1000:g} ms)")
+
+    inicio = time.perf_counter()
+    hilos = [threading.Timer(300, int) for _ in range(1000)]
+    for hilo in hilos:
+        hilo.daemon = True
+        hilo.start()
+    for hilo in hilos:
+        hilo.cancel()
+    print(f"  comparación: threading.Timer (un hilo por plazo) {(time.perf_counter() - inicio) / len(hilos) * 1e6:.1f} µs "
+          f"por programar y cancelar")
+
+
+def bench_metricas(eventos=1000000):
+    """Costo de registrar métricas en el camino de cada mensaje: contador, histograma y bloqueo medido"""
+    def medir(funcion, *args):
+        inicio = time.perf_counter()
+        for _ in range(eventos):
+            funcion(*args)
+        return (time.perf_counter() - inicio) / eventos * 1e9
+
+    vacio = medir(lambda *args: None, "x", "y", 1)
+    print(f"[metricas] {eventos} eventos (ns por evento, ya restado el bucle: {vacio:.0f} ns)")
+    print(f"  contar:     {medir(metricas.contar, 'bench_total', 'lanzar_dado', 1) - vacio:6.0f} ns")
+    print(f"  observar:   {medir(metricas.observar, 'bench_segundos', 'lanzar_dado', 0.0003) - vacio:6.0f} ns")
+    print(f"  enviado:    {medir(metricas.contar_enviado, 'turno', 120, 4) - vacio:6.0f} ns (mensajes y bytes de un tipo)")
+    print(f"  referencia: {medir(codificar_mensaje, MENSAJES_MUESTRA[2]) - vacio:6.0f} ns por codificar_mensaje de un turno")
+
+    bloqueo = threading.Lock()
+    medido = metricas.BloqueoMedido("bench")
+    def tomar(b):
+        with b:
+            pass
+    simple = medir(tomar, bloqueo)
+    print(f"  bloqueo:    {simple - vacio:6.0f} ns con threading.Lock, {medir(tomar, medido) - vacio:6.0f} ns con BloqueoMedido")
+
+    inicio = time.perf_counter()
+    texto = metricas.exportar()
+    print(f"  exportar:   {(time.perf_counter() - inicio) * 1000:.2f} ms ({len(texto)} bytes)")
+
+
+def bench_bitacora(eventos=200000):
+    """Costo de un evento en el hilo que lo registra (filtrado, encolado, muestreado) frente a print"""
+    def medir(funcion, *args, **campos):
+        inicio = time.perf_counter()
+        for _ in range(eventos):
+            funcion(*args, **campos)
+        return (time.perf_counter() - inicio) / eventos * 1e9
+
+    with open(os.devnull, "w") as nulo:
+        registro = bitacora.Bitacora(nivel=bitacora.INFO, destino=nulo, muestreo={"mensaje": 0.01})
+        datos = MENSAJES_MUESTRA[0]
+        print(f"[bitacora] {eventos} eventos (ns por evento en el hilo que registra)")
+        print(f"  debug filtrado:   {medir(registro.debug, 'dados', 'dados lanzados', 7, jugador='Ana', dado1=3, dado2=4):6.0f} ns")
+        print(f"  info muestreado:  {medir(registro.info, 'mensaje', 'mensaje recibido', 7, jugador='Ana', datos=datos):6.0f} ns (1 %)")
+        encolado = medir(registro.info, 'turno', 'turno asignado', 7, jugador='Ana', color='red')
+        inicio = time.perf_counter()
+        registro.vaciar(espera=60)
+        escritura = (time.perf_counter() - inicio) / eventos * 1e9
+        print(f"  info encolado:    {encolado:6.0f} ns (+{escritura:.0f} ns por evento esperando al escritor al final)")
+        registro.depurar_sala(7)
+        print(f"  sala depurada:    {medir(registro.debug, 'dados', 'dados lanzados', 7, jugador='Ana', dado1=3, dado2=4):6.0f} ns")
+        registro.vaciar(espera=60)
+
+        def imprimir(nombre, mensaje):
+            print(f"DEBUG SERVIDOR: Mensaje de {nombre}: {mensaje}", file=nulo)
+        with contextlib.redirect_stdout(nulo):
+            directo = medir(imprimir, "Ana", datos)
+        print(f"  print directo:    {directo:6.0f} ns (lo que costaba cada mensaje, a /dev/null; una terminal es más lenta)")
+
+
+class ClienteBench:
+    """Cliente sin interfaz que habla el protocolo de prueba.py"""
+
+    def __init__(self, puerto, nombre, host="127.0.0.1"):
+        self.socket = socket.create_connection((host, puerto))
+        self.socket.settimeout(10)
+        self.decodificador = DecodificadorMensajes()
+        self.pendientes = []
+        self.es_mi_turno = False
+        self.enviar({"tipo": "unirse", "nombre": nombre})
+
+    def enviar(self, mensaje):
+        self.socket.sendall(codificar_mensaje(mensaje))
+
+    def esperar(self, tipos):
+        """Lee hasta recibir un mensaje de alguno de los tipos indicados"""
+        while True:
+            while self.pendientes:
+                mensaje = self.pendientes.pop(0)
+                if mensaje.get("tipo") == "lote":
+                    self.pendientes[:0] = mensaje["mensajes"]
+                    continue
+                if mensaje.get("tipo") == "turno":
+                    self.es_mi_turno = mensaje.get("es_tu_turno", False)
+                if mensaje.get("tipo") in tipos:
+                    return mensaje
+            mensajes = recibir_mensajes(self.socket, self.decodificador)
+            if mensajes is None:
+                raise ConnectionError("El servidor cerró la conexión")
+            self.pendientes.extend(mensajes)
+
+    def cerrar(self):
+        self.socket.close()
+
+
+def jugar_turnos(clientes, num_comandos):
+    """Juega con los clientes dados hasta completar num_comandos y devuelve las latencias (s).
+
+    Si alguien gana antes, el servidor cierra las conexiones y se devuelven las latencias medidas hasta ahí.
+    """
+    latencias = []
+    try:
+        for cliente in clientes:
+            cliente.esperar({"turno"})
+        while len(latencias) < num_comandos:
+            actual = next(c for c in clientes if c.es_mi_turno)
+            inicio = time.perf_counter()
+            actual.enviar({"tipo": "lanzar_dado"})
+            respuesta = actual.esperar({"dados", "turno", "error"})
+            latencias.append(time.perf_counter() - inicio)
+            if respuesta["tipo"] == "dados":
+                inicio = time.perf_counter()
+                actual.enviar({"tipo": "mover_ficha", "ficha_idx": respuesta["movible_fichas"][0]})
+                respuesta = actual.esperar({"turno", "error"})
+                latencias.append(time.perf_counter() - inicio)
+            if respuesta["tipo"] == "turno":
+                # enviar_turno avisa a todos; se espera el aviso del resto para saber de quién es el turno
+                for cliente in clientes:
+                    if cliente is not actual:
+                        cliente.esperar({"turno"})
+    except ConnectionError:
+        pass # Partida terminada
+    return latencias
+
+
+def jugar_partidas(puerto, num_comandos):
+    """Como jugar_turnos, con dos clientes nuevos en otra partida cada vez que una termina"""
+    latencias = []
+    while len(latencias) < num_comandos:
+        clientes = [ClienteBench(puerto, nombre) for nombre in ("Ana", "Luis")]
+        try:
+            nuevas = jugar_turnos(clientes, num_comandos - len(latencias))
+        finally:
+            for c in clientes:
+                c.cerrar()
+        if not nuevas:
+            raise ConnectionError("El servidor cerró la conexión sin jugar ningún turno")
+        latencias += nuevas
+    return latencias
+
+
+def estado_proceso(pid):
+    """Hilos y memoria residente (KB) de un proceso, leídos de /proc"""
+    estado = {}
+    with open(f"/proc/{pid}/status") as f:
+        for linea in f:
+            clave, _, valor = linea.partition(":")
+            if clave in ("Threads", "VmRSS"):
+                estado[clave] = int(valor.split()[0])
+    return estado
+
+
+def iniciar_proceso_servidor(modo, puerto, *opciones):
+    proceso = subprocess.Popen(
+        [sys.executable, os.path.join(DIRECTORIO, "prueba.py"), "--modo", modo, "--puerto", str(puerto), *opciones],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, cwd=DIRECTORIO)
+    for _ in range(100):
+        try:
+            socket.create_connection(("127.0.0.1", puerto)).close()
+            return proceso
+        except OSError:
+            time.sleep(0.05)
+    proceso.kill()
+    raise RuntimeError(f"El servidor en modo {modo} no arrancó")
+
+
+def bench_servidor(conexiones_inactivas=2000, num_comandos=400, puerto=5900):
+    """Compara los modos hilos y asyncio: conexiones sostenidas, hilos, memoria y latencia de turno"""
+    for desplazamiento, modo in enumerate(("hilos", "asyncio")):
+        proceso = iniciar_proceso_servidor(modo, puerto + desplazamiento)
+        try:
+            base = estado_proceso(proceso.pid)
+            inactivas = []
+            for _ in range(conexiones_inactivas):
+                try:
+                    inactivas.append(socket.create_connection(("127.0.0.1", puerto + desplazamiento)))
+                except OSError:
+                    break
+            time.sleep(0.5)
+            cargado = estado_proceso(proceso.pid)
+
+            latencias = jugar_partidas(puerto + desplazamiento, num_comandos)
+            for s in inactivas:
+                s.close()
+        finally:
+            proceso.kill()
+            proceso.wait()
+
+        kb_por_conexion = (cargado["VmRSS"] - base["VmRSS"]) / max(1, len(inactivas))
+        print(f"[servidor:{modo}] conexiones sostenidas: {len(inactivas) + 2}, hilos: {cargado['Threads']}, "
+              f"RSS: {cargado['VmRSS'] / 1024:.1f} MB ({kb_por_conexion:.1f} KB/conexión)")
+        print(f"  latencia de turno: p50 {percentil(latencias, 50) * 1000:.2f} ms, "
+              f"p99 {percentil(latencias, 99) * 1000:.2f} ms ({len(latencias)} comandos)")
+
+
+def bench_trazas(num_comandos=400, puerto=5960, fracciones=(0.0, 0.01, 1.0)):
+    """Sobrecosto de las trazas: latencia de turno con distintas fracciones de mensajes trazados"""
+    trazador = trazas.Trazador(0.0, open(os.devnull, "w"))
+    eventos = 200000
+    inicio = time.perf_counter()
+    for _ in range(eventos):
+        trazador.muestrear(1, "Ana")
+    print(f"[trazas] muestrear sin trazas: {(time.perf_counter() - inicio) / eventos * 1e9:.0f} ns por mensaje")
+    traza = trazas.Traza(trazador, 1, 1, "Ana")
+    inicio = time.perf_counter()
+    for _ in range(eventos):
+        traza.tramo("encolar", inicio, destinatario="Luis", bytes=120)
+    trazador.vaciar(espera=60)
+    print(f"  un tramo: {(time.perf_counter() - inicio) / eventos * 1e9:.0f} ns con la escritura, que compite por el GIL "
+          f"(unos 6 por mensaje trazado)")
+
+    with tempfile.TemporaryDirectory() as directorio:
+        for desplazamiento, fraccion in enumerate(fracciones):
+            archivo = os.path.join(directorio, f"trazas-{fraccion}.json")
+            opciones = ("--trazas", archivo, "--muestreo-trazas", str(fraccion)) if fraccion else ()
+            proceso = iniciar_proceso_servidor("hilos", puerto + desplazamiento, *opciones)
+            try:
+                latencias = jugar_partidas(puerto + desplazamiento, num_comandos)
+            finally:
+                proceso.kill()
+                proceso.wait()
+            tamano = os.path.getsize(archivo) if os.path.exists(archivo) else 0
+            print(f"  fracción {fraccion:g}: latencia de turno p50 {percentil(latencias, 50) * 1000:.3f} ms, "
+                  f"p99 {percentil(latencias, 99) * 1000:.3f} ms ({tamano / 1024:.0f} KB de trazas)")
+
+
+def bench_perfilador(partidas=600, hilos_inactivos=200, frecuencias=(perfilador.FRECUENCIA, 100, 1000)):
+    """Costo del perfilador: tiempo de una muestra y cuánto frena un trabajo de CPU mientras muestrea"""
+    parar = threading.Event()
+    inactivos = [threading.Thread(target=parar.wait, daemon=True) for _ in range(hilos_inactivos)]
+    for hilo in inactivos:
+        hilo.start()
+    perfil = perfilador.Perfilador()
+    pilas = collections.Counter()
+    nombres = {h.ident: perfilador.nombre_hilo(h.name) for h in threading.enumerate()}
+    inicio = time.perf_counter()
+    for _ in range(100):
+        perfil.muestrear(pilas, nombres, None)
+    por_muestra = (time.perf_counter() - inicio) / 100
+    print(f"[perfilador] una muestra con {threading.active_count()} hilos: {por_muestra * 1000:.3f} ms")
+
+    def trabajo():
+        rng = random.Random(1)
+        inicio = time.perf_counter()
+        for _ in range(partidas):
+            jugar_partida([politica_aleatoria] * 4, rng)
+        return time.perf_counter() - inicio
+
+    base = min(trabajo() for _ in range(3))
+    print(f"  {partidas} partidas simuladas sin perfilar: {base:.3f} s")
+    for frecuencia in frecuencias:
+        resultado = []
+        hilo = threading.Thread(target=lambda: resultado.append(perfil.perfilar(600, frecuencia)))
+        inicio = time.perf_counter()
+        hilo.start()
+        try:
+            medido = min(trabajo() for _ in range(3))
+        finally:
+            perfil.detener()
+            hilo.join()
+        # El muestreador necesita el GIL: con un hilo ocupado en CPU no pasa de una muestra por sys.getswitchinterval()
+        logradas = resultado[0][1] / (time.perf_counter() - inicio)
+        print(f"  perfilando a {frecuencia} Hz: {medido:.3f} s ({(medido / base - 1) * 100:+.1f} %), "
+              f"{logradas:.0f} muestras/s logradas")
+    parar.set()
+
+
+def observar_sala(puerto, sala_id, cantidad, listos, fin, resultados):
+    """Proceso aparte que abre las conexiones de espectadores y descarta lo que reciben.
+
+    Corre en otro proceso para no competir por el GIL con los clientes que miden la latencia.
+    """
+    selector = selectors.DefaultSelector()
+    recibido = {}
+    for i in range(cantidad):
+        conn = socket.create_connection(("127.0.0.1", puerto))
+        conn.sendall(codificar_mensaje({"tipo": "observar", "sala": sala_id, "nombre": f"espectador {i}"}))
+        conn.setblocking(False)
+        selector.register(conn, selectors.EVENT_READ)
+        recibido[conn] = 0
+    avisado = False
+    while not fin.is_set():
+        for clave, _ in selector.select(0.05):
+            try:
+                datos = clave.fileobj.recv(65536)
+            except BlockingIOError:
+                continue
+            except OSError:
+                datos = b""
+            if datos:
+                recibido[clave.fileobj] += len(datos)
+            else:
+                selector.unregister(clave.fileobj)
+        if not avisado and all(recibido.values()):
+            avisado = True
+            listos.set() # Todos recibieron su instantánea inicial
+    resultados.put(sorted(recibido.values()))
+    for conn in recibido:
+        conn.close()
+
+
+def bench_espectadores(cantidades=(0, 100, 5000), num_comandos=200, modo="asyncio", puerto=5920):
+    """Latencia de turno de dos jugadores con 0, 100 y 5000 espectadores en su sala"""
+    for desplazamiento, cantidad in enumerate(cantidades):
+        proceso = iniciar_proceso_servidor(modo, puerto + desplazamiento)
+        try:
+            clientes = [ClienteBench(puerto + desplazamiento, nombre) for nombre in ("Ana", "Luis")]
+            sala_id = clientes[0].esperar({"color"})["sala"]
+            listos, fin, resultados = multiprocessing.Event(), multiprocessing.Event(), multiprocessing.Queue()
+            observador = multiprocessing.Process(target=observar_sala,
+                                                 args=(puerto + desplazamiento, sala_id, cantidad, listos, fin, resultados))
+            inicio = time.perf_counter()
+            observador.start()
+            listos.wait(60)
+            tiempo_suscripcion = time.perf_counter() - inicio
+            latencias = jugar_turnos(clientes, num_comandos)
+            time.sleep(0.5) # Que el repartidor termine de entregar los últimos frames
+            fin.set()
+            recibido = resultados.get()
+            observador.join()
+            for c in clientes:
+                c.cerrar()
+        finally:
+            proceso.kill()
+            proceso.wait()
+
+        print(f"[espectadores:{modo}] {cantidad} espectadores: latencia de turno p50 {percentil(latencias, 50) * 1000:.2f} ms, "
+              f"p99 {percentil(latencias, 99) * 1000:.2f} ms ({len(latencias)} comandos)")
+        if cantidad:
+            print(f"  suscritos en {tiempo_suscripcion:.2f} s, KB recibidos por espectador: "
+                  f"mín {recibido[0] / 1024:.1f}, mediana {recibido[len(recibido) // 2] / 1024:.1f}")
+
+
+BENCHMARKS = {
+    "protocolo": bench_protocolo,
+    "difusion": bench_difusion,
+    "movimientos": bench_movimientos,
+    "simulador": bench_simulador,
+    "bots": bench_bots,
+    "diario": bench_diario,
+    "servidor": bench_servidor,
+    "espectadores": bench_espectadores,
+    "temporizadores": bench_temporizadores,
+    "metricas": bench_metricas,
+    "bitacora": bench_bitacora,
+    "trazas": bench_trazas,
+    "perfilador": bench_perfilador,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks del servidor de Parqués")
+    parser.add_argument("nombres", nargs="*", help=f"Benchmarks a ejecutar: {', '.join(BENCHMARKS)} (todos por defecto)")
+    args = parser.parse_args()
+    desconocidos = [n for n in args.nombres if n not in BENCHMARKS]
+    if desconocidos:
+        parser.error(f"Benchmarks desconocidos: {', '.join(desconocidos)}")
+    # Las salas de los benchmarks registran cada partida: solo se muestran avisos y errores
+    bitacora.bitacora_por_defecto().configurar(nivel="aviso")
+    for nombre in args.nombres or BENCHMARKS:
+        BENCHMARKS[nombre]()
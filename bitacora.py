@@ -0,0 +1,172 @@
+"""Bitácora estructurada: eventos con nivel y categoría que un hilo aparte escribe como líneas JSON.
+
+En el camino de un comando, registrar un evento cuesta una comparación de nivel y, si pasa, un put
+en una SimpleQueue. El formateo a JSON y la escritura (que bloquea si la terminal o la tubería van
+lentas) los hace el hilo escritor, en tandas. Los textos de los eventos son fijos y los datos van
+como campos, así que un evento filtrado no formatea nada.
+
+Cada categoría puede tener una fracción de muestreo (p. ej. "mensaje": 0.01 escribe uno de cada
+cien mensajes recibidos) y cada sala puede pasar a nivel DEBUG en caliente con depurar_sala (ver
+admin.py). Los eventos de una sala en depuración no se muestrean.
+
+    {"ts": 1718000000.123, "nivel": "info", "cat": "sala", "msg": "jugador unido", "sala": 3, "jugador": "Ana"}
+"""
+
+import atexit
+import json
+import os
+import queue
+import random
+import sys
+import threading
+import time
+
+DEBUG = 10
+INFO = 20
+AVISO = 30
+ERROR = 40
+NIVELES = {"debug": DEBUG, "info": INFO, "aviso": AVISO, "error": ERROR}
+NOMBRES_NIVEL = {valor: nombre for nombre, valor in NIVELES.items()}
+
+MAX_PENDIENTES = 100000 # Eventos en cola; por encima se descartan en lugar de crecer sin límite
+EVENTOS_POR_ESCRITURA = 1000
+
+
+class Bitacora:
+    def __init__(self, nivel=INFO, destino=None, muestreo=None, max_pendientes=MAX_PENDIENTES):
+        self.nivel = nivel
+        self.destino = destino or sys.stdout
+        self.muestreo = dict(muestreo or {}) # {categoría: fracción de eventos que se escriben}
+        self.salas_depuracion = set() # Ids de las salas que registran también sus eventos DEBUG
+        self.max_pendientes = max_pendientes
+        self.descartados = 0 # Eventos perdidos por cola llena (se informan al escribir la siguiente tanda)
+        self._arrancar()
+        atexit.register(self.vaciar)
+        # Los procesos hijos (--procesos, pool de bots) heredan la bitácora pero no su hilo escritor
+        os.register_at_fork(after_in_child=self._arrancar)
+
+    def _arrancar(self):
+        self.cola = queue.SimpleQueue()
+        self.hilo = threading.Thread(target=self._escribir, name="bitacora", daemon=True)
+        self.hilo.start()
+
+    def registrar(self, nivel, categoria, mensaje, sala=None, **campos):
+        self._registrar(nivel, categoria, mensaje, sala, campos)
+
+    def _registrar(self, nivel, categoria, mensaje, sala, campos):
+        # Los ayudantes (debug, info...) pasan el dict de campos tal cual, sin volver a desempacarlo
+        if sala is None or sala not in self.salas_depuracion:
+            if nivel < self.nivel:
+                return
+            fraccion = self.muestreo.get(categoria)
+            if fraccion is not None and random.random() >= fraccion:
+                return
+        if self.cola.qsize() >= self.max_pendientes:
+            self.descartados += 1
+            return
+        self.cola.put((time.time(), nivel, categoria, mensaje, sala, campos))
+
+    def debug(self, categoria, mensaje, sala=None, **campos):
+        self._registrar(DEBUG, categoria, mensaje, sala, campos)
+
+    def info(self, categoria, mensaje, sala=None, **campos):
+        self._registrar(INFO, categoria, mensaje, sala, campos)
+
+    def aviso(self, categoria, mensaje, sala=None, **campos):
+        self._registrar(AVISO, categoria, mensaje, sala, campos)
+
+    def error(self, categoria, mensaje, sala=None, **campos):
+        self._registrar(ERROR, categoria, mensaje, sala, campos)
+
+    def depura(self, sala):
+        """Si la sala registra sus eventos DEBUG (para evitar armar campos caros cuando no)"""
+        return self.nivel <= DEBUG or sala in self.salas_depuracion
+
+    def depurar_sala(self, sala_id, activar=True):
+        if activar:
+            self.salas_depuracion.add(sala_id)
+        else:
+            self.salas_depuracion.discard(sala_id)
+
+    def configurar(self, nivel=None, muestreo=None, destino=None):
+        if nivel is not None:
+            self.nivel = NIVELES[nivel] if isinstance(nivel, str) else nivel
+        if muestreo is not None:
+            self.muestreo = dict(muestreo)
+        if destino is not None:
+            self.destino = destino
+
+    def vaciar(self, espera=2.0):
+        """Espera a que el hilo escriba lo encolado hasta ahora"""
+        listo = threading.Event()
+        self.cola.put(listo)
+        listo.wait(espera)
+
+    @staticmethod
+    def formatear(evento):
+        ts, nivel, categoria, mensaje, sala, campos = evento
+        linea = {"ts": round(ts, 6), "nivel": NOMBRES_NIVEL.get(nivel, nivel), "cat": categoria, "msg": mensaje}
+        if sala is not None:
+            linea["sala"] = sala
+        linea.update(campos)
+        return json.dumps(linea, ensure_ascii=False, default=str)
+
+    def _escribir(self):
+        while True:
+            tanda = [self.cola.get()]
+            while len(tanda) < EVENTOS_POR_ESCRITURA:
+                try:
+                    tanda.append(self.cola.get_nowait())
+                except queue.Empty:
+                    break
+            lineas = []
+            listos = []
+            for evento in tanda:
+                if isinstance(evento, threading.Event):
+                    listos.append(evento)
+                    continue
+                try:
+                    lineas.append(self.formatear(evento))
+                except Exception as e:
+                    lineas.append(json.dumps({"ts": time.time(), "nivel": "error", "cat": "bitacora",
+                                              "msg": "evento no serializable", "error": str(e)}))
+            if self.descartados:
+                descartados, self.descartados = self.descartados, 0
+                lineas.append(self.formatear((time.time(), AVISO, "bitacora", "eventos descartados por cola llena",
+                                              None, {"cantidad": descartados})))
+            if lineas:
+                try:
+                    self.destino.write("\n".join(lineas) + "\n")
+                    self.destino.flush()
+                except (OSError, ValueError):
+                    pass # Destino cerrado (salida del proceso): no hay dónde avisar
+            for listo in listos:
+                listo.set()
+
+
+def abrir_destino(ruta):
+    """"-" es la salida estándar; cualquier otra ruta se abre para añadir"""
+    if ruta in (None, "-"):
+        return sys.stdout
+    return open(ruta, "a", encoding="utf-8", buffering=1024 * 1024)
+
+
+def leer_muestreo(pares):
+    """["mensaje=0.01", "turno=0.1"] -> {"mensaje": 0.01, "turno": 0.1}"""
+    muestreo = {}
+    for par in pares or ():
+        categoria, _, fraccion = par.partition("=")
+        muestreo[categoria] = float(fraccion)
+    return muestreo
+
+
+_bitacora_por_defecto = None
+_bloqueo_bitacora = threading.Lock()
+
+
+def bitacora_por_defecto():
+    global _bitacora_por_defecto
+    with _bloqueo_bitacora:
+        if _bitacora_por_defecto is None:
+            _bitacora_por_defecto = Bitacora()
+        return _bitacora_por_defecto
@@ -0,0 +1,271 @@
+"""Bots del servidor: eligen ficha con una búsqueda expectimax sobre las tiradas de dados.
+
+La búsqueda trabaja con posiciones inmutables (una tupla por asiento con las cuatro fichas
+(ficha_estado, ficha_pos)), así que se puede enviar a otro proceso. Cada posición viaja con su
+hash Zobrist, actualizado con dos XOR por ficha movida, que es la clave de la tabla de transposición. El bot maximiza su evaluación; cada rival elige la jugada que más le conviene
+con una evaluación estática, y las tiradas se promedian con su probabilidad.
+
+Simplificaciones frente a reglas.Partida: la búsqueda ignora la regla de los tres pares.
+"""
+
+import multiprocessing
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import zobrist
+from tablero import CARCEL, ENTRADAS, LARGO_META, NUM_CASILLAS_GLOBAL, celda_ficha, es_segura
+from transiciones import EN_CAMINO, EN_CARCEL, EN_META, EN_META_FINAL, ILEGAL, SALIDAS, TRANSICIONES
+
+PRESUPUESTO_JUGADA = 0.05 # Segundos por decisión
+PROFUNDIDAD_MAXIMA = 4 # Decisiones (propias o rivales) que se miran hacia adelante
+MAX_ENTRADAS_TABLA = 200000
+VICTORIA = 100.0
+
+
+def _tiradas():
+    """[(total, dobles, probabilidad)] agrupando las 36 tiradas de dos dados"""
+    probabilidades = {}
+    for dado1 in range(1, 7):
+        for dado2 in range(1, 7):
+            clave = (dado1 + dado2, dado1 == dado2)
+            probabilidades[clave] = probabilidades.get(clave, 0) + 1 / 36
+    return [(total, dobles, p) for (total, dobles), p in sorted(probabilidades.items())]
+
+
+TIRADAS = _tiradas()
+
+
+def _compilar_progreso():
+    """PROGRESO[color][estado][pos]: fracción del recorrido hecha por una ficha (0 en la cárcel, 1 en la meta final)"""
+    progreso = {}
+    for color, entrada in ENTRADAS.items():
+        recorrido = NUM_CASILLAS_GLOBAL - entrada + LARGO_META # Casillas desde la salida hasta la meta final
+        progreso[color] = [
+            [0.0],
+            [(pos - entrada + 1) / recorrido if pos >= entrada else 0.0 for pos in range(NUM_CASILLAS_GLOBAL)],
+            # A una casilla de la meta final la ficha queda atascada (el total mínimo es 2): vale como la cárcel
+            [(NUM_CASILLAS_GLOBAL - entrada + pos + 1) / recorrido if pos != LARGO_META - 2 else 0.0
+             for pos in range(LARGO_META)],
+            [1.0] * LARGO_META,
+        ]
+    return progreso
+
+
+PROGRESO = _compilar_progreso()
+
+
+def posicion_de(jugadores):
+    """Posición inmutable de una partida: una tupla por asiento con sus fichas (estado, pos)"""
+    return tuple(tuple(zip(j.ficha_estado, j.ficha_pos)) for j in jugadores)
+
+
+def hash_posicion(posicion, colores):
+    return zobrist.hash_fichas((colores[asiento], i, celda_ficha(colores[asiento], estado, pos))
+                               for asiento, fichas in enumerate(posicion) for i, (estado, pos) in enumerate(fichas))
+
+
+def movimientos(fichas, color, total, dobles):
+    """[(ficha_idx, (estado, pos, celda))] legales, con la misma regla de pares que Partida.posibles_movimientos"""
+    if dobles:
+        carcel = [i for i, (estado, _) in enumerate(fichas) if estado == EN_CARCEL]
+        if carcel:
+            return [(i, SALIDAS[color]) for i in carcel]
+    filas = TRANSICIONES[color][total]
+    legales = []
+    for i, (estado, pos) in enumerate(fichas):
+        destino = filas[estado][pos]
+        if destino is not ILEGAL:
+            legales.append((i, destino))
+    return legales
+
+
+def aplicar(posicion, clave, colores, asiento, ficha_idx, destino):
+    """(posición, hash) tras mover la ficha, con las capturas de Partida.comer_en"""
+    estado, pos, celda = destino
+    color = colores[asiento]
+    fichas = list(posicion[asiento])
+    estado_origen, pos_origen = fichas[ficha_idx]
+    clave ^= zobrist.cambio(color, ficha_idx, celda_ficha(color, estado_origen, pos_origen), celda)
+    fichas[ficha_idx] = (estado, pos)
+    nueva = list(posicion)
+    nueva[asiento] = tuple(fichas)
+    if estado_origen != EN_CARCEL and estado == EN_CAMINO and not es_segura(celda):
+        for otro, fichas_otro in enumerate(posicion):
+            if otro == asiento:
+                continue
+            for i, (estado_otro, pos_otro) in enumerate(fichas_otro):
+                if estado_otro == EN_CAMINO and pos_otro == pos: # Solo la de menor índice de cada rival
+                    comidas = list(fichas_otro)
+                    comidas[i] = (EN_CARCEL, -1)
+                    nueva[otro] = tuple(comidas)
+                    clave ^= zobrist.cambio(colores[otro], i, celda, CARCEL)
+                    break
+    return tuple(nueva), clave
+
+
+def gano(fichas):
+    return all(estado == EN_META_FINAL for estado, _ in fichas)
+
+
+def puntaje(fichas, color):
+    """Evaluación estática de un asiento: progreso de sus fichas, con un extra por estar a salvo"""
+    progreso = PROGRESO[color]
+    total = 0.0
+    for estado, pos in fichas:
+        total += progreso[estado][pos]
+        if estado == EN_META or (estado == EN_CAMINO and es_segura(pos)):
+            total += 0.05
+    return total
+
+
+def evaluar(posicion, colores, asiento):
+    """Ventaja del asiento sobre su mejor rival; ±VICTORIA si la partida terminó"""
+    if gano(posicion[asiento]):
+        return VICTORIA
+    mejor_rival = 0.0
+    for otro, fichas in enumerate(posicion):
+        if otro != asiento:
+            if gano(fichas):
+                return -VICTORIA
+            mejor_rival = max(mejor_rival, puntaje(fichas, colores[otro]))
+    return puntaje(posicion[asiento], colores[asiento]) - mejor_rival
+
+
+class TiempoAgotado(Exception):
+    pass
+
+
+class TablaTransposicion:
+    """Valores ya calculados, por (hash Zobrist, orden de colores, turno, profundidad, asiento); se vacía entera al llenarse.
+
+    La tabla se comparte entre salas y turno y asiento son índices de la mesa: sin el orden de los
+    colores, la misma clave valdría para "azul mueve" en una sala y "verde mueve" en otra.
+    """
+
+    def __init__(self, max_entradas=MAX_ENTRADAS_TABLA):
+        self.max_entradas = max_entradas
+        self.valores = {}
+        self.aciertos = 0
+        self.fallos = 0
+
+    def buscar(self, clave):
+        valor = self.valores.get(clave)
+        if valor is None:
+            self.fallos += 1
+        else:
+            self.aciertos += 1
+        return valor
+
+    def guardar(self, clave, valor):
+        if len(self.valores) >= self.max_entradas:
+            self.valores.clear()
+        self.valores[clave] = valor
+
+
+class Busqueda:
+    """Expectimax desde el punto de vista de un asiento, con límite de tiempo opcional"""
+
+    def __init__(self, colores, asiento, tabla, limite=None):
+        self.colores = colores
+        self.orden = tuple(colores) # Parte de la clave de la tabla (ver TablaTransposicion)
+        self.asiento = asiento
+        self.tabla = tabla
+        self.limite = limite # time.perf_counter() a partir del cual se abandona la búsqueda
+        self.nodos = 0
+
+    def valor_tirada(self, posicion, clave, turno, profundidad):
+        """Valor esperado antes de que `turno` lance los dados"""
+        if profundidad == 0:
+            return evaluar(posicion, self.colores, self.asiento)
+        entrada = (clave, self.orden, turno, profundidad, self.asiento)
+        valor = self.tabla.buscar(entrada)
+        if valor is not None:
+            return valor
+        valor = 0.0
+        for total, dobles, probabilidad in TIRADAS:
+            valor += probabilidad * self.valor_decision(posicion, clave, turno, total, dobles, profundidad)
+        self.tabla.guardar(entrada, valor)
+        return valor
+
+    def valor_decision(self, posicion, clave, turno, total, dobles, profundidad):
+        """Valor cuando `turno` ya sacó (total, dobles) y tiene que elegir ficha"""
+        self.nodos += 1
+        if self.limite is not None and time.perf_counter() > self.limite:
+            raise TiempoAgotado()
+        siguiente = turno if dobles else (turno + 1) % len(posicion)
+        legales = movimientos(posicion[turno], self.colores[turno], total, dobles)
+        if not legales:
+            return self.valor_tirada(posicion, clave, siguiente, profundidad - 1)
+        resultados = [aplicar(posicion, clave, self.colores, turno, i, destino) for i, destino in legales]
+        if turno == self.asiento:
+            return max(self.valor_tras_mover(resultado, turno, siguiente, profundidad) for resultado in resultados)
+        # El rival juega lo que más le conviene según la evaluación estática
+        elegida = max(resultados, key=lambda resultado: evaluar(resultado[0], self.colores, turno))
+        return self.valor_tras_mover(elegida, turno, siguiente, profundidad)
+
+    def valor_tras_mover(self, resultado, turno, siguiente, profundidad):
+        posicion, clave = resultado
+        if gano(posicion[turno]):
+            return evaluar(posicion, self.colores, self.asiento)
+        return self.valor_tirada(posicion, clave, siguiente, profundidad - 1)
+
+
+_tabla = TablaTransposicion() # Una por proceso: se reutiliza entre las decisiones que atiende
+
+
+def elegir_ficha(posicion, colores, asiento, total, dobles, movibles,
+                 presupuesto=PRESUPUESTO_JUGADA, profundidad_maxima=PROFUNDIDAD_MAXIMA, tabla=None):
+    """Ficha de `movibles` con mayor valor esperado.
+
+    Profundiza de a una decisión mientras quede presupuesto (segundos; None = sin límite) y
+    devuelve la mejor ficha de la última profundidad completada.
+    """
+    if len(movibles) == 1:
+        return movibles[0]
+    tabla = tabla if tabla is not None else _tabla
+    limite = time.perf_counter() + presupuesto if presupuesto is not None else None
+    busqueda = Busqueda(colores, asiento, tabla, limite)
+    destinos = dict(movimientos(posicion[asiento], colores[asiento], total, dobles))
+    clave = hash_posicion(posicion, colores)
+    siguiente = asiento if dobles else (asiento + 1) % len(posicion)
+    mejor = movibles[0]
+    for profundidad in range(1, profundidad_maxima + 1):
+        try:
+            valores = {i: busqueda.valor_tras_mover(aplicar(posicion, clave, colores, asiento, i, destinos[i]), asiento, siguiente, profundidad)
+                       for i in movibles if i in destinos}
+        except TiempoAgotado:
+            break
+        if valores:
+            mejor = max(valores, key=valores.get)
+    return mejor
+
+
+class PensadorBots:
+    """Pool de procesos donde piensan los bots: la búsqueda es CPU pura y no debe frenar la E/S ni las salas"""
+
+    def __init__(self, procesos=None, presupuesto=PRESUPUESTO_JUGADA, profundidad_maxima=PROFUNDIDAD_MAXIMA):
+        self.presupuesto = presupuesto
+        self.profundidad_maxima = profundidad_maxima
+        # spawn: los procesos no heredan los hilos ni los sockets del servidor
+        self.pool = ProcessPoolExecutor(procesos, mp_context=multiprocessing.get_context("spawn"))
+
+    def pensar(self, posicion, colores, asiento, total, dobles, movibles):
+        """Devuelve un Future con la ficha elegida"""
+        return self.pool.submit(elegir_ficha, posicion, colores, asiento, total, dobles, movibles,
+                                self.presupuesto, self.profundidad_maxima)
+
+    def detener(self):
+        self.pool.shutdown(wait=False, cancel_futures=True)
+
+
+_pensador_por_defecto = None
+_bloqueo_pensador = threading.Lock()
+
+
+def pensador_por_defecto():
+    global _pensador_por_defecto
+    with _bloqueo_pensador:
+        if _pensador_por_defecto is None:
+            _pensador_por_defecto = PensadorBots()
+        return _pensador_por_defecto
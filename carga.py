@@ -0,0 +1,293 @@
+"""Generador de carga: miles de clientes sin interfaz que juegan partidas completas contra prueba.py.
+
+Cada cliente habla el protocolo del servidor (unirse con nombre, lanzar_dado en su turno y
+mover_ficha con una de las movible_fichas) y mide cuánto tarda la respuesta a cada mensaje.
+Cuando su partida termina vuelve a entrar como jugador nuevo hasta que se acaba la duración.
+Todos los clientes de un proceso comparten un event loop; --procesos reparte los clientes
+entre varios procesos y junta sus resultados al final.
+
+Escenarios:
+  --rafaga N      conexiones nuevas por segundo al arrancar (0 = todas a la vez)
+  --abandono P    probabilidad de que un cliente corte la conexión al recibir su turno y
+                  entre otro en su lugar (rotación); su asiento queda en gracia en el servidor
+  --lentos F      fracción de clientes que esperan --retraso-lectura segundos entre lecturas
+
+Ejemplo: python carga.py --clientes 2000 --rafaga 500 --duracion 60 --abandono 0.01 --lentos 0.05
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import random
+import time
+
+from protocolo import TAMANO_LECTURA, DecodificadorMensajes, ErrorProtocolo, codificar_mensaje
+
+ESPERA_RESPUESTA = 10 # Segundos sin respuesta a un mensaje antes de contarlo como error
+ESPERA_CONEXION = 10
+INTERVALO_PROGRESO = 5
+
+# Mensajes del servidor que responden a cada mensaje del cliente (todos los de un comando llegan en el mismo lote)
+RESPUESTAS = {
+    "unirse": {"color", "error"},
+    "lanzar_dado": {"dados", "turno", "info", "error"},
+    "mover_ficha": {"movimiento", "turno", "info", "error"},
+}
+
+
+def percentil(valores, p):
+    """Percentil p (0-100) por el método del rango más cercano"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    indice = max(0, min(len(ordenados) - 1, int(round(p / 100 * len(ordenados))) - 1))
+    return ordenados[indice]
+
+
+def aplanar(mensajes):
+    for mensaje in mensajes:
+        if isinstance(mensaje, dict) and mensaje.get("tipo") == "lote":
+            yield from aplanar(mensaje.get("mensajes", []))
+        elif isinstance(mensaje, dict):
+            yield mensaje
+
+
+class Estadisticas:
+    def __init__(self):
+        self.latencias = {tipo: [] for tipo in RESPUESTAS} # {mensaje del cliente: [segundos]}
+        self.conexiones = 0 # Conexiones que completaron la conexión TCP
+        self.activas = 0
+        self.max_activas = 0
+        self.turnos = 0 # Lanzamientos respondidos
+        self.movimientos = 0
+        self.partidas = 0 # Partidas que terminaron con ganador
+        self.abandonos = 0
+        self.errores = {} # {motivo: cantidad}
+
+    def error(self, motivo):
+        self.errores[motivo] = self.errores.get(motivo, 0) + 1
+
+    def a_dict(self):
+        return dict(vars(self))
+
+    @staticmethod
+    def combinar(resultados):
+        total = Estadisticas()
+        for resultado in resultados:
+            for tipo, valores in resultado["latencias"].items():
+                total.latencias[tipo].extend(valores)
+            for campo in ("conexiones", "max_activas", "turnos", "movimientos", "partidas", "abandonos"):
+                setattr(total, campo, getattr(total, campo) + resultado[campo])
+            for motivo, cantidad in resultado["errores"].items():
+                total.errores[motivo] = total.errores.get(motivo, 0) + cantidad
+        return total
+
+
+class ClienteCarga:
+    def __init__(self, numero, opciones, estadisticas, rng):
+        self.numero = numero
+        self.opciones = opciones
+        self.estadisticas = estadisticas
+        self.rng = rng
+        self.lento = rng.random() < opciones.lentos
+        self.pendiente = None # (mensaje enviado, instante) que espera respuesta
+        self.partida_terminada = False
+        self.abandonar = False
+
+    async def jugar(self, fin):
+        while time.monotonic() < fin:
+            if not await self.sesion(fin):
+                await asyncio.sleep(1) # No se pudo conectar: se reintenta sin martillar al servidor
+
+    async def sesion(self, fin):
+        """Una conexión: desde unirse hasta que termina la partida, el cliente abandona o se acaba el tiempo"""
+        estadisticas = self.estadisticas
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(self.opciones.host, self.opciones.puerto), ESPERA_CONEXION)
+        except (OSError, asyncio.TimeoutError) as e:
+            estadisticas.error(f"conexión: {type(e).__name__}")
+            return False
+        estadisticas.conexiones += 1
+        estadisticas.activas += 1
+        estadisticas.max_activas = max(estadisticas.max_activas, estadisticas.activas)
+        self.partida_terminada = self.abandonar = False
+        self.pendiente = None
+        decodificador = DecodificadorMensajes()
+        try:
+            self.enviar(writer, {"tipo": "unirse", "nombre": f"carga-{self.numero}"})
+            while not self.abandonar:
+                restante = fin - time.monotonic()
+                if restante <= 0:
+                    writer.write(codificar_mensaje({"tipo": "desconectar"}))
+                    break
+                espera = min(restante, ESPERA_RESPUESTA) if self.pendiente else restante
+                try:
+                    datos = await asyncio.wait_for(reader.read(TAMANO_LECTURA), espera)
+                except asyncio.TimeoutError:
+                    if self.pendiente and time.perf_counter() - self.pendiente[1] >= ESPERA_RESPUESTA:
+                        estadisticas.error(f"sin respuesta a {self.pendiente[0]}")
+                        break
+                    continue
+                if not datos:
+                    if self.partida_terminada:
+                        estadisticas.partidas += 1
+                    elif time.monotonic() < fin: # Al final los demás se van y la sala puede cerrarse
+                        estadisticas.error("el servidor cerró la conexión")
+                    break
+                if self.lento:
+                    await asyncio.sleep(self.opciones.retraso_lectura)
+                for mensaje in aplanar(decodificador.alimentar(datos)):
+                    self.procesar(writer, mensaje)
+            if self.abandonar:
+                estadisticas.abandonos += 1
+                writer.transport.abort() # Corte brusco, como un cliente que se cuelga
+        except ErrorProtocolo as e:
+            estadisticas.error(f"protocolo: {e}")
+        except ConnectionError as e:
+            estadisticas.error(f"conexión perdida: {type(e).__name__}")
+        finally:
+            estadisticas.activas -= 1
+            writer.close()
+        return True
+
+    def enviar(self, writer, mensaje):
+        self.pendiente = (mensaje["tipo"], time.perf_counter())
+        writer.write(codificar_mensaje(mensaje))
+
+    def procesar(self, writer, mensaje):
+        tipo = mensaje.get("tipo")
+        if self.pendiente is not None and tipo in RESPUESTAS[self.pendiente[0]]:
+            enviado, instante = self.pendiente
+            self.pendiente = None
+            self.estadisticas.latencias[enviado].append(time.perf_counter() - instante)
+            if enviado == "lanzar_dado":
+                self.estadisticas.turnos += 1
+            elif enviado == "mover_ficha":
+                self.estadisticas.movimientos += 1
+
+        if tipo == "turno" and mensaje.get("es_tu_turno"):
+            if self.rng.random() < self.opciones.abandono:
+                self.abandonar = True
+                return
+            self.enviar(writer, {"tipo": "lanzar_dado"})
+        elif tipo == "dados":
+            self.enviar(writer, {"tipo": "mover_ficha", "ficha_idx": self.rng.choice(mensaje["movible_fichas"])})
+        elif tipo == "error":
+            self.estadisticas.error(f"servidor: {mensaje.get('mensaje', '')}")
+            if mensaje.get("movible_fichas_reintentar"):
+                self.enviar(writer, {"tipo": "mover_ficha", "ficha_idx": self.rng.choice(mensaje["movible_fichas_reintentar"])})
+        elif tipo == "info" and "ha ganado la partida" in mensaje.get("mensaje", ""):
+            self.partida_terminada = True
+
+
+async def progreso(estadisticas, inicio, fin):
+    anteriores = 0
+    while time.monotonic() < fin:
+        await asyncio.sleep(INTERVALO_PROGRESO)
+        turnos = estadisticas.turnos
+        print(f"[{time.monotonic() - inicio:6.1f} s] conexiones activas {estadisticas.activas}, "
+              f"turnos/s {(turnos - anteriores) / INTERVALO_PROGRESO:.0f}, partidas {estadisticas.partidas}, "
+              f"errores {sum(estadisticas.errores.values())}", flush=True)
+        anteriores = turnos
+
+
+async def generar(opciones, primero, cantidad, mostrar_progreso):
+    estadisticas = Estadisticas()
+    rng = random.Random(opciones.semilla * 1000003 + primero)
+    inicio = time.monotonic()
+    fin = inicio + opciones.duracion
+    tareas = []
+    if mostrar_progreso:
+        tareas.append(asyncio.create_task(progreso(estadisticas, inicio, fin)))
+    for i in range(cantidad):
+        if opciones.rafaga > 0:
+            # Ráfaga: las conexiones se escalonan a opciones.rafaga por segundo entre todos los procesos
+            espera = inicio + (primero + i) / opciones.rafaga - time.monotonic()
+            if espera > 0:
+                await asyncio.sleep(espera)
+        cliente = ClienteCarga(primero + i, opciones, estadisticas, random.Random(rng.random()))
+        tareas.append(asyncio.create_task(cliente.jugar(fin)))
+    await asyncio.gather(*tareas)
+    return estadisticas
+
+
+def ejecutar_proceso(opciones, primero, cantidad, mostrar_progreso, resultados=None):
+    estadisticas = asyncio.run(generar(opciones, primero, cantidad, mostrar_progreso))
+    if resultados is None:
+        return estadisticas.a_dict()
+    resultados.put(estadisticas.a_dict())
+
+
+def informe(estadisticas, duracion):
+    print(f"\n=== Carga: {duracion:g} s ===")
+    print(f"Conexiones: {estadisticas.conexiones} (máximo simultáneas {estadisticas.max_activas}), "
+          f"abandonos {estadisticas.abandonos}, partidas terminadas {estadisticas.partidas}")
+    print(f"Turnos/s: {estadisticas.turnos / duracion:.1f}, movimientos/s: {estadisticas.movimientos / duracion:.1f}")
+    print(f"{'mensaje':<12} {'n':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'máx ms':>8}")
+    for tipo, valores in estadisticas.latencias.items():
+        if valores:
+            print(f"{tipo:<12} {len(valores):>8} {percentil(valores, 50) * 1000:>8.2f} {percentil(valores, 95) * 1000:>8.2f} "
+                  f"{percentil(valores, 99) * 1000:>8.2f} {max(valores) * 1000:>8.2f}")
+    total_errores = sum(estadisticas.errores.values())
+    print(f"Errores: {total_errores}")
+    for motivo, cantidad in sorted(estadisticas.errores.items(), key=lambda e: -e[1]):
+        print(f"  {cantidad:>6}  {motivo}")
+
+
+def resumen(estadisticas, duracion):
+    """Resultados en forma de dict para --json"""
+    return {
+        "duracion": duracion,
+        "conexiones": estadisticas.conexiones,
+        "max_activas": estadisticas.max_activas,
+        "abandonos": estadisticas.abandonos,
+        "partidas": estadisticas.partidas,
+        "turnos_por_segundo": estadisticas.turnos / duracion,
+        "latencias_ms": {tipo: {"n": len(valores), "p50": percentil(valores, 50) * 1000,
+                                "p95": percentil(valores, 95) * 1000, "p99": percentil(valores, 99) * 1000}
+                         for tipo, valores in estadisticas.latencias.items() if valores},
+        "errores": estadisticas.errores,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generador de carga para el servidor de Parqués")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--puerto", type=int, default=5000)
+    parser.add_argument("--clientes", type=int, default=100, help="Clientes simultáneos")
+    parser.add_argument("--duracion", type=float, default=30, help="Segundos de carga")
+    parser.add_argument("--rafaga", type=float, default=0, metavar="CONEXIONES_POR_SEGUNDO",
+                        help="Ritmo de conexión inicial (0 = todos a la vez)")
+    parser.add_argument("--abandono", type=float, default=0, metavar="PROBABILIDAD",
+                        help="Probabilidad por turno de cortar la conexión y entrar de nuevo")
+    parser.add_argument("--lentos", type=float, default=0, metavar="FRACCION",
+                        help="Fracción de clientes que leen lento")
+    parser.add_argument("--retraso-lectura", type=float, default=0.5, metavar="SEGUNDOS",
+                        help="Pausa de los clientes lentos entre lecturas")
+    parser.add_argument("--procesos", type=int, default=1, help="Procesos entre los que se reparten los clientes")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--json", default=None, metavar="ARCHIVO", help="Guarda el resumen en este archivo")
+    opciones = parser.parse_args()
+
+    if opciones.procesos <= 1:
+        resultados = [ejecutar_proceso(opciones, 0, opciones.clientes, True)]
+    else:
+        cola = multiprocessing.Queue()
+        por_proceso = [opciones.clientes // opciones.procesos + (n < opciones.clientes % opciones.procesos)
+                       for n in range(opciones.procesos)]
+        procesos = [multiprocessing.Process(target=ejecutar_proceso,
+                                            args=(opciones, sum(por_proceso[:n]), por_proceso[n], n == 0, cola))
+                    for n in range(opciones.procesos)]
+        for p in procesos:
+            p.start()
+        resultados = [cola.get() for _ in procesos]
+        for p in procesos:
+            p.join()
+
+    estadisticas = Estadisticas.combinar(resultados)
+    informe(estadisticas, opciones.duracion)
+    if opciones.json:
+        with open(opciones.json, "w") as f:
+            json.dump(resumen(estadisticas, opciones.duracion), f, indent=2, ensure_ascii=False)
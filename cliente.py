@@ -1,52 +1,33 @@
 import socket
 import threading
-import json
 import tkinter as tk
 from tkinter import messagebox, simpledialog, ttk
 import time
 import math
 
+import zobrist
+from protocolo import DecodificadorMensajes, codificar_mensaje, recibir_mensajes
+from tablero import CAMINO_GLOBAL, CAMINOS_META, CARCEL, CARCELES_COORDS, COORDENADAS, es_segura
+
+
+def fin_de_sesion(data):
+    """Si el mensaje (o alguno del lote) dice que el servidor cerró la sesión: no hay asiento al que volver"""
+    if data.get("tipo") == "lote":
+        return any(fin_de_sesion(m) for m in data.get("mensajes", []))
+    return data.get("tipo") == "sesion_vencida" or bool(data.get("fin"))
+
+
 class ClienteParques:
     def __init__(self):
-        # Definir coordenadas del tablero (igual que el servidor)
-        self.CAMINO_GLOBAL = [
-            (7,0),(7,1),(7,2),(7,3),(7,4),(7,5),(7,6),
-            (6,6),(5,6),(4,6),(3,6),(2,6),(1,6),(0,6),
-            (0,7),(0,8),(0,9),(0,10),(0,11),
-            (1,11),(2,11),(3,11),(4,11),(5,11),(6,11),
-            (7,11),(7,12),(7,13),(7,14),(7,15),(7,16),(7,17),
-            (8,17),(9,17),(10,17),(11,17),
-            (11,16),(11,15),(11,14),(11,13),(11,12),(11,11),
-            (11,10),(12,10),(13,10),(14,10),(15,10),(16,10),(17,10),
-            (17,9),(17,8),(17,7),(17,6),
-            (16,6),(15,6),(14,6),(13,6),(12,6),(11,6),
-            (10,6),(10,5),(10,4),(10,3),(10,2),(10,1),(10,0),
-            (9,0),(8,0),(7,0)
-        ]
-        
-        self.CAMINOS_META = {
-            "red": [(8,1), (8,2), (8,3), (8,4), (8,5), (8,6), (8,7), (8,8)],
-            "blue": [(1,8), (2,8), (3,8), (4,8), (5,8), (6,8), (7,8), (8,8)],
-            "green": [(9,16), (9,15), (9,14), (9,13), (9,12), (9,11), (9,10), (8,8)],
-            "yellow": [(16,9), (15,9), (14,9), (13,9), (12,9), (11,9), (10,9), (8,8)]
-        }
-        
-        self.CARCELES_COORDS = {
-            "red": [(1, 1), (1, 2), (2, 1), (2, 2)],
-            "blue": [(1, 15), (1, 16), (2, 15), (2, 16)],
-            "green": [(15, 1), (15, 2), (16, 1), (16, 2)],
-            "yellow": [(15, 15), (15, 16), (16, 15), (16, 16)]
-        }
-        
-        self.CASILLAS_SEGURAS = [
-            (7,0), (0,6), (0,11), (7,11), (7,17), (11,17), (11,10), (17,10),
-            (17,6), (11,6), (10,0), (4,6), (7,13), (11,4), (13,10)
-        ]
         self.socket = None
         self.conectado = False
         self.nombre = ""
         self.color = ""
+        self.sala = None
         self.tiempo_ajuste = 0
+        self.servidor = None  # (host, puerto) al que se vuelve si se corta la conexión
+        self.token = None  # Sesión que entrega el servidor para recuperar el asiento
+        self.gracia = None  # Segundos que el servidor guarda el asiento
         
         # Estado del juego
         self.es_mi_turno = False
@@ -56,7 +37,11 @@ class ClienteParques:
         self.puede_relanzar = False
         
         # Estado de las fichas en el tablero
-        self.fichas_tablero = {}  # {color: {ficha_idx: (x, y)}}
+        self.fichas_tablero = {}  # {color: {ficha_idx: id de casilla o CARCEL}}
+        self.en_lote = False  # True mientras se aplica un mensaje "lote"
+        self.seq_estado = None  # Última versión del estado que refleja el tablero
+        self.resync_pendiente = False
+        self.redibujo_pendiente = False
 
 
         # Configurar interfaz
@@ -93,6 +78,10 @@ class ClienteParques:
                                    bg="#3498db", fg="white", font=("Arial", 10, "bold"))
         self.connect_btn.pack(side=tk.LEFT, padx=10)
         
+        self.observe_btn = tk.Button(conn_frame, text="Observar", command=self.observar,
+                                   bg="#8e44ad", fg="white", font=("Arial", 10, "bold"))
+        self.observe_btn.pack(side=tk.LEFT, padx=5)
+
         self.disconnect_btn = tk.Button(conn_frame, text="Desconectar", command=self.desconectar, 
                                       bg="#e74c3c", fg="white", font=("Arial", 10, "bold"), state=tk.DISABLED)
         self.disconnect_btn.pack(side=tk.LEFT, padx=5)
@@ -180,22 +169,37 @@ class ClienteParques:
         """Conecta al servidor"""
         if self.conectado:
             return
-            
+
+        # Pedir nombre del jugador
+        self.nombre = simpledialog.askstring("Nombre", "Ingresa tu nombre:")
+        if not self.nombre:
+            return
+        self.abrir_conexion({"tipo": "unirse", "nombre": self.nombre})
+
+    def observar(self):
+        """Sigue una sala como espectador: recibe el tablero y los turnos, sin asiento ni botones de juego"""
+        if self.conectado:
+            return
+
+        sala = simpledialog.askinteger("Observar", "Número de sala:", minvalue=1)
+        if sala is None:
+            return
+        self.nombre = "espectador"
+        self.abrir_conexion({"tipo": "observar", "sala": sala, "nombre": self.nombre})
+
+    def abrir_conexion(self, primer_mensaje):
         try:
             host = self.host_entry.get().strip()
             port = int(self.port_entry.get().strip())
-            
-            # Pedir nombre del jugador
-            self.nombre = simpledialog.askstring("Nombre", "Ingresa tu nombre:")
-            if not self.nombre:
-                return
-            
+
             # Crear socket y conectar
+            self.servidor = (host, port)
+            self.token = None
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.connect((host, port))
-            
-            # Enviar nombre
-            self.socket.send(self.nombre.encode())
+
+            # Primer frame del protocolo: nombre del jugador o sala a observar
+            self.socket.sendall(codificar_mensaje(primer_mensaje))
             
             # Iniciar hilo de escucha
             self.conectado = True
@@ -204,6 +208,7 @@ class ClienteParques:
             
             # Actualizar interfaz
             self.connect_btn.config(state=tk.DISABLED)
+            self.observe_btn.config(state=tk.DISABLED)
             self.disconnect_btn.config(state=tk.NORMAL)
             self.status_label.config(text="Conectando...", fg="#f39c12")
             
@@ -231,6 +236,7 @@ class ClienteParques:
         
         # Actualizar interfaz
         self.connect_btn.config(state=tk.NORMAL)
+        self.observe_btn.config(state=tk.NORMAL)
         self.disconnect_btn.config(state=tk.DISABLED)
         self.launch_btn.config(state=tk.DISABLED)
         for btn in self.pieces_buttons:
@@ -250,44 +256,99 @@ class ClienteParques:
             return False
             
         try:
-            mensaje_str = json.dumps(mensaje_dict)
-            self.socket.send(mensaje_str.encode())
+            self.socket.sendall(codificar_mensaje(mensaje_dict))
             return True
         except Exception as e:
             print(f"Error enviando mensaje: {e}")
             return False
     
     def escuchar_servidor(self):
-        """Escucha mensajes del servidor"""
+        """Escucha mensajes del servidor; si la conexión se corta intenta volver al asiento"""
         while self.conectado:
-            try:
-                mensaje_raw = self.socket.recv(1024).decode()
-                if not mensaje_raw:
+            decodificador = DecodificadorMensajes()
+            while self.conectado:
+                try:
+                    mensajes = recibir_mensajes(self.socket, decodificador)
+                    if mensajes is None:
+                        break
+
+                    for data in mensajes:
+                        if fin_de_sesion(data):
+                            # Aquí y no en procesar_mensaje: el cierre que sigue no debe disparar la reconexión
+                            self.token = None
+                        self.root.after(0, self.procesar_mensaje, data)
+
+                except Exception as e:
+                    if self.conectado:
+                        print(f"Error escuchando servidor: {e}")
                     break
-                
-                data = json.loads(mensaje_raw)
-                self.root.after(0, self.procesar_mensaje, data)
-                
-            except Exception as e:
-                if self.conectado:
-                    print(f"Error escuchando servidor: {e}")
+            if not self.conectado or not self.reconectar():
                 break
-        
+
         # Si sale del bucle, desconectar
         if self.conectado:
             self.root.after(0, self.desconectar)
+
+    def reconectar(self):
+        """Reintenta mientras el servidor guarda el asiento. Al volver solo recibe los cambios desde seq_estado"""
+        if not self.token:
+            return False
+        self.root.after(0, lambda: self.status_label.config(text="Reconectando...", fg="#f39c12"))
+        try:
+            self.socket.close()
+        except OSError:
+            pass
+        limite = time.time() + (self.gracia or 0)
+        espera = 0.5
+        while self.conectado and time.time() < limite:
+            try:
+                nuevo = socket.create_connection(self.servidor, timeout=5)
+                nuevo.settimeout(None)
+                nuevo.sendall(codificar_mensaje({"tipo": "unirse", "nombre": self.nombre,
+                                                 "token": self.token, "seq": self.seq_estado}))
+                self.socket = nuevo
+                return True
+            except OSError as e:
+                print(f"Reintentando conexión: {e}")
+                time.sleep(espera)
+                espera = min(espera * 2, 5)
+        return False
     
     def procesar_mensaje(self, data):
         """Procesa mensajes recibidos del servidor"""
         tipo = data.get("tipo")
         
-        if tipo == "color":
+        if tipo == "lote":
+            # Eventos de un mismo comando del servidor: se aplican todos y se redibuja una sola vez
+            self.en_lote = True
+            try:
+                for mensaje in data.get("mensajes", []):
+                    self.procesar_mensaje(mensaje)
+            finally:
+                self.en_lote = False
+            if self.redibujo_pendiente:
+                self.dibujar_tablero()
+            
+        elif tipo == "color":
             self.color = data.get("color")
-            mensaje = data.get("mensaje", "")
+            self.sala = data.get("sala")
+            self.token = data.get("token", self.token)
+            self.gracia = data.get("gracia", self.gracia)
+            mensaje = data.get("mensaje", "Reconectado a la partida." if data.get("reconectado") else "")
             self.status_label.config(text=f"Conectado - {self.color}", fg="#27ae60")
-            self.player_info.config(text=f"Jugador: {self.nombre}\nColor: {self.color}")
+            self.player_info.config(text=f"Jugador: {self.nombre}\nColor: {self.color}\nSala: {self.sala}")
             self.agregar_mensaje(mensaje)
             
+        elif tipo == "observando":
+            self.sala = data.get("sala")
+            jugadores = ", ".join(f"{j['nombre']} ({j['color']})" for j in data.get("jugadores", []))
+            self.status_label.config(text=f"Observando la sala {self.sala}", fg="#8e44ad")
+            self.player_info.config(text=f"Espectador\nSala: {self.sala}")
+            self.agregar_mensaje(f"Observando la sala {self.sala}: {jugadores}")
+
+        elif tipo == "sesion_vencida":
+            self.agregar_mensaje(data.get("mensaje", "Tu asiento ya no existe."))
+
         elif tipo == "error":
             mensaje = data.get("mensaje", "Error desconocido")
             messagebox.showerror("Error", mensaje)
@@ -316,8 +377,8 @@ class ClienteParques:
             for j in jugadores:
                 self.fichas_tablero[j['color']] = {}
                 for i in range(4):
-                    self.fichas_tablero[j['color']][i] = "carcel"
-            self.dibujar_tablero()
+                    self.fichas_tablero[j['color']][i] = CARCEL
+            self.solicitar_redibujo()
             
         elif tipo == "turno":
             mensaje = data.get("mensaje", "")
@@ -325,6 +386,9 @@ class ClienteParques:
             self.puede_lanzar = data.get("puede_lanzar", False)
             
             self.agregar_mensaje(mensaje)
+            self.verificar_hash(data.get("hash"))
+            if self.es_mi_turno and data.get("limite"):
+                self.agregar_mensaje(f"Tienes {data['limite']:g} s para lanzar y otros tantos para mover.")
             
             if self.es_mi_turno:
                 self.launch_btn.config(state=tk.NORMAL if self.puede_lanzar else tk.DISABLED)
@@ -372,7 +436,29 @@ class ClienteParques:
             
             if color in self.fichas_tablero:
                 self.fichas_tablero[color][ficha_idx] = hasta
-                self.dibujar_tablero()
+                self.solicitar_redibujo()
+            
+        elif tipo == "seq":
+            seq = data.get("seq")
+            if self.seq_estado is not None and seq > self.seq_estado + 1:
+                # Se perdieron actualizaciones: se piden solo los cambios desde la última versión conocida
+                if not self.resync_pendiente:
+                    self.resync_pendiente = True
+                    self.enviar_mensaje({"tipo": "cambios_desde", "seq": self.seq_estado})
+            elif not self.resync_pendiente:
+                self.seq_estado = seq
+            
+        elif tipo == "estado":
+            if data.get("completo"):
+                self.fichas_tablero = {}
+            for color, ficha_idx, celda in data.get("fichas", []):
+                if celda is None:
+                    self.fichas_tablero.get(color, {}).pop(ficha_idx, None)
+                else:
+                    self.fichas_tablero.setdefault(color, {})[ficha_idx] = celda
+            self.seq_estado = data.get("seq")
+            self.resync_pendiente = False
+            self.solicitar_redibujo()
             
         elif tipo == "info":
             mensaje = data.get("mensaje", "")
@@ -399,6 +485,26 @@ class ClienteParques:
             self.tiempo_ajuste += ajuste
             self.agregar_mensaje(f"Reloj sincronizado (ajuste: {ajuste:.2f}s)")
     
+    def hash_tablero(self):
+        return zobrist.hash_fichas((color, ficha_idx, celda)
+                                   for color, fichas in self.fichas_tablero.items() for ficha_idx, celda in fichas.items())
+
+    def verificar_hash(self, hash_servidor):
+        """Compara el hash del servidor con el del tablero local y pide el estado completo si no coinciden"""
+        if hash_servidor is None or self.resync_pendiente:
+            return
+        if self.hash_tablero() != int(hash_servidor, 16):
+            # El tablero se desvió (un "movimiento" perdido o mal interpretado): un delta no lo corregiría
+            self.resync_pendiente = True
+            self.enviar_mensaje({"tipo": "cambios_desde", "seq": None})
+
+    def solicitar_redibujo(self):
+        """Redibuja el tablero, o lo deja pendiente si se está aplicando un lote"""
+        if self.en_lote:
+            self.redibujo_pendiente = True
+        else:
+            self.dibujar_tablero()
+    
     def lanzar_dados(self):
         """Lanza los dados"""
         if not self.es_mi_turno or not self.puede_lanzar:
@@ -431,6 +537,7 @@ class ClienteParques:
     
     def dibujar_tablero(self):
         """Dibuja el tablero de Parqués"""
+        self.redibujo_pendiente = False
         self.canvas.delete("all")
         
         # Configuración
@@ -450,13 +557,13 @@ class ClienteParques:
         self.canvas.create_rectangle(0, 0, canvas_size, canvas_size, fill="#ecf0f1", outline="")
         
         # Dibujar casillas del camino global
-        for i, (x, y) in enumerate(self.CAMINO_GLOBAL):
+        for i, (x, y) in enumerate(CAMINO_GLOBAL):
             px = x * cell_size + cell_size // 2
             py = y * cell_size + cell_size // 2
             
             # Color de la casilla
             color = "#bdc3c7"
-            if (x, y) in self.CASILLAS_SEGURAS:
+            if es_segura(i):
                 color = "#f39c12"  # Casillas seguras en naranja
             
             self.canvas.create_rectangle(
@@ -466,7 +573,7 @@ class ClienteParques:
             )
         
         # Dibujar caminos de meta
-        for color, camino in self.CAMINOS_META.items():
+        for color, camino in CAMINOS_META.items():
             for x, y in camino[:-1]:  # Excluir la meta final
                 px = x * cell_size + cell_size // 2
                 py = y * cell_size + cell_size // 2
@@ -488,7 +595,7 @@ class ClienteParques:
         self.canvas.create_text(center_x, center_y, text="META", fill="white", font=("Arial", 10, "bold"))
         
         # Dibujar cárceles
-        for color, coords in self.CARCELES_COORDS.items():
+        for color, coords in CARCELES_COORDS.items():
             # Dibujar el marco de la cárcel
             min_x = min(coord[0] for coord in coords) * cell_size
             max_x = (max(coord[0] for coord in coords) + 1) * cell_size
@@ -513,16 +620,15 @@ class ClienteParques:
         
         # Dibujar fichas
         for color, fichas in self.fichas_tablero.items():
-            for ficha_idx, posicion in fichas.items():
-                if posicion == "carcel":
+            for ficha_idx, celda in fichas.items():
+                if celda == CARCEL:
                     # Ficha en cárcel
-                    coords = self.CARCELES_COORDS[color][ficha_idx]
-                    px = coords[0] * cell_size + cell_size // 2
-                    py = coords[1] * cell_size + cell_size // 2
+                    coords = CARCELES_COORDS[color][ficha_idx]
                 else:
                     # Ficha en el tablero
-                    px = posicion[0] * cell_size + cell_size // 2
-                    py = posicion[1] * cell_size + cell_size // 2
+                    coords = COORDENADAS[celda]
+                px = coords[0] * cell_size + cell_size // 2
+                py = coords[1] * cell_size + cell_size // 2
                 
                 # Dibujar la ficha
                 self.canvas.create_oval(
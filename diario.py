@@ -0,0 +1,256 @@
+"""Diario binario de cada sala: los sucesos de la partida en un archivo de solo añadir, más una instantánea.
+
+Cada sala escribe en sala-<id>.log los sucesos que produjo cada comando aceptado (lanzamientos,
+movimientos, turnos...) como registros de pocos bytes, y cada cierto número de sucesos guarda su
+estado completo en sala-<id>.snap y vacía el log. Para reconstruir una sala basta con cargar la
+instantánea y aplicar los sucesos del log (ver Sala.restaurar).
+
+Los registros son absolutos (la ficha queda en tal estado y posición, el turno pasa al asiento N),
+así que reproducirlos no vuelve a tirar dados ni a evaluar reglas. Una partida terminada no se
+recupera: la sala borra su diario al haber ganador.
+"""
+
+import json
+import os
+import struct
+import threading
+import time
+
+import bitacora
+
+DURABILIDAD_NINGUNA = "ninguna" # Sin fsync: sobrevive a la caída del proceso, no a la del sistema
+DURABILIDAD_LOTE = "lote" # Un hilo hace fsync de los diarios modificados cada INTERVALO_FSYNC
+DURABILIDAD_SIEMPRE = "siempre" # fdatasync al terminar cada comando, antes de enviar sus mensajes
+DURABILIDADES = (DURABILIDAD_NINGUNA, DURABILIDAD_LOTE, DURABILIDAD_SIEMPRE)
+
+INTERVALO_FSYNC = 0.05 # Segundos entre fsync con DURABILIDAD_LOTE
+INSTANTANEA_CADA = 200 # Sucesos entre instantáneas
+
+registro = bitacora.bitacora_por_defecto()
+
+# Tipos de registro
+INICIO = 0 # Primer registro del log: sucesos anteriores a él (los que ya están en la instantánea)
+UNIRSE = 1
+SALIR = 2
+REEMPLAZAR = 3
+INICIAR = 4
+LANZAR = 5
+MOVER = 6
+TURNO = 7
+DETENER = 8
+SEQ = 9
+SESION = 10
+
+# Formato de cada registro después del byte de tipo; los nombres van detrás como UTF-8 de largo variable
+FORMATOS = {
+    INICIO: struct.Struct("<Q"), # sucesos previos
+    UNIRSE: struct.Struct("<BBB"), # color_idx, es_bot, largo del nombre
+    SALIR: struct.Struct("<B"), # asiento
+    REEMPLAZAR: struct.Struct("<BB"), # asiento, largo del nombre del bot
+    INICIAR: struct.Struct("<"),
+    LANZAR: struct.Struct("<BBB"), # asiento, dado1, dado2
+    MOVER: struct.Struct("<BBBb"), # asiento, ficha_idx, ficha_estado, ficha_pos
+    TURNO: struct.Struct("<BB"), # asiento en turno, sus pares consecutivos
+    DETENER: struct.Struct("<"),
+    SEQ: struct.Struct("<I"), # número de secuencia del estado versionado
+    SESION: struct.Struct("<BB"), # asiento, largo del token de reconexión
+}
+CON_NOMBRE = (UNIRSE, REEMPLAZAR, SESION)
+
+
+class ErrorDiario(Exception):
+    pass
+
+
+def codificar(tipo, *valores, nombre=None):
+    registro = bytes((tipo,)) + FORMATOS[tipo].pack(*valores)
+    if nombre is not None:
+        registro += nombre
+    return registro
+
+
+# LECTORES[tipo] = (bytes del registro sin el nombre, función que lo desempaqueta)
+LECTORES = [(1 + FORMATOS[tipo].size, FORMATOS[tipo].unpack_from) for tipo in range(len(FORMATOS))]
+
+
+def decodificar(datos):
+    """([(tipo, valores, nombre)], bytes leídos) de un log. Un registro final cortado (escritura a medias) se ignora"""
+    registros = []
+    i = 0
+    total = len(datos)
+    while i < total:
+        tipo = datos[i]
+        if tipo >= len(LECTORES):
+            raise ErrorDiario(f"Tipo de registro desconocido {tipo} en la posición {i}")
+        tamano, desempaquetar = LECTORES[tipo]
+        fin = i + tamano
+        if fin > total:
+            break
+        valores = desempaquetar(datos, i + 1)
+        nombre = None
+        if tipo in CON_NOMBRE:
+            largo = valores[-1]
+            if fin + largo > total:
+                break
+            nombre = datos[fin:fin + largo].decode("utf-8", "replace") # Diarios escritos antes del corte por carácter
+            fin += largo
+        registros.append((tipo, valores, nombre))
+        i = fin
+    return registros, i
+
+
+class SincronizadorDiarios:
+    """Hilo que agrupa los fsync de DURABILIDAD_LOTE: un fsync por archivo y por intervalo, no por comando"""
+
+    def __init__(self, intervalo=INTERVALO_FSYNC):
+        self.intervalo = intervalo
+        self.pendientes = set()
+        self.bloqueo = threading.Lock()
+        self.hilo = threading.Thread(target=self._ejecutar, name="fsync-diarios", daemon=True)
+        self.hilo.start()
+
+    def marcar(self, ruta):
+        with self.bloqueo:
+            self.pendientes.add(ruta)
+
+    def sincronizar(self):
+        with self.bloqueo:
+            rutas, self.pendientes = self.pendientes, set()
+        for ruta in rutas:
+            try:
+                fd = os.open(ruta, os.O_RDONLY)
+            except FileNotFoundError:
+                continue # La sala terminó y borró su diario
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _ejecutar(self):
+        while True:
+            time.sleep(self.intervalo)
+            try:
+                self.sincronizar()
+            except OSError as e:
+                registro.error("diario", "error al sincronizar diarios", error=repr(e))
+
+
+class Diario:
+    """Diario de una sala. Solo lo usa el actor de la sala, así que no necesita bloqueos"""
+
+    def __init__(self, directorio, sala_id, durabilidad=DURABILIDAD_LOTE, sincronizador=None,
+                 instantanea_cada=INSTANTANEA_CADA):
+        if durabilidad not in DURABILIDADES:
+            raise ValueError(f"Durabilidad desconocida: {durabilidad}")
+        self.ruta_log = os.path.join(directorio, f"sala-{sala_id}.log")
+        self.ruta_instantanea = os.path.join(directorio, f"sala-{sala_id}.snap")
+        self.durabilidad = durabilidad
+        self.sincronizador = sincronizador
+        self.instantanea_cada = instantanea_cada
+        self.pendiente = bytearray() # Registros del comando en curso
+        self.sucesos = 0 # Registros escritos desde que se creó la sala
+        self.sucesos_instantanea = 0 # Registros incluidos en la última instantánea
+        self.con_inicio = False # Si el log ya empieza con su registro INICIO
+        self.fd = None # Descriptor del log, abierto en modo O_APPEND
+
+    def anotar(self, tipo, *valores, nombre=None):
+        if nombre is not None:
+            # Se corta en un límite de carácter: un corte a mitad de una "ñ" no se podría decodificar al recuperar
+            nombre = nombre.encode()[:255].decode("utf-8", "ignore").encode()
+            valores += (len(nombre),)
+        self.pendiente += codificar(tipo, *valores, nombre=nombre)
+        self.sucesos += 1
+
+    def necesita_instantanea(self):
+        return self.sucesos - self.sucesos_instantanea >= self.instantanea_cada
+
+    def confirmar(self):
+        """Escribe los registros del comando con una sola escritura y aplica la política de fsync"""
+        if not self.pendiente:
+            return
+        datos, self.pendiente = bytes(self.pendiente), bytearray()
+        if not self.con_inicio:
+            datos = codificar(INICIO, self.sucesos_instantanea) + datos
+            self.con_inicio = True
+        self._escribir_log(datos)
+
+    def guardar_instantanea(self, estado):
+        """Guarda el estado completo de la sala (un dict JSON) y empieza un log nuevo"""
+        self.confirmar()
+        estado = dict(estado, sucesos=self.sucesos)
+        temporal = self.ruta_instantanea + ".tmp"
+        fd = os.open(temporal, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            os.write(fd, json.dumps(estado, separators=(",", ":")).encode())
+            if self.durabilidad != DURABILIDAD_NINGUNA:
+                os.fsync(fd) # El contenido tiene que estar en disco antes del rename
+        finally:
+            os.close(fd)
+        os.replace(temporal, self.ruta_instantanea) # Atómico: o la instantánea vieja o la nueva
+        self.sucesos_instantanea = self.sucesos
+        # Si el proceso cae antes de vaciar el log, su INICIO es anterior a la instantánea y se descarta al leer
+        os.ftruncate(self._log(), 0)
+        self._escribir_log(codificar(INICIO, self.sucesos))
+
+    def _log(self):
+        # El descriptor queda abierto mientras viva la sala: cada comando cuesta una sola llamada a write
+        if self.fd is None:
+            self.fd = os.open(self.ruta_log, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        return self.fd
+
+    def _escribir_log(self, datos):
+        fd = self._log()
+        os.write(fd, datos)
+        if self.durabilidad == DURABILIDAD_SIEMPRE:
+            os.fdatasync(fd)
+        elif self.durabilidad == DURABILIDAD_LOTE and self.sincronizador is not None:
+            self.sincronizador.marcar(self.ruta_log)
+
+    def leer(self):
+        """(instantánea o None, registros posteriores) guardados por una ejecución anterior.
+
+        Deja el diario listo para seguir añadiendo detrás de ellos.
+        """
+        instantanea = None
+        if os.path.exists(self.ruta_instantanea):
+            with open(self.ruta_instantanea, "rb") as f:
+                instantanea = json.loads(f.read())
+            self.sucesos_instantanea = instantanea["sucesos"]
+        registros, leidos = [], 0
+        if os.path.exists(self.ruta_log):
+            with open(self.ruta_log, "rb") as f:
+                registros, leidos = decodificar(f.read())
+        self.con_inicio = bool(registros) and registros[0][0] == INICIO and registros[0][1][0] == self.sucesos_instantanea
+        if self.con_inicio:
+            registros = registros[1:]
+        else:
+            # Log anterior a la instantánea (el proceso cayó antes de vaciarlo): ya está incluido en ella
+            registros, leidos = [], 0
+        if os.path.exists(self.ruta_log) and os.path.getsize(self.ruta_log) != leidos:
+            os.truncate(self.ruta_log, leidos) # Lo siguiente se añade detrás del último registro completo
+        self.sucesos = self.sucesos_instantanea + len(registros)
+        return instantanea, registros
+
+    def cerrar(self):
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+    def eliminar(self):
+        self.pendiente = bytearray()
+        self.cerrar()
+        for ruta in (self.ruta_log, self.ruta_instantanea):
+            try:
+                os.remove(ruta)
+            except FileNotFoundError:
+                pass
+
+
+def salas_guardadas(directorio):
+    """Ids de las salas con diario en el directorio"""
+    ids = set()
+    for nombre in os.listdir(directorio):
+        base, extension = os.path.splitext(nombre)
+        if extension in (".log", ".snap") and base.startswith("sala-"):
+            ids.add(int(base[len("sala-"):]))
+    return sorted(ids)
@@ -0,0 +1,270 @@
+"""Espectadores: conexiones de solo lectura que siguen una sala sin ocupar asiento.
+
+Los espectadores van en un nivel de entrega aparte para que una mesa con miles de mirones no
+retrase a los jugadores. El actor de la sala solo agrega los frames públicos de cada comando a
+su CanalEspectadores y, al terminar el comando, deja un único frame en la cola de un hilo
+repartidor. Ese hilo es el dueño de los sockets de sus espectadores (no bloqueantes, sin hilo ni
+cola de salida propios): les escribe con send, guarda lo que el kernel no aceptó y vigila con un
+selector cuándo se puede seguir escribiendo o cuándo se fueron. Si la sala produce frames más
+rápido de lo que el repartidor los entrega, los que se juntaron en su cola salen en un solo send.
+
+La entrega admite pérdidas: a quien acumula más de MAX_PENDIENTE_ESPECTADOR bytes se le dejan de
+enviar frames hasta que vacía su buffer y recibe una instantánea del estado
+(EstadoVersionado.instantanea), que la sala publica a pedido del repartidor.
+"""
+
+import collections
+import selectors
+import socket
+import threading
+
+import bitacora
+from protocolo import DecodificadorMensajes, ErrorProtocolo, codificar_lote
+from salida import cerrar_conexion
+
+ALTA_MARCA_ESPECTADOR = 32 * 1024 # Con más bytes pendientes no se le envía la instantánea todavía
+MAX_PENDIENTE_ESPECTADOR = 256 * 1024 # Por encima de esto sus frames se descartan
+HILOS_REPARTIDOR = 1
+TAMANO_LECTURA_ESPECTADOR = 4096
+
+registro = bitacora.bitacora_por_defecto()
+
+# Tareas del repartidor
+_AGREGAR = 0
+_FRAME = 1
+_INSTANTANEA = 2
+_CERRAR = 3
+
+
+class Espectador:
+    def __init__(self, conn, addr, nombre):
+        self.conn = conn # Socket que pasa a manejar el repartidor
+        self.addr = addr
+        self.nombre = nombre
+        self.pendiente = bytearray() # Bytes que el kernel todavía no aceptó
+        self.atrasado = False # Perdió frames: espera una instantánea antes de seguir con el flujo
+        self.frames_perdidos = 0
+        self.decodificador = DecodificadorMensajes()
+
+
+class CanalEspectadores:
+    """Frames públicos de una sala hacia sus espectadores.
+
+    publicar, confirmar y los demás métodos públicos los llama solo el actor de la sala;
+    el conjunto de espectadores solo lo toca el hilo repartidor del canal.
+    """
+
+    def __init__(self, sala, repartidor):
+        self.sala = sala
+        self.hilo = repartidor.hilo_para(sala.id)
+        self.espectadores = set()
+        self.frames = [] # Frames públicos del comando en curso
+        self.instantanea_pedida = False # El repartidor pidió una instantánea y todavía no llegó
+
+    def publicar(self, frame):
+        self.frames.append(frame)
+
+    def confirmar(self):
+        """Fin del comando: todo lo publicado viaja como un solo frame"""
+        if self.frames:
+            frames, self.frames = self.frames, []
+            self.hilo.encolar(_FRAME, self, codificar_lote(frames))
+
+    def agregar(self, espectador, instantanea):
+        self.hilo.encolar(_AGREGAR, self, (espectador, instantanea))
+
+    def publicar_instantanea(self, instantanea):
+        self.instantanea_pedida = False
+        self.hilo.encolar(_INSTANTANEA, self, instantanea)
+
+    def cerrar(self):
+        """La partida terminó: se cierran las conexiones de los espectadores"""
+        self.hilo.encolar(_CERRAR, self, None)
+
+    def pedir_instantanea(self):
+        # Desde el hilo repartidor: la sala la arma en su propio hilo, entre comandos
+        if not self.instantanea_pedida:
+            self.instantanea_pedida = True
+            self.sala.enviar(self.sala.publicar_instantanea)
+
+
+class HiloRepartidor:
+    """Un hilo con su selector: escribe a los sockets de sus espectadores y atiende las tareas de los canales"""
+
+    def __init__(self, nombre):
+        self.tareas = collections.deque()
+        self.bloqueo = threading.Lock()
+        self.timbre_pendiente = False
+        self.selector = selectors.DefaultSelector()
+        self.despertador, self.timbre = socket.socketpair()
+        self.despertador.setblocking(False)
+        self.timbre.setblocking(False)
+        self.selector.register(self.despertador, selectors.EVENT_READ, None)
+        threading.Thread(target=self._ejecutar, name=nombre, daemon=True).start()
+
+    def encolar(self, tarea, canal, dato):
+        with self.bloqueo:
+            self.tareas.append((tarea, canal, dato))
+            despertar = not self.timbre_pendiente
+            self.timbre_pendiente = True
+        if despertar:
+            try:
+                self.timbre.send(b"\0")
+            except BlockingIOError:
+                pass # Ya hay bytes sin leer: el hilo se va a despertar igual
+
+    def _ejecutar(self):
+        while True:
+            for clave, eventos in self.selector.select():
+                if clave.data is None:
+                    try:
+                        self.despertador.recv(4096)
+                    except BlockingIOError:
+                        pass
+                    continue
+                espectador, canal = clave.data
+                try:
+                    if eventos & selectors.EVENT_READ:
+                        self._leer(canal, espectador)
+                    if eventos & selectors.EVENT_WRITE and espectador in canal.espectadores:
+                        self._escribir(canal, espectador)
+                except Exception as e:
+                    registro.aviso("espectadores", "error con el espectador", canal.sala.id, espectador=espectador.nombre,
+                                   error=repr(e))
+                    self._quitar(canal, espectador)
+            with self.bloqueo:
+                tareas, self.tareas = self.tareas, collections.deque()
+                self.timbre_pendiente = False
+            try:
+                self._atender(tareas)
+            except Exception as e:
+                registro.error("espectadores", "error al repartir a los espectadores", error=repr(e))
+
+    def _atender(self, tareas):
+        # Los frames seguidos de un mismo canal se juntan; el orden con sus otras tareas se respeta
+        frames = {}
+        for tarea, canal, dato in tareas:
+            if tarea == _FRAME:
+                frames.setdefault(canal, []).append(dato)
+                continue
+            acumulados = frames.pop(canal, None)
+            if acumulados:
+                self._repartir(canal, b"".join(acumulados))
+            if tarea == _AGREGAR:
+                self._agregar(canal, *dato)
+            elif tarea == _INSTANTANEA:
+                self._ponerse_al_dia(canal, dato)
+            elif tarea == _CERRAR:
+                self._cerrar(canal)
+        for canal, acumulados in frames.items():
+            self._repartir(canal, b"".join(acumulados))
+
+    def _agregar(self, canal, espectador, instantanea):
+        espectador.conn.setblocking(False)
+        self.selector.register(espectador.conn, selectors.EVENT_READ, (espectador, canal))
+        canal.espectadores.add(espectador)
+        self._enviar(canal, espectador, instantanea)
+
+    def _repartir(self, canal, datos):
+        descartes = False
+        for espectador in list(canal.espectadores):
+            if espectador.atrasado:
+                espectador.frames_perdidos += 1
+            elif not espectador.pendiente:
+                self._enviar(canal, espectador, datos)
+            elif len(espectador.pendiente) + len(datos) > MAX_PENDIENTE_ESPECTADOR:
+                espectador.atrasado = True
+                espectador.frames_perdidos += 1
+                descartes = True
+            else:
+                espectador.pendiente += datos
+        if descartes:
+            canal.pedir_instantanea()
+
+    def _ponerse_al_dia(self, canal, instantanea):
+        for espectador in list(canal.espectadores):
+            # Los que todavía no vaciaron su buffer la vuelven a pedir al bajar de la alta marca (ver _escribir)
+            if espectador.atrasado and len(espectador.pendiente) <= ALTA_MARCA_ESPECTADOR:
+                espectador.atrasado = False
+                if espectador.pendiente:
+                    espectador.pendiente += instantanea
+                else:
+                    self._enviar(canal, espectador, instantanea)
+
+    def _enviar(self, canal, espectador, datos):
+        try:
+            enviados = espectador.conn.send(datos)
+        except BlockingIOError:
+            enviados = 0
+        except OSError:
+            self._quitar(canal, espectador)
+            return
+        if enviados < len(datos):
+            espectador.pendiente += memoryview(datos)[enviados:]
+            self.selector.modify(espectador.conn, selectors.EVENT_READ | selectors.EVENT_WRITE, (espectador, canal))
+
+    def _escribir(self, canal, espectador):
+        try:
+            enviados = espectador.conn.send(espectador.pendiente)
+        except BlockingIOError:
+            return
+        except OSError:
+            self._quitar(canal, espectador)
+            return
+        del espectador.pendiente[:enviados]
+        if not espectador.pendiente:
+            self.selector.modify(espectador.conn, selectors.EVENT_READ, (espectador, canal))
+        if espectador.atrasado and len(espectador.pendiente) <= ALTA_MARCA_ESPECTADOR:
+            canal.pedir_instantanea()
+
+    def _leer(self, canal, espectador):
+        """Lo único que se atiende de un espectador es "desconectar" (o que cierre la conexión)"""
+        try:
+            datos = espectador.conn.recv(TAMANO_LECTURA_ESPECTADOR)
+            mensajes = espectador.decodificador.alimentar(datos) if datos else None
+        except BlockingIOError:
+            return
+        except (OSError, ErrorProtocolo):
+            mensajes = None
+        if mensajes is None or any(isinstance(m, dict) and m.get("tipo") == "desconectar" for m in mensajes):
+            self._quitar(canal, espectador)
+
+    def _quitar(self, canal, espectador):
+        if espectador not in canal.espectadores:
+            return
+        canal.espectadores.discard(espectador)
+        self.selector.unregister(espectador.conn)
+        cerrar_conexion(espectador.conn)
+        registro.info("espectadores", "espectador desconectado", canal.sala.id, espectador=espectador.nombre,
+                      addr=espectador.addr)
+
+    def _cerrar(self, canal):
+        for espectador in list(canal.espectadores):
+            if espectador.pendiente:
+                try:
+                    espectador.conn.send(espectador.pendiente) # Lo que entre: el anuncio del ganador va al final
+                except OSError:
+                    pass
+            self._quitar(canal, espectador)
+
+
+class RepartidorEspectadores:
+    """Hilos que entregan los frames de los canales; cada sala va siempre al mismo hilo para conservar el orden"""
+
+    def __init__(self, num_hilos=HILOS_REPARTIDOR):
+        self.hilos = [HiloRepartidor(f"espectadores-{i}") for i in range(num_hilos)]
+
+    def hilo_para(self, sala_id):
+        return self.hilos[sala_id % len(self.hilos)]
+
+
+_repartidor_por_defecto = None
+_bloqueo_repartidor = threading.Lock()
+
+
+def repartidor_por_defecto():
+    global _repartidor_por_defecto
+    with _bloqueo_repartidor:
+        if _repartidor_por_defecto is None:
+            _repartidor_por_defecto = RepartidorEspectadores()
+        return _repartidor_por_defecto
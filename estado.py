@@ -0,0 +1,69 @@
+import collections
+
+MAX_HISTORIAL = 256  # Cambios que se conservan para responder "cambios desde seq N"
+
+
+class EstadoVersionado:
+    """Posiciones de las fichas y turno actual con un número de secuencia creciente.
+
+    Cada llamada a actualizar() que cambia algo incrementa seq y guarda solo lo que cambió,
+    así que ponerse al día cuesta en proporción a los cambios y no al tamaño del tablero.
+    Las claves de las fichas son (jugador, ficha_idx); una posición None significa que la ficha
+    ya no está en la partida (su jugador salió).
+    """
+
+    def __init__(self, max_historial=MAX_HISTORIAL):
+        self.seq = 0
+        self.fichas = {}  # {(jugador, ficha_idx): posicion}
+        self.turno = None
+        self.historial = collections.deque(maxlen=max_historial)  # [(seq, {clave: posicion}, turno_cambiado, turno)]
+
+    def actualizar(self, fichas, turno):
+        """Compara con el estado anterior y registra las diferencias. Devuelve True si hubo cambios"""
+        cambios = {clave: pos for clave, pos in fichas.items() if self.fichas.get(clave) != pos}
+        for clave in self.fichas.keys() - fichas.keys():
+            cambios[clave] = None
+        turno_cambiado = turno != self.turno
+        if not cambios and not turno_cambiado:
+            return False
+
+        self.seq += 1
+        self.fichas = dict(fichas)
+        self.turno = turno
+        self.historial.append((self.seq, cambios, turno_cambiado, turno))
+        return True
+
+    def restaurar(self, seq, fichas, turno):
+        """Estado recuperado de un diario: sin historial, así que los clientes reciben una instantánea"""
+        self.seq = seq
+        self.fichas = dict(fichas)
+        self.turno = turno
+        self.historial.clear()
+
+    def cambios_desde(self, seq):
+        """Delta compacto desde seq, o una instantánea completa si seq ya no está en el historial"""
+        primero = self.historial[0][0] if self.historial else self.seq + 1
+        if seq is None or seq > self.seq or seq < primero - 1:
+            return self.instantanea()
+
+        fichas = {}
+        turno = None
+        turno_cambiado = False
+        for seq_cambio, cambios, cambio_turno, turno_cambio in self.historial:
+            if seq_cambio <= seq:
+                continue
+            fichas.update(cambios)  # Solo cuenta la última posición de cada ficha
+            if cambio_turno:
+                turno_cambiado, turno = True, turno_cambio
+
+        delta = {"seq": self.seq, "desde": seq, "completo": False, "fichas": self._lista(fichas)}
+        if turno_cambiado:
+            delta["turno"] = turno
+        return delta
+
+    def instantanea(self):
+        return {"seq": self.seq, "completo": True, "fichas": self._lista(self.fichas), "turno": self.turno}
+
+    @staticmethod
+    def _lista(fichas):
+        return [[jugador, idx, pos] for (jugador, idx), pos in fichas.items()]
@@ -0,0 +1,269 @@
+"""Métricas del servidor: contadores e histogramas baratos, expuestos por HTTP en formato de texto.
+
+Registrar un suceso no toma ningún bloqueo: cada hilo escribe en su propio Fragmento (un dict de
+contadores y uno de histogramas) y quien lee las métricas suma los fragmentos de todos los hilos.
+Los fragmentos de hilos que terminaron se pliegan en uno solo al leer, así que el modelo de un hilo
+por conexión no acumula memoria.
+
+Los medidores (salas activas, bytes en colas de salida...) no se registran en cada suceso: se
+calculan al pedir las métricas con las funciones dadas a registrar_medidor.
+
+    python prueba.py --metricas 9100
+    curl http://127.0.0.1:9100/metrics
+"""
+
+import http.server
+import threading
+import time
+from bisect import bisect_left
+
+import bitacora
+
+PREFIJO = "parques_"
+# Límites superiores de las cubetas de los histogramas, en segundos (la última cubeta es +Inf)
+LIMITES = (0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+           0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SUMA = len(LIMITES) + 1 # Posición de la suma de las observaciones en la lista de cada histograma
+
+# {nombre: (tipo, ayuda, nombre de la etiqueta)}; los nombres sin definición se exportan como contadores
+DEFINICIONES = {
+    "mensajes_recibidos_total": ("counter", "Mensajes recibidos de los clientes", "tipo"),
+    "bytes_recibidos_total": ("counter", "Bytes de los mensajes recibidos de los clientes", "tipo"),
+    "mensajes_enviados_total": ("counter", "Mensajes enviados a los jugadores (uno por destinatario)", "tipo"),
+    "bytes_enviados_total": ("counter", "Bytes enviados a los jugadores (por destinatario)", "tipo"),
+    "comando_segundos": ("histogram", "Tiempo de ejecución de cada comando en el actor de la sala", "comando"),
+    "espera_buzon_segundos": ("histogram", "Tiempo desde que se encola un comando hasta que el actor lo ejecuta", "comando"),
+    "bloqueo_espera_segundos": ("histogram", "Espera para adquirir el bloqueo cuando otro hilo lo tenía tomado", "bloqueo"),
+    "bloqueo_retencion_segundos": ("histogram", "Tiempo que se mantiene tomado el bloqueo", "bloqueo"),
+}
+
+
+class Fragmento:
+    """Métricas que registró un hilo. Solo ese hilo lo modifica"""
+
+    def __init__(self, hilo=None):
+        self.hilo = hilo
+        self.contadores = {} # {(nombre, etiqueta): valor}
+        self.histogramas = {} # {(nombre, etiqueta): [cuenta por cubeta..., suma]}
+
+    def sumar(self, contadores, histogramas):
+        for clave, valor in contadores.items():
+            self.contadores[clave] = self.contadores.get(clave, 0) + valor
+        for clave, cubetas in histogramas.items():
+            total = self.histogramas.get(clave)
+            if total is None:
+                self.histogramas[clave] = list(cubetas)
+            else:
+                for i, valor in enumerate(cubetas):
+                    total[i] += valor
+
+
+_local = threading.local()
+_fragmentos = []
+_retirados = Fragmento() # Lo que registraron los hilos que ya terminaron
+_bloqueo = threading.Lock() # Protege la lista de fragmentos, no los fragmentos
+_medidores = {} # {nombre: (ayuda, nombre de la etiqueta, función)}
+registro = bitacora.bitacora_por_defecto()
+
+
+def _nuevo_fragmento():
+    fragmento = _local.fragmento = Fragmento(threading.current_thread())
+    with _bloqueo:
+        _fragmentos.append(fragmento)
+    return fragmento
+
+
+def contar(nombre, etiqueta="", cantidad=1):
+    try:
+        contadores = _local.fragmento.contadores
+    except AttributeError:
+        contadores = _nuevo_fragmento().contadores
+    clave = (nombre, etiqueta)
+    contadores[clave] = contadores.get(clave, 0) + cantidad
+
+
+def _cubetas(clave):
+    """Cubetas del histograma en el fragmento de este hilo, creándolas la primera vez"""
+    try:
+        histogramas = _local.fragmento.histogramas
+    except AttributeError:
+        histogramas = _nuevo_fragmento().histogramas
+    cubetas = histogramas.get(clave)
+    if cubetas is None:
+        cubetas = histogramas[clave] = [0] * (SUMA + 1)
+    return cubetas
+
+
+def observar(nombre, etiqueta, segundos):
+    """Agrega una observación al histograma"""
+    # Camino rápido sin llamadas intermedias: el hilo ya tiene fragmento y el histograma ya existe
+    try:
+        cubetas = _local.fragmento.histogramas[(nombre, etiqueta)]
+    except (AttributeError, KeyError):
+        cubetas = _cubetas((nombre, etiqueta))
+    cubetas[bisect_left(LIMITES, segundos)] += 1
+    cubetas[SUMA] += segundos
+
+
+def contar_recibido(mensaje, num_bytes):
+    """Para DecodificadorMensajes(al_decodificar=...)"""
+    tipo = mensaje.get("tipo") if isinstance(mensaje, dict) else None
+    try:
+        contadores = _local.fragmento.contadores
+    except AttributeError:
+        contadores = _nuevo_fragmento().contadores
+    # Las dos claves en línea, sin pasar por contar(): esto corre una vez por mensaje
+    clave = ("mensajes_recibidos_total", tipo)
+    contadores[clave] = contadores.get(clave, 0) + 1
+    clave = ("bytes_recibidos_total", tipo)
+    contadores[clave] = contadores.get(clave, 0) + num_bytes
+
+
+def contar_enviado(tipo, num_bytes, destinatarios=1):
+    try:
+        contadores = _local.fragmento.contadores
+    except AttributeError:
+        contadores = _nuevo_fragmento().contadores
+    clave = ("mensajes_enviados_total", tipo)
+    contadores[clave] = contadores.get(clave, 0) + destinatarios
+    clave = ("bytes_enviados_total", tipo)
+    contadores[clave] = contadores.get(clave, 0) + num_bytes * destinatarios
+
+
+class BloqueoMedido:
+    """threading.Lock que registra cuánto se esperó para tomarlo y cuánto se mantuvo tomado.
+
+    Sin contención no se mide la espera: el primer intento no bloquea y, si lo consigue, solo se
+    toma el instante para la retención. El histograma de espera cuenta solo las veces que hubo que
+    esperar a otro hilo.
+    """
+
+    def __init__(self, nombre):
+        self.nombre = nombre
+        self.bloqueo = threading.Lock()
+        self.tomado = 0.0
+        self.clave_espera = ("bloqueo_espera_segundos", nombre)
+        self.clave_retencion = ("bloqueo_retencion_segundos", nombre)
+
+    def __enter__(self):
+        if self.bloqueo.acquire(False):
+            self.tomado = time.perf_counter()
+            return self
+        inicio = time.perf_counter()
+        self.bloqueo.acquire()
+        self.tomado = time.perf_counter()
+        observar(*self.clave_espera, self.tomado - inicio)
+        return self
+
+    def __exit__(self, *exc):
+        retencion = time.perf_counter() - self.tomado
+        self.bloqueo.release()
+        try:
+            cubetas = _local.fragmento.histogramas[self.clave_retencion]
+        except (AttributeError, KeyError):
+            cubetas = _cubetas(self.clave_retencion)
+        cubetas[bisect_left(LIMITES, retencion)] += 1
+        cubetas[SUMA] += retencion
+
+
+def registrar_medidor(nombre, ayuda, funcion, etiqueta=None):
+    """funcion() devuelve un número, o {valor de la etiqueta: número} si se da el nombre de la etiqueta"""
+    _medidores[nombre] = (ayuda, etiqueta, funcion)
+
+
+def instantanea():
+    """(contadores, histogramas) sumando todos los hilos"""
+    total = Fragmento()
+    with _bloqueo:
+        vivos = []
+        for fragmento in _fragmentos:
+            # copy() de un dict no suelta el GIL, así que la copia es coherente aunque el hilo siga escribiendo
+            contadores = fragmento.contadores.copy()
+            histogramas = {clave: list(cubetas) for clave, cubetas in fragmento.histogramas.copy().items()}
+            if fragmento.hilo.is_alive():
+                vivos.append(fragmento)
+                total.sumar(contadores, histogramas)
+            else:
+                _retirados.sumar(contadores, histogramas) # Ya no va a escribir más
+        _fragmentos[:] = vivos
+        total.sumar(_retirados.contadores, _retirados.histogramas)
+    return total.contadores, total.histogramas
+
+
+def _etiquetas(nombre_etiqueta, valor, extra=""):
+    pares = []
+    if valor is not None and valor != "":
+        texto = str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pares.append(f'{nombre_etiqueta}="{texto}"')
+    if extra:
+        pares.append(extra)
+    return "{" + ",".join(pares) + "}" if pares else ""
+
+
+def exportar():
+    """Texto en el formato de exposición de Prometheus"""
+    contadores, histogramas = instantanea()
+    lineas = []
+    por_nombre = {}
+    for (nombre, etiqueta), valor in contadores.items():
+        por_nombre.setdefault(nombre, []).append((etiqueta, valor))
+    for (nombre, etiqueta), cubetas in histogramas.items():
+        por_nombre.setdefault(nombre, []).append((etiqueta, cubetas))
+
+    for nombre in sorted(por_nombre):
+        tipo, ayuda, nombre_etiqueta = DEFINICIONES.get(nombre, ("counter", nombre, "etiqueta"))
+        completo = PREFIJO + nombre
+        lineas.append(f"# HELP {completo} {ayuda}")
+        lineas.append(f"# TYPE {completo} {tipo}")
+        for etiqueta, valor in sorted(por_nombre[nombre], key=lambda e: str(e[0])):
+            if tipo != "histogram":
+                lineas.append(f"{completo}{_etiquetas(nombre_etiqueta, etiqueta)} {valor}")
+                continue
+            acumulado = 0
+            for limite, cuenta in zip(LIMITES + ("+Inf",), valor[:SUMA]):
+                acumulado += cuenta
+                le = f'le="{limite}"'
+                lineas.append(f"{completo}_bucket{_etiquetas(nombre_etiqueta, etiqueta, le)} {acumulado}")
+            lineas.append(f"{completo}_sum{_etiquetas(nombre_etiqueta, etiqueta)} {valor[SUMA]:.9f}")
+            lineas.append(f"{completo}_count{_etiquetas(nombre_etiqueta, etiqueta)} {acumulado}")
+
+    for nombre, (ayuda, nombre_etiqueta, funcion) in sorted(_medidores.items()):
+        try:
+            valor = funcion()
+        except Exception as e:
+            registro.error("metricas", "error al calcular la métrica", metrica=nombre, error=repr(e))
+            continue
+        completo = PREFIJO + nombre
+        lineas.append(f"# HELP {completo} {ayuda}")
+        lineas.append(f"# TYPE {completo} gauge")
+        if nombre_etiqueta is None:
+            lineas.append(f"{completo} {valor}")
+        else:
+            for etiqueta, v in sorted(valor.items(), key=lambda e: str(e[0])):
+                lineas.append(f"{completo}{_etiquetas(nombre_etiqueta, etiqueta)} {v}")
+    return "\n".join(lineas) + "\n"
+
+
+class _ManejadorMetricas(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        cuerpo = exportar().encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(cuerpo)))
+        self.end_headers()
+        self.wfile.write(cuerpo)
+
+    def log_message(self, formato, *args):
+        pass # Un scraper pide las métricas cada pocos segundos: no hace falta una línea por petición
+
+
+def iniciar_servidor_metricas(host, puerto):
+    """Atiende GET /metrics en un hilo aparte. Devuelve el servidor HTTP"""
+    servidor = http.server.ThreadingHTTPServer((host, puerto), _ManejadorMetricas)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, name="metricas", daemon=True).start()
+    print(f"[+] Métricas en http://{host}:{puerto}/metrics")
+    return servidor
@@ -0,0 +1,440 @@
+"""Microbenchmarks de los caminos calientes de las reglas, con línea base para detectar regresiones.
+
+Cada caso mide una operación sobre posiciones de mitad de partida generadas con el simulador
+(semilla fija, así que dos ejecuciones miden exactamente las mismas posiciones) y guarda los
+nanosegundos por operación: el mínimo de varias repeticiones, que es lo más estable frente al
+ruido de la máquina, y la mediana como referencia.
+
+    python microbench.py medir -o linea_base.json        # mide todo y guarda la línea base
+    python microbench.py medir reglas servidor           # solo los casos con esos prefijos
+    python microbench.py comparar linea_base.json        # mide de nuevo y marca las regresiones
+    python microbench.py comparar base.json nuevo.json --umbral 0.05
+
+comparar termina con código 1 si algún caso es más lento que la línea base por encima del umbral.
+"""
+
+import argparse
+import datetime
+import gc
+import json
+import math
+import platform
+import random
+import statistics
+import sys
+import time
+
+import zobrist
+from estado import EstadoVersionado
+from protocolo import DecodificadorMensajes, codificar_lote, codificar_mensaje
+from reglas import FichasJugador, Partida
+from servidor import ParquesRoom
+from simulador import PartidaSimulada, politica_aleatoria, semilla_partida
+from tablero import CARCEL, COLORES, avanzar, celda_ficha, es_segura
+from transiciones import EN_CAMINO, EN_CARCEL, ILEGAL, transicion
+
+SEMILLA = 2024
+POSICIONES = 2000
+REPETICIONES = 7
+TIEMPO_MINIMO = 0.05 # Segundos por repetición: las posiciones se recorren varias veces hasta llegar
+UMBRAL = 0.10 # Un caso es regresión si tarda más de (1 + UMBRAL) veces lo de la línea base
+LANZAMIENTOS_MITAD = (40, 200) # Lanzamientos jugados antes de tomar la posición
+MAX_DIBUJOS = 200 # dibujar_tablero es caro: basta con menos posiciones
+
+
+# --- Posiciones ---
+
+def posiciones_mitad(cantidad, semilla=SEMILLA, jugadores=4):
+    """Partidas en curso, cortadas tras un número aleatorio de lanzamientos con política aleatoria"""
+    posiciones = []
+    numero = 0
+    while len(posiciones) < cantidad:
+        rng = random.Random(semilla_partida(semilla, numero))
+        numero += 1
+        partida = PartidaSimulada(rng)
+        partida.jugadores = [FichasJugador(COLORES[i]) for i in range(jugadores)]
+        partida.iniciar()
+        for _ in range(rng.randint(*LANZAMIENTOS_MITAD)):
+            jugador = partida.jugadores[partida.turno_actual_idx]
+            movibles = partida.lanzar_dados(jugador)
+            if movibles:
+                partida.mover_ficha(jugador, politica_aleatoria(partida, jugador, movibles))
+            if not partida.juego_iniciado:
+                break
+        if partida.juego_iniciado:
+            dado1, dado2 = partida.tirar_dados()
+            posiciones.append((partida, dado1, dado2)) # Los dados del próximo lanzamiento
+    return posiciones
+
+
+def copiar_partida(partida):
+    """Copia de la posición para los casos que la modifican (mucho más barata que copy.deepcopy)"""
+    copia = PartidaSimulada(partida.rng)
+    for jugador in partida.jugadores:
+        nuevo = FichasJugador(jugador.color)
+        nuevo.ficha_estado = list(jugador.ficha_estado)
+        nuevo.ficha_pos = list(jugador.ficha_pos)
+        nuevo.fichas_en_meta_final = list(jugador.fichas_en_meta_final)
+        nuevo.pares_consecutivos = jugador.pares_consecutivos
+        copia.jugadores.append(nuevo)
+        for i in range(4):
+            copia.ocupacion.colocar(nuevo, i, celda_ficha(nuevo.color, nuevo.ficha_estado[i], nuevo.ficha_pos[i]))
+    copia.turno_actual_idx = partida.turno_actual_idx
+    copia.juego_iniciado = partida.juego_iniciado
+    copia.hash = partida.hash
+    return copia
+
+
+def preparar_movimiento(partida, dado1, dado2):
+    """Deja al jugador en turno con los dados lanzados, como lo encuentra mover_ficha"""
+    jugador = partida.jugadores[partida.turno_actual_idx]
+    partida.dados_lanzados = True
+    partida.ultimo_dado_dobles = dado1 == dado2
+    jugador.ultimo_dado = dado1 + dado2
+    return jugador
+
+
+def capturas_posibles(partida):
+    """(ficha_idx, dado1, dado2) sin pares con los que el jugador en turno come una ficha rival"""
+    jugador = partida.jugadores[partida.turno_actual_idx]
+    for dado1 in range(1, 7):
+        for dado2 in range(dado1 + 1, 7):
+            for ficha_idx in range(4):
+                if jugador.ficha_estado[ficha_idx] == EN_CARCEL:
+                    continue
+                destino = transicion(jugador.color, jugador.ficha_estado[ficha_idx], jugador.ficha_pos[ficha_idx], dado1 + dado2)
+                if (destino is not ILEGAL and destino[0] == EN_CAMINO and not es_segura(destino[2])
+                        and partida.ocupacion.rivales_en(destino[2], jugador)):
+                    return ficha_idx, dado1, dado2
+    return None
+
+
+def sala_servidor(partida):
+    """La misma posición en una ParquesRoom de servidor.py (player_id = asiento)"""
+    sala = ParquesRoom(0)
+    for asiento, jugador in enumerate(partida.jugadores):
+        celdas = [celda_ficha(jugador.color, jugador.ficha_estado[i], jugador.ficha_pos[i]) for i in range(4)]
+        sala.game_state['players'][asiento] = {
+            'id': asiento,
+            'username': f"J{asiento}",
+            'color': jugador.color,
+            'pieces': [{'position': celda, 'in_jail': celda == CARCEL} for celda in celdas],
+            'socket': None
+        }
+        for i, celda in enumerate(celdas):
+            sala.occupancy.colocar(asiento, i, celda)
+    sala.game_state['turn_order'] = list(range(len(partida.jugadores)))
+    sala.game_state['current_turn'] = partida.turno_actual_idx
+    sala.game_state['game_started'] = True
+    return sala
+
+
+# --- Casos: cada uno devuelve (función, [argumentos por operación]) ---
+# Los que modifican la posición (ver MODIFICAN) trabajan sobre copias preparadas en cada vuelta
+
+def caso_posibles_movimientos(posiciones):
+    argumentos = []
+    for partida, dado1, dado2 in posiciones:
+        partida.ultimo_dado_dobles = dado1 == dado2
+        argumentos.append((partida, partida.jugadores[partida.turno_actual_idx], dado1 + dado2))
+    return Partida.posibles_movimientos, argumentos
+
+
+def caso_mover_ficha(posiciones):
+    argumentos = []
+    for partida, dado1, dado2 in posiciones:
+        partida = copiar_partida(partida)
+        jugador = preparar_movimiento(partida, dado1, dado2)
+        movibles = partida.posibles_movimientos(jugador, dado1 + dado2)
+        if movibles:
+            argumentos.append((partida, jugador, movibles[(dado1 * 7 + dado2) % len(movibles)]))
+    return Partida.mover_ficha, argumentos
+
+
+def caso_mover_ficha_captura(posiciones):
+    """mover_ficha cuando el destino tiene fichas rivales: incluye el recorrido de comer_en"""
+    argumentos = []
+    for partida, _, _ in posiciones:
+        captura = capturas_posibles(partida)
+        if captura is None:
+            continue
+        ficha_idx, dado1, dado2 = captura
+        partida = copiar_partida(partida)
+        argumentos.append((partida, preparar_movimiento(partida, dado1, dado2), ficha_idx))
+    return Partida.mover_ficha, argumentos
+
+
+def caso_servidor_posibles(posiciones):
+    argumentos = [(sala_servidor(partida), partida.turno_actual_idx, dado1, dado2) for partida, dado1, dado2 in posiciones]
+    return ParquesRoom.get_possible_moves, argumentos
+
+
+def caso_servidor_valido(posiciones):
+    argumentos = []
+    for partida, dado1, dado2 in posiciones:
+        sala = sala_servidor(partida)
+        asiento = partida.turno_actual_idx
+        jugador = sala.game_state['players'][asiento]
+        for i, ficha in enumerate(jugador['pieces']):
+            if not ficha['in_jail']:
+                argumentos.append((sala, asiento, i, avanzar(jugador['color'], ficha['position'], dado1 + dado2)))
+    return ParquesRoom.is_valid_move, argumentos
+
+
+def caso_servidor_capturas(posiciones):
+    """check_captures sobre una casilla no segura con fichas de otro jugador"""
+    argumentos = []
+    for partida, _, _ in posiciones:
+        sala = sala_servidor(partida)
+        asiento = partida.turno_actual_idx
+        for celda, fichas in enumerate(sala.occupancy.celdas):
+            if not es_segura(celda) and any(dueno != asiento for dueno, _ in fichas):
+                argumentos.append((sala, asiento, celda))
+                break
+    return ParquesRoom.check_captures, argumentos
+
+
+def mensajes_por_tipo(posiciones):
+    """Mensajes de cada tipo del protocolo de prueba.py, armados a partir de las posiciones"""
+    mensajes = {}
+    for partida, dado1, dado2 in posiciones:
+        en_turno = partida.jugadores[partida.turno_actual_idx]
+        partida.ultimo_dado_dobles = dado1 == dado2
+        movibles = partida.posibles_movimientos(en_turno, dado1 + dado2)
+        celdas = [(j.color, i, celda_ficha(j.color, j.ficha_estado[i], j.ficha_pos[i])) for j in partida.jugadores for i in range(4)]
+        hash_posicion = zobrist.formatear(partida.hash)
+        estado = EstadoVersionado()
+        estado.actualizar({(color, i): celda for color, i, celda in celdas}, en_turno.color)
+        color, ficha_idx, celda = celdas[(dado1 * 7 + dado2) % len(celdas)]
+        turno = {"tipo": "turno", "mensaje": f"Turno de {en_turno.color}.", "es_tu_turno": False, "hash": hash_posicion}
+        movimiento = {"tipo": "movimiento", "color": color, "ficha_idx": ficha_idx, "desde": celda, "hasta": celda + dado1 + dado2}
+        seq = {"tipo": "seq", "seq": partida.rng.randrange(1, 10000)}
+        for mensaje in (
+            {"tipo": "unirse", "nombre": f"Jugador {en_turno.color}"},
+            {"tipo": "lanzar_dado"},
+            {"tipo": "mover_ficha", "ficha_idx": movibles[0] if movibles else 0},
+            {"tipo": "cambios_desde", "seq": seq["seq"]},
+            {"tipo": "color", "color": en_turno.color, "sala": 1, "token": f"{partida.hash:032x}", "gracia": 30},
+            {"tipo": "dados", "dado1": dado1, "dado2": dado2, "total": dado1 + dado2, "movible_fichas": movibles},
+            movimiento,
+            {"tipo": "info", "mensaje": f"¡{en_turno.color} ha comido la ficha {ficha_idx + 1} de {color}!"},
+            turno,
+            seq,
+            {"tipo": "estado", **estado.instantanea(), "hash": hash_posicion},
+        ):
+            mensajes.setdefault(mensaje["tipo"], []).append(mensaje)
+        # Lo que recibe un jugador por un movimiento: un lote con el movimiento, la nueva versión y el turno
+        mensajes.setdefault("lote", []).append(codificar_lote([codificar_mensaje(m) for m in (movimiento, seq, turno)]))
+    return mensajes
+
+
+_mensajes = (None, None) # (posiciones, sus mensajes): se arman una vez para todos los casos del protocolo
+
+
+def mensajes_de(posiciones):
+    global _mensajes
+    if _mensajes[0] is not posiciones:
+        _mensajes = (posiciones, mensajes_por_tipo(posiciones))
+    return _mensajes[1]
+
+
+def caso_codificar(tipo):
+    def preparar(posiciones):
+        return codificar_mensaje, [(m,) for m in mensajes_de(posiciones)[tipo]]
+    return preparar
+
+
+def caso_decodificar(tipo):
+    def preparar(posiciones):
+        frames = mensajes_de(posiciones)[tipo]
+        if tipo != "lote":
+            frames = [codificar_mensaje(m) for m in frames]
+        return DecodificadorMensajes().alimentar, [(f,) for f in frames]
+    return preparar
+
+
+_cliente = None
+
+
+def dibujar(cliente, fichas):
+    cliente.fichas_tablero = fichas
+    cliente.dibujar_tablero()
+
+
+def caso_dibujar_tablero(posiciones):
+    """ClienteParques.dibujar_tablero: necesita pantalla (tkinter); sin ella el caso se omite"""
+    global _cliente
+    if _cliente is None:
+        import tkinter
+        from cliente import ClienteParques
+        try:
+            _cliente = ClienteParques()
+        except tkinter.TclError:
+            return None, []
+        _cliente.root.withdraw()
+    argumentos = []
+    for partida, _, _ in posiciones[:MAX_DIBUJOS]:
+        fichas = {j.color: {i: celda_ficha(j.color, j.ficha_estado[i], j.ficha_pos[i]) for i in range(4)} for j in partida.jugadores}
+        argumentos.append((_cliente, fichas))
+    return dibujar, argumentos
+
+
+TIPOS_MENSAJE = ("unirse", "lanzar_dado", "mover_ficha", "cambios_desde", "color", "dados", "movimiento",
+                 "info", "turno", "seq", "estado", "lote")
+
+CASOS = {
+    "reglas.posibles_movimientos": caso_posibles_movimientos,
+    "reglas.mover_ficha": caso_mover_ficha,
+    "reglas.mover_ficha_captura": caso_mover_ficha_captura,
+    "servidor.get_possible_moves": caso_servidor_posibles,
+    "servidor.is_valid_move": caso_servidor_valido,
+    "servidor.check_captures": caso_servidor_capturas,
+    **{f"protocolo.codificar.{tipo}": caso_codificar(tipo) for tipo in TIPOS_MENSAJE if tipo != "lote"},
+    **{f"protocolo.decodificar.{tipo}": caso_decodificar(tipo) for tipo in TIPOS_MENSAJE},
+    "cliente.dibujar_tablero": caso_dibujar_tablero,
+}
+MODIFICAN = {"reglas.mover_ficha", "reglas.mover_ficha_captura", "servidor.check_captures"}
+
+
+# --- Medición ---
+
+def ejecutar(funcion, argumentos):
+    """Segundos que tarda en aplicar la función a todos los argumentos"""
+    gc.collect()
+    gc.disable() # Como timeit: una recolección a mitad de la medición es ruido
+    try:
+        inicio = time.perf_counter_ns()
+        for args in argumentos:
+            funcion(*args)
+        return (time.perf_counter_ns() - inicio) / 1e9
+    finally:
+        gc.enable()
+
+
+def preparar_vueltas(preparar, posiciones, vueltas, modifica):
+    funcion, argumentos = preparar(posiciones)
+    if modifica:
+        for _ in range(vueltas - 1):
+            argumentos = argumentos + preparar(posiciones)[1]
+    else:
+        argumentos = argumentos * vueltas
+    return funcion, argumentos
+
+
+def medir_caso(preparar, posiciones, repeticiones, modifica=False):
+    """ns por operación de cada repetición; None si el caso no se puede medir aquí"""
+    funcion, argumentos = preparar(posiciones)
+    if not argumentos:
+        return None
+    # Primera pasada de calentamiento: también decide cuántas vueltas llenan TIEMPO_MINIMO
+    vueltas = max(1, math.ceil(TIEMPO_MINIMO / max(ejecutar(funcion, argumentos), 1e-9)))
+    tiempos = []
+    for _ in range(repeticiones):
+        funcion, argumentos = preparar_vueltas(preparar, posiciones, vueltas, modifica)
+        tiempos.append(ejecutar(funcion, argumentos) * 1e9 / len(argumentos))
+    return {"ns_por_op": min(tiempos), "mediana_ns": statistics.median(tiempos), "operaciones": len(argumentos)}
+
+
+def seleccionar(prefijos):
+    if not prefijos:
+        return list(CASOS)
+    nombres = [n for n in CASOS if any(n == p or n.startswith(p + ".") for p in prefijos)]
+    if not nombres:
+        raise SystemExit(f"Ningún caso coincide con {', '.join(prefijos)}. Casos: {', '.join(CASOS)}")
+    return nombres
+
+
+def medir(nombres, num_posiciones=POSICIONES, repeticiones=REPETICIONES, semilla=SEMILLA):
+    inicio = time.perf_counter()
+    posiciones = posiciones_mitad(num_posiciones, semilla)
+    print(f"[micro] {len(posiciones)} posiciones de mitad de partida en {time.perf_counter() - inicio:.1f} s, "
+          f"{repeticiones} repeticiones por caso")
+    casos = {}
+    for nombre in nombres:
+        resultado = medir_caso(CASOS[nombre], posiciones, repeticiones, nombre in MODIFICAN)
+        if resultado is None:
+            print(f"  {nombre:<36} omitido (no se puede medir en este entorno)")
+            continue
+        casos[nombre] = resultado
+        print(f"  {nombre:<36} {resultado['ns_por_op']:>12,.0f} ns/op  (mediana {resultado['mediana_ns']:,.0f}, "
+              f"{resultado['operaciones']} ops)")
+    return {
+        "fecha": datetime.datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "posiciones": num_posiciones,
+        "repeticiones": repeticiones,
+        "semilla": semilla,
+        "casos": casos,
+    }
+
+
+def comparar(base, actual, umbral=UMBRAL):
+    """Imprime la tabla de cambios y devuelve los nombres de los casos que empeoraron más que el umbral"""
+    regresiones = []
+    print(f"\n{'caso':<36} {'base ns':>12} {'actual ns':>12} {'cambio':>8}")
+    for nombre in sorted(base["casos"].keys() | actual["casos"].keys()):
+        antes = base["casos"].get(nombre)
+        despues = actual["casos"].get(nombre)
+        if antes is None or despues is None:
+            medido = antes or despues
+            columnas = ("-", f"{medido['ns_por_op']:,.0f}") if antes is None else (f"{medido['ns_por_op']:,.0f}", "-")
+            print(f"{nombre:<36} {columnas[0]:>12} {columnas[1]:>12} {'':>8}  {'nuevo' if antes is None else 'sin medir'}")
+            continue
+        cambio = despues["ns_por_op"] / antes["ns_por_op"] - 1
+        marca = ""
+        if cambio > umbral:
+            marca = "REGRESIÓN"
+            regresiones.append(nombre)
+        elif cambio < -umbral:
+            marca = "mejora"
+        print(f"{nombre:<36} {antes['ns_por_op']:>12,.0f} {despues['ns_por_op']:>12,.0f} {cambio:>+8.1%}  {marca}")
+    if (base.get("python"), base.get("plataforma")) != (actual.get("python"), actual.get("plataforma")):
+        print(f"[!] La línea base es de otro entorno ({base.get('python')}, {base.get('plataforma')})")
+    print(f"\n{len(regresiones)} regresión(es) por encima del {umbral:.0%}")
+    return regresiones
+
+
+def leer(ruta):
+    with open(ruta) as f:
+        return json.load(f)
+
+
+def guardar(resultado, ruta):
+    with open(ruta, "w") as f:
+        json.dump(resultado, f, indent=2, ensure_ascii=False)
+    print(f"[micro] Resultados guardados en {ruta}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Microbenchmarks de las reglas con línea base")
+    subcomandos = parser.add_subparsers(dest="comando", required=True)
+
+    p_medir = subcomandos.add_parser("medir", help="Mide los casos y opcionalmente guarda la línea base")
+    p_medir.add_argument("casos", nargs="*", help="Prefijos de los casos a medir (todos por defecto)")
+    p_medir.add_argument("-o", "--salida", default=None, metavar="ARCHIVO", help="Guarda los resultados en JSON")
+    p_medir.add_argument("--posiciones", type=int, default=POSICIONES)
+    p_medir.add_argument("--repeticiones", type=int, default=REPETICIONES)
+    p_medir.add_argument("--semilla", type=int, default=SEMILLA)
+
+    p_comparar = subcomandos.add_parser("comparar", help="Compara con una línea base y marca las regresiones")
+    p_comparar.add_argument("base", help="JSON de la línea base")
+    p_comparar.add_argument("actual", nargs="?", default=None, help="JSON a comparar (por defecto se mide ahora)")
+    p_comparar.add_argument("--umbral", type=float, default=UMBRAL, help="Aumento relativo tolerado (0.10 = 10%%)")
+    p_comparar.add_argument("-o", "--salida", default=None, metavar="ARCHIVO", help="Guarda la medición nueva en JSON")
+    args = parser.parse_args()
+
+    if args.comando == "medir":
+        resultado = medir(seleccionar(args.casos), args.posiciones, args.repeticiones, args.semilla)
+        if args.salida:
+            guardar(resultado, args.salida)
+    else:
+        base = leer(args.base)
+        if args.actual:
+            actual = leer(args.actual)
+        else:
+            # Mismas posiciones y repeticiones que la línea base, para que la comparación sea justa
+            actual = medir([n for n in base["casos"] if n in CASOS], base["posiciones"], base["repeticiones"], base["semilla"])
+            if args.salida:
+                guardar(actual, args.salida)
+        sys.exit(1 if comparar(base, actual, args.umbral) else 0)
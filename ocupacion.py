@@ -0,0 +1,72 @@
+import os
+
+from tablero import CARCEL, NUM_CASILLAS
+
+# Con PARQUES_DEPURAR=1 (o prueba.py --depurar) las salas verifican el índice tras cada comando
+DEPURAR = os.environ.get("PARQUES_DEPURAR") == "1"
+
+
+class ErrorOcupacion(Exception):
+    pass
+
+
+class IndiceOcupacion:
+    """Índice casilla -> fichas que la ocupan, mantenido en cada cambio de posición.
+
+    Cada ficha se identifica por (propietario, ficha_idx); el propietario es lo que use la sala
+    (un Jugador en sala.py, un player_id en servidor.py). Las fichas en la cárcel no se indexan.
+    """
+
+    def __init__(self):
+        self.celdas = [[] for _ in range(NUM_CASILLAS)]  # celdas[celda] = [(propietario, ficha_idx), ...]
+
+    def colocar(self, propietario, ficha_idx, celda):
+        if celda != CARCEL:
+            self.celdas[celda].append((propietario, ficha_idx))
+
+    def quitar(self, propietario, ficha_idx, celda):
+        if celda != CARCEL:
+            self.celdas[celda].remove((propietario, ficha_idx))
+
+    def mover(self, propietario, ficha_idx, desde, hasta):
+        self.quitar(propietario, ficha_idx, desde)
+        self.colocar(propietario, ficha_idx, hasta)
+
+    def vaciar(self):
+        for fichas in self.celdas:
+            fichas.clear()
+
+    def fichas_en(self, celda):
+        return self.celdas[celda] if celda != CARCEL else []
+
+    def rivales_en(self, celda, propietario):
+        """Fichas de otros propietarios en la casilla: las candidatas a ser comidas"""
+        return [ficha for ficha in self.fichas_en(celda) if ficha[0] != propietario]
+
+    def propias_en(self, celda, propietario):
+        return sum(1 for dueno, _ in self.fichas_en(celda) if dueno == propietario)
+
+    def es_bloqueo(self, celda):
+        """Dos fichas del mismo propietario en la casilla forman un bloqueo"""
+        fichas = self.fichas_en(celda)
+        return len(fichas) >= 2 and all(dueno == fichas[0][0] for dueno, _ in fichas)
+
+    def verificar(self, posiciones):
+        """Compara el índice con las posiciones reales [(propietario, ficha_idx, celda), ...].
+
+        Lanza ErrorOcupacion con la primera diferencia encontrada.
+        """
+        esperado = {}
+        for propietario, ficha_idx, celda in posiciones:
+            if celda != CARCEL:
+                esperado[(propietario, ficha_idx)] = celda
+        indexado = {}
+        for celda, fichas in enumerate(self.celdas):
+            for ficha in fichas:
+                if ficha in indexado:
+                    raise ErrorOcupacion(f"Ficha {ficha} indexada en las casillas {indexado[ficha]} y {celda}")
+                indexado[ficha] = celda
+        if indexado != esperado:
+            diferencias = {ficha: (indexado.get(ficha), esperado.get(ficha))
+                           for ficha in indexado.keys() | esperado.keys() if indexado.get(ficha) != esperado.get(ficha)}
+            raise ErrorOcupacion(f"Índice de ocupación inconsistente (índice, real): {diferencias}")
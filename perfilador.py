@@ -0,0 +1,145 @@
+"""Perfilador por muestreo que se enciende en caliente, sin reiniciar el servidor ni perder las partidas.
+
+Un hilo aparte toma, FRECUENCIA veces por segundo, la pila de cada hilo del proceso con
+sys._current_frames(). No instrumenta nada, así que lo perfilado corre a su velocidad normal. Solo
+paga por el GIL que el muestreador toma un momento en cada muestra.
+
+Las muestras se programan contra instantes fijos de perf_counter, no con una espera después de cada
+una, así que la espera del GIL no retrasa las siguientes. Con un hilo ocupado en CPU el muestreador
+no consigue el GIL más de una vez por sys.getswitchinterval() (200 por segundo con el valor por
+omisión): las muestras que no llegan a su instante se saltan, y la respuesta dice cuántas se tomaron.
+
+Ve igual los hilos de manejar_cliente, los actores, los escritores de salida y el event loop del
+modo asyncio: en ese caso la pila es la de la corrutina que corre en el instante de la muestra.
+
+La salida usa el formato de pilas colapsadas ("hilo;archivo:funcion;... cuenta" por línea), el
+que leen flamegraph.pl, speedscope e inferno. Los hilos numerados (Thread-12, actor_3) se agrupan
+por nombre.
+
+    python prueba.py --admin 9200
+    python admin.py 9200 perfilar --segundos 30 --archivo /tmp/parques.folded
+"""
+
+import collections
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+
+FRECUENCIA = 50 # Muestras por segundo
+MAX_SEGUNDOS = 600
+NUMERO_EN_NOMBRE = re.compile(r"[-_]?\d+")
+
+
+class PerfiladorOcupado(Exception):
+    pass
+
+
+def nombre_hilo(nombre):
+    """ "Thread-12 (manejar_cliente)" -> "Thread (manejar_cliente)"; "actor_3" -> "actor" """
+    return NUMERO_EN_NOMBRE.sub("", nombre)
+
+
+class Perfilador:
+    def __init__(self):
+        self.bloqueo = threading.Lock() # Un solo perfil a la vez
+        self.detener_evento = threading.Event()
+        self.etiquetas = {} # {code: "archivo:funcion"}, para no formatear en cada muestra
+        self.ultimas = {} # {hilo: (frame, f_lasti, pila colapsada)} de la muestra anterior
+
+    @property
+    def activo(self):
+        return self.bloqueo.locked()
+
+    def etiqueta(self, codigo):
+        etiqueta = self.etiquetas.get(codigo)
+        if etiqueta is None:
+            etiqueta = self.etiquetas[codigo] = f"{os.path.basename(codigo.co_filename)}:{codigo.co_name}"
+        return etiqueta
+
+    def muestrear(self, pilas, nombres, propio):
+        """Suma a pilas la pila actual de cada hilo (menos la del muestreador)"""
+        for ident, frame in sys._current_frames().items():
+            if ident == propio:
+                continue
+            # Un hilo bloqueado (recv, select, cola vacía) sigue en la misma instrucción del mismo frame:
+            # su pila no cambió y no hace falta recorrerla otra vez
+            ultima = self.ultimas.get(ident)
+            if ultima is not None and ultima[0] is frame and ultima[1] == frame.f_lasti:
+                pilas[ultima[2]] += 1
+                continue
+            tope = frame
+            pila = []
+            while frame is not None:
+                pila.append(self.etiqueta(frame.f_code))
+                frame = frame.f_back
+            pila.append(nombres.get(ident) or "?")
+            pila.reverse()
+            colapsada = ";".join(pila)
+            pilas[colapsada] += 1
+            self.ultimas[ident] = (tope, tope.f_lasti, colapsada)
+
+    def perfilar(self, segundos, frecuencia=FRECUENCIA):
+        """Muestrea durante `segundos` (o hasta detener()). Devuelve (Counter de pilas colapsadas, muestras tomadas)"""
+        if not self.bloqueo.acquire(blocking=False):
+            raise PerfiladorOcupado("Ya hay un perfil en curso")
+        try:
+            self.detener_evento.clear()
+            intervalo = 1.0 / frecuencia
+            propio = threading.get_ident()
+            pilas = collections.Counter()
+            nombres = {}
+            muestras = 0
+            siguiente = renombrar = time.perf_counter()
+            fin = siguiente + min(segundos, MAX_SEGUNDOS)
+            while True:
+                siguiente += intervalo
+                ahora = time.perf_counter()
+                if siguiente < ahora:
+                    siguiente = ahora # Atrasado (el GIL tardó): se saltan los instantes perdidos, sin ráfagas
+                if siguiente >= fin or self.detener_evento.wait(siguiente - ahora):
+                    break
+                if siguiente >= renombrar: # Los hilos nuevos se nombran una vez por segundo
+                    nombres = {h.ident: nombre_hilo(h.name) for h in threading.enumerate()}
+                    renombrar = siguiente + 1.0
+                self.muestrear(pilas, nombres, propio)
+                muestras += 1
+            return pilas, muestras
+        finally:
+            self.ultimas.clear() # No retiene frames de hilos que ya terminaron
+            self.bloqueo.release()
+
+    def detener(self):
+        self.detener_evento.set()
+
+
+def escribir_colapsado(pilas, archivo):
+    with open(archivo, "w", encoding="utf-8") as f:
+        for pila, cuenta in pilas.most_common():
+            f.write(f"{pila} {cuenta}\n")
+
+
+def funciones_mas_calientes(pilas, cantidad=10):
+    """Funciones que más veces estaban en lo alto de la pila (incluye las que esperan en E/S)"""
+    propias = collections.Counter()
+    for pila, cuenta in pilas.items():
+        propias[pila.rsplit(";", 1)[-1]] += cuenta
+    return propias.most_common(cantidad)
+
+
+def archivo_por_defecto():
+    return os.path.join(tempfile.gettempdir(), f"parques-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.folded")
+
+
+_perfilador_por_defecto = None
+_bloqueo_perfilador = threading.Lock()
+
+
+def perfilador_por_defecto():
+    global _perfilador_por_defecto
+    with _bloqueo_perfilador:
+        if _perfilador_por_defecto is None:
+            _perfilador_por_defecto = Perfilador()
+        return _perfilador_por_defecto
@@ -0,0 +1,94 @@
+import json
+
+# Protocolo de mensajes: cada mensaje es un documento JSON terminado en "\n".
+# json.dumps nunca emite saltos de línea sin escapar, así que el separador es seguro.
+SEPARADOR = b"\n"
+TAMANO_LECTURA = 65536
+MAX_TAMANO_MENSAJE = 1024 * 1024  # Protege contra clientes que nunca envían el separador
+
+
+class ErrorProtocolo(Exception):
+    pass
+
+
+def codificar_mensaje(mensaje_dict):
+    """Convierte un diccionario en un frame listo para enviar por el socket"""
+    return json.dumps(mensaje_dict, separators=(",", ":")).encode("utf-8") + SEPARADOR
+
+
+def codificar_lote(frames):
+    """Une frames ya codificados en un único frame {"tipo": "lote", "mensajes": [...]} sin volver a serializarlos"""
+    if len(frames) == 1:
+        return frames[0]
+    cuerpo = b",".join(memoryview(f)[:-len(SEPARADOR)] for f in frames)
+    return b'{"tipo":"lote","mensajes":[' + cuerpo + b"]}" + SEPARADOR
+
+
+class DecodificadorMensajes:
+    """Buffer de recepción por conexión que extrae todos los frames completos de cada lectura"""
+
+    def __init__(self, max_tamano=MAX_TAMANO_MENSAJE, al_decodificar=None):
+        self.buffer = bytearray()
+        self.max_tamano = max_tamano
+        self.al_decodificar = al_decodificar  # al_decodificar(mensaje, bytes del frame), p. ej. para métricas
+        self.bytes_copiados = 0  # Bytes copiados al buffer o al cortar los frames completos (para benchmarks)
+        self.frames_decodificados = 0
+
+    def alimentar(self, datos):
+        """Agrega bytes recibidos y devuelve la lista de mensajes completos decodificados"""
+        mensajes = []
+        if not datos:
+            return mensajes
+
+        inicio = 0
+        if self.buffer:
+            # Completar el frame que quedó partido en la lectura anterior
+            fin = datos.find(SEPARADOR)
+            if fin == -1:
+                self._guardar(datos, 0)
+                return mensajes
+            self.buffer += memoryview(datos)[:fin]  # Sin el slice intermedio: una sola copia
+            self.bytes_copiados += fin
+            self._decodificar(self.buffer, mensajes)  # json.loads acepta el bytearray sin copiarlo a bytes
+            self.buffer.clear()
+            inicio = fin + 1
+
+        # Los frames completos se decodifican directamente sobre los datos recibidos, sin pasar por el buffer.
+        # json.loads no acepta memoryview, así que el slice es la única copia de cada frame
+        while True:
+            fin = datos.find(SEPARADOR, inicio)
+            if fin == -1:
+                break
+            if fin > inicio:
+                self._decodificar(datos[inicio:fin], mensajes)
+                self.bytes_copiados += fin - inicio
+            inicio = fin + 1
+
+        if inicio < len(datos):
+            self._guardar(datos, inicio)
+        return mensajes
+
+    def _guardar(self, datos, inicio):
+        """Conserva el fragmento incompleto hasta la siguiente lectura"""
+        self.buffer += memoryview(datos)[inicio:]
+        self.bytes_copiados += len(datos) - inicio
+        if len(self.buffer) > self.max_tamano:
+            raise ErrorProtocolo(f"Mensaje excede el tamaño máximo de {self.max_tamano} bytes")
+
+    def _decodificar(self, frame, mensajes):
+        try:
+            mensaje = json.loads(frame)
+        except (ValueError, UnicodeDecodeError) as e:
+            raise ErrorProtocolo(f"Frame inválido: {e}") from e
+        mensajes.append(mensaje)
+        self.frames_decodificados += 1
+        if self.al_decodificar is not None:
+            self.al_decodificar(mensaje, len(frame) + len(SEPARADOR))
+
+
+def recibir_mensajes(conn, decodificador, tamano=TAMANO_LECTURA):
+    """Lee del socket una vez y devuelve los mensajes completos. Devuelve None si la conexión se cerró"""
+    datos = conn.recv(tamano)
+    if not datos:
+        return None
+    return decodificador.alimentar(datos)
@@ -0,0 +1,265 @@
+"""Reglas del Parqués sin red: fichas, dados, turnos y capturas.
+
+Partida aplica las reglas y avisa de cada suceso llamando a sus métodos al_*, que aquí no hacen
+nada. Sala los sobrescribe para enviar mensajes a los clientes y el simulador para contar
+estadísticas, así que el servidor y las simulaciones juegan exactamente con las mismas reglas.
+"""
+
+import random
+
+import zobrist
+from ocupacion import ErrorOcupacion, IndiceOcupacion
+from tablero import CARCEL, celda_ficha, es_segura
+from transiciones import EN_CAMINO, EN_CARCEL, EN_META, EN_META_FINAL, ILEGAL, SALIDAS, fichas_movibles, transicion
+
+NUM_FICHAS = 4
+MAX_PARES_CONSECUTIVOS = 3  # Al tercer par seguido una ficha vuelve a la cárcel y se pasa el turno
+
+
+class FichasJugador:
+    """Estado de las fichas de un jugador. sala.Jugador lo amplía con la conexión"""
+
+    def __init__(self, color=None):
+        self.color = color
+        self.reiniciar_fichas()
+
+    def reiniciar_fichas(self):
+        # ficha_estado: 0=en cárcel, 1=en camino global, 2=en camino meta, 3=llegó a meta final
+        self.ficha_estado = [EN_CARCEL] * NUM_FICHAS
+        # ficha_pos: -1=en cárcel, índice en CAMINO_GLOBAL (= id de casilla) para global, índice en CAMINOS_META para meta
+        self.ficha_pos = [-1] * NUM_FICHAS
+        self.fichas_en_meta_final = [False] * NUM_FICHAS # True si la ficha llegó al centro (8,8)
+        self.ultimo_dado = 0
+        self.pares_consecutivos = 0 # Para la regla de 3 pares
+
+
+class Partida:
+    """Una partida en memoria. Los jugadores son FichasJugador (o subclases) en orden de turno"""
+
+    def __init__(self, rng=None):
+        self.rng = rng if rng is not None else random # Dados: un random.Random con semilla para reproducir partidas
+        self.jugadores = []
+        self.turno_actual_idx = 0 # Índice en la lista de jugadores
+        self.juego_iniciado = False
+        self.dados_lanzados = False # Hay que lanzar antes de mover
+        self.ultimo_dado_dobles = False # Si el último lanzamiento fue pares
+        self.ganador = None
+        self.ocupacion = IndiceOcupacion() # Casilla -> fichas, para comprobar capturas con una consulta
+        self.hash = 0 # Hash Zobrist de las fichas en juego, actualizado en cada cambio de casilla
+
+    # --- Sucesos: las subclases los sobrescriben ---
+
+    def al_rechazar(self, jugador, tipo, mensaje, posibles=None):
+        """Acción no permitida. posibles son las fichas con las que el jugador puede reintentar"""
+
+    def al_lanzar(self, jugador, dado1, dado2):
+        pass
+
+    def al_sacar_pares(self, jugador, dado1, dado2):
+        pass
+
+    def al_sacar_tres_pares(self, jugador):
+        pass
+
+    def al_no_poder_mover(self, jugador):
+        pass
+
+    def al_mostrar_dados(self, jugador, dado1, dado2, movibles):
+        """El jugador tiene que elegir una de las fichas movibles"""
+
+    def al_mover(self, jugador, ficha_idx, desde, hasta):
+        """Una ficha cambió de casilla (ids de tablero, CARCEL para la cárcel)"""
+
+    def al_sacar_de_carcel(self, jugador, ficha_idx):
+        pass
+
+    def al_llegar_a_meta(self, jugador, ficha_idx):
+        pass
+
+    def al_comer(self, jugador, rival, ficha_idx, celda):
+        """jugador mandó a la cárcel la ficha ficha_idx de rival, que estaba en celda"""
+
+    def al_cambiar_turno(self):
+        """Terminó la acción: le toca a jugadores[turno_actual_idx] (puede repetir con pares)"""
+
+    def al_ganar(self, jugador):
+        pass
+
+    # --- Reglas ---
+
+    def iniciar(self):
+        """Reinicia las fichas y da el turno al primer jugador"""
+        self.juego_iniciado = True
+        self.turno_actual_idx = 0
+        self.dados_lanzados = False
+        self.ganador = None
+        for jugador in self.jugadores:
+            jugador.reiniciar_fichas()
+        self.ocupacion.vaciar() # Todas las fichas empiezan en la cárcel
+        self.hash = zobrist.hash_fichas((j.color, i, CARCEL) for j in self.jugadores for i in range(NUM_FICHAS))
+
+    def posibles_movimientos(self, jugador, dado_total):
+        # Regla: Con pares, puedes sacar una ficha de la cárcel O mover una ficha.
+        # Si tiene fichas en cárcel Y sacó pares, puede sacar una.
+        if self.ultimo_dado_dobles:
+            movible_fichas = [i for i in range(NUM_FICHAS) if jugador.ficha_estado[i] == EN_CARCEL]
+            if movible_fichas: # Si hay fichas en cárcel y sacó pares, solo puede sacar una
+                return movible_fichas
+
+        # Si no tiene pares, o ya sacó su ficha de cárcel o no tiene más en cárcel
+        return fichas_movibles(jugador.color, jugador.ficha_estado, jugador.ficha_pos, dado_total)
+
+    def tirar_dados(self):
+        # random() en lugar de randint(): misma distribución y un tercio del costo, que es el grueso de una simulación
+        azar = self.rng.random
+        return 1 + int(azar() * 6), 1 + int(azar() * 6)
+
+    def lanzar_dados(self, jugador, dado1=None, dado2=None):
+        """Lanza los dados del jugador en turno. Devuelve las fichas movibles si ahora debe mover, si no None"""
+        if not self.juego_iniciado:
+            self.al_rechazar(jugador, "info", "El juego aún no ha iniciado.")
+            return None
+        if self.jugadores[self.turno_actual_idx] is not jugador:
+            self.al_rechazar(jugador, "info", "No es tu turno.")
+            return None
+        if self.dados_lanzados:
+            self.al_rechazar(jugador, "error", "Ya lanzaste los dados en este turno. Ahora mueve una ficha.")
+            return None
+
+        if dado1 is None:
+            dado1, dado2 = self.tirar_dados()
+        jugador.ultimo_dado = dado1 + dado2
+        self.dados_lanzados = True
+        self.al_lanzar(jugador, dado1, dado2)
+
+        if dado1 == dado2:
+            jugador.pares_consecutivos += 1
+            self.ultimo_dado_dobles = True
+            self.al_sacar_pares(jugador, dado1, dado2)
+        else:
+            jugador.pares_consecutivos = 0
+            self.ultimo_dado_dobles = False
+
+        if jugador.pares_consecutivos >= MAX_PARES_CONSECUTIVOS:
+            self.al_sacar_tres_pares(jugador)
+            for i in range(NUM_FICHAS): # Vuelve a la cárcel la primera ficha en juego
+                if jugador.ficha_estado[i] == EN_CAMINO or jugador.ficha_estado[i] == EN_META:
+                    celda_origen = celda_ficha(jugador.color, jugador.ficha_estado[i], jugador.ficha_pos[i])
+                    jugador.ficha_estado[i] = EN_CARCEL
+                    jugador.ficha_pos[i] = -1
+                    self.reubicar(jugador, i, celda_origen, CARCEL)
+                    self.al_mover(jugador, i, celda_origen, CARCEL)
+                    break
+            jugador.pares_consecutivos = 0
+            self.pasar_turno()
+            return None
+
+        movibles = self.posibles_movimientos(jugador, jugador.ultimo_dado)
+        if not movibles:
+            self.al_no_poder_mover(jugador)
+            # Si sacó pares y no puede mover, conserva el turno para volver a lanzar
+            self.pasar_turno(siguiente=not self.ultimo_dado_dobles)
+            return None
+
+        self.al_mostrar_dados(jugador, dado1, dado2, movibles)
+        return movibles
+
+    def mover_ficha(self, jugador, ficha_idx):
+        """Mueve una ficha con el último lanzamiento. Devuelve True si el movimiento se aplicó"""
+        if not self.juego_iniciado or self.jugadores[self.turno_actual_idx] is not jugador:
+            self.al_rechazar(jugador, "info", "No es tu turno o el juego no ha iniciado.")
+            return False
+        if not self.dados_lanzados:
+            self.al_rechazar(jugador, "error", "Primero debes lanzar el dado.")
+            return False
+        if ficha_idx < 0 or ficha_idx >= NUM_FICHAS:
+            self.al_rechazar(jugador, "error", "Índice de ficha inválido.")
+            return False
+
+        posibles = self.posibles_movimientos(jugador, jugador.ultimo_dado)
+        if ficha_idx not in posibles:
+            self.al_rechazar(jugador, "error", "Movimiento de ficha no válido para el dado actual.", posibles)
+            return False
+
+        if jugador.ficha_estado[ficha_idx] == EN_CARCEL:
+            if not self.ultimo_dado_dobles: # Solo se puede sacar con pares
+                self.al_rechazar(jugador, "error", "Solo puedes sacar fichas de la cárcel con pares.", posibles)
+                return False
+            jugador.ficha_estado[ficha_idx], jugador.ficha_pos[ficha_idx], celda_salida = SALIDAS[jugador.color]
+            self.reubicar(jugador, ficha_idx, CARCEL, celda_salida)
+            self.al_mover(jugador, ficha_idx, CARCEL, celda_salida)
+            self.al_sacar_de_carcel(jugador, ficha_idx)
+            self.pasar_turno(siguiente=not self.ultimo_dado_dobles)
+            return True
+
+        # Fichas en juego (global o meta): una consulta a la tabla de transiciones
+        destino = transicion(jugador.color, jugador.ficha_estado[ficha_idx], jugador.ficha_pos[ficha_idx], jugador.ultimo_dado)
+        if destino is ILEGAL: # Se pasó de la meta
+            self.al_rechazar(jugador, "error", "No puedes mover esa ficha. Excedes la meta.", posibles)
+            return False
+
+        celda_origen = celda_ficha(jugador.color, jugador.ficha_estado[ficha_idx], jugador.ficha_pos[ficha_idx])
+        jugador.ficha_estado[ficha_idx], jugador.ficha_pos[ficha_idx], celda_destino = destino
+        self.reubicar(jugador, ficha_idx, celda_origen, celda_destino)
+
+        if jugador.ficha_estado[ficha_idx] == EN_META_FINAL: # Llega exactamente al centro
+            jugador.fichas_en_meta_final[ficha_idx] = True
+            self.al_llegar_a_meta(jugador, ficha_idx)
+
+        # Captura: solo en el camino global y fuera de las casillas seguras
+        if jugador.ficha_estado[ficha_idx] == EN_CAMINO and not es_segura(celda_destino):
+            self.comer_en(jugador, celda_destino)
+
+        self.al_mover(jugador, ficha_idx, celda_origen, celda_destino)
+
+        if all(jugador.fichas_en_meta_final):
+            self.juego_iniciado = False
+            self.ganador = jugador
+            self.al_ganar(jugador)
+            return True
+
+        self.pasar_turno(siguiente=not self.ultimo_dado_dobles)
+        return True
+
+    def comer_en(self, jugador, celda):
+        """Manda a la cárcel las fichas rivales de la casilla: como mucho una por rival, la de menor índice"""
+        comidas = {}
+        for rival, ficha_idx in self.ocupacion.rivales_en(celda, jugador):
+            if rival.ficha_estado[ficha_idx] == EN_CAMINO and ficha_idx < comidas.get(rival, NUM_FICHAS):
+                comidas[rival] = ficha_idx
+        for rival, ficha_idx in comidas.items():
+            rival.ficha_estado[ficha_idx] = EN_CARCEL
+            rival.ficha_pos[ficha_idx] = -1
+            self.reubicar(rival, ficha_idx, celda, CARCEL)
+            self.al_comer(jugador, rival, ficha_idx, celda)
+
+    def reubicar(self, jugador, ficha_idx, desde, hasta):
+        """Lleva el índice de ocupación y el hash al nuevo lugar de una ficha"""
+        self.ocupacion.mover(jugador, ficha_idx, desde, hasta)
+        self.hash ^= zobrist.cambio(jugador.color, ficha_idx, desde, hasta)
+
+    def pasar_turno(self, siguiente=True):
+        """Cierra la acción actual: pasa al siguiente jugador o, con siguiente=False, repite el mismo"""
+        if siguiente:
+            self.turno_actual_idx = (self.turno_actual_idx + 1) % len(self.jugadores)
+        self.reiniciar_turno(nuevo_jugador=siguiente)
+
+    def reiniciar_turno(self, nuevo_jugador=True):
+        """Deja al jugador en turno listo para lanzar y avisa del turno"""
+        jugador = self.jugadores[self.turno_actual_idx]
+        self.dados_lanzados = False
+        jugador.ultimo_dado = 0
+        if nuevo_jugador: # La racha de pares solo cuenta mientras repite el mismo jugador
+            jugador.pares_consecutivos = 0
+        self.al_cambiar_turno()
+
+    def verificar_ocupacion(self):
+        """Comprueba que el índice de ocupación y el hash coinciden con las fichas de los jugadores (modo depuración)"""
+        posiciones = [(j, i, celda_ficha(j.color, j.ficha_estado[i], j.ficha_pos[i]))
+                      for j in self.jugadores for i in range(NUM_FICHAS)]
+        self.ocupacion.verificar(posiciones)
+        if self.juego_iniciado: # Antes de iniciar el hash todavía no cuenta las fichas
+            esperado = zobrist.hash_fichas((j.color, i, celda) for j, i, celda in posiciones)
+            if self.hash != esperado:
+                raise ErrorOcupacion(f"Hash de posición inconsistente: {zobrist.formatear(self.hash)}, "
+                                     f"esperado {zobrist.formatear(esperado)}")
@@ -0,0 +1,1044 @@
+import os
+import secrets
+import time
+
+import bitacora
+import diario
+import metricas
+import ocupacion
+import trazas
+import zobrist
+from actor import Actor
+from bots import pensador_por_defecto, posicion_de
+from espectadores import CanalEspectadores, repartidor_por_defecto
+from estado import EstadoVersionado
+from protocolo import codificar_lote, codificar_mensaje
+from reglas import MAX_PARES_CONSECUTIVOS, NUM_FICHAS, FichasJugador, Partida
+from salida import SalidaDescartada, cerrar_conexion
+from tablero import CARCEL, COLORES, celda_ficha
+from temporizadores import rueda_por_defecto
+from transiciones import EN_META_FINAL
+
+MAX_JUGADORES = 4
+MIN_JUGADORES_PARA_INICIAR = 2
+GRACIA_RECONEXION = 30 # Segundos que se guarda el asiento de quien pierde la conexión a mitad de partida
+
+registro = bitacora.bitacora_por_defecto()
+
+class Jugador(FichasJugador):
+    def __init__(self, conn, addr, nombre, color, salida=None):
+        super().__init__(color)
+        self.conn = conn
+        self.salida = salida # ColaSalida de la conexión (None = envío directo con sendall)
+        self.addr = addr
+        self.nombre = nombre
+        self.sala = None # Sala en la que está jugando
+        self.en_sala = False # True mientras ocupa una plaza de la sala
+        self.tiempo_sync = None # Última hora reportada por el cliente en la sincronización
+        self.lote = None # Frames acumulados mientras la sala procesa un comando (None = enviar directamente)
+        self.token = None # Sesión para reconectarse al mismo asiento (ver GestorSalas.reconectar)
+        self.desconectado = False # True mientras se le guarda el asiento tras perder la conexión
+        self.conexiones = 0 # Cuenta las reconexiones para descartar plazos de gracia vencidos
+
+class JugadorBot(Jugador):
+    """Asiento que juega el servidor con bots.elegir_ficha. Sus mensajes se descartan"""
+
+    def __init__(self, nombre, color=None):
+        super().__init__(None, ("bot", nombre), nombre, color, SalidaDescartada())
+        self.jugada = 0 # Cuenta sus lanzamientos para descartar decisiones que llegan tarde
+
+
+def enviar_mensaje(jugador_o_conn, mensaje_dict):
+    frame = codificar_mensaje(mensaje_dict)
+    metricas.contar_enviado(mensaje_dict.get("tipo"), len(frame))
+    enviar_frame(jugador_o_conn, frame)
+
+
+def enviar_frame(jugador_o_conn, frame, traza=None):
+    """Envía un frame ya codificado. Los bytes son inmutables, así que el mismo frame se comparte entre destinatarios"""
+    try:
+        if isinstance(jugador_o_conn, Jugador):
+            if jugador_o_conn.lote is not None:
+                jugador_o_conn.lote.append(frame) # Se envía al terminar el comando, junto con los demás
+            elif jugador_o_conn.salida is not None:
+                jugador_o_conn.salida.encolar(frame, traza) # No bloquea: lo envía el escritor de la conexión
+            else:
+                jugador_o_conn.conn.sendall(frame)
+        else: # Assuming it's a raw socket connection
+            jugador_o_conn.sendall(frame)
+    except Exception as e:
+        if isinstance(jugador_o_conn, Jugador):
+            registro.error("envio", "error al enviar mensaje", jugador_o_conn.sala.id if jugador_o_conn.sala else None,
+                           jugador=jugador_o_conn.nombre, error=repr(e))
+        else:
+            registro.error("envio", "error al enviar mensaje", error=repr(e))
+        # Aquí se podría manejar la desconexión del cliente si el error es de conexión
+
+
+class Sala(Actor, Partida):
+    """Una mesa de Parqués: jugadores, turno y reglas.
+
+    Las reglas vienen de reglas.Partida; la sala traduce sus sucesos (al_*) en mensajes.
+    La sala es un actor: todos los métodos de juego se ejecutan desde su buzón
+    (sala.enviar(sala.manejar_lanzamiento_dado, jugador)), nunca directamente desde los hilos de E/S.
+    """
+
+    def __init__(self, sala_id, gestor=None, max_jugadores=MAX_JUGADORES,
+                 min_jugadores_para_iniciar=MIN_JUGADORES_PARA_INICIAR, ejecutor=None, espera_bots=None, pensador=None,
+                 gracia=None, limite_turno=None, rueda=None):
+        Actor.__init__(self, ejecutor)
+        Partida.__init__(self)
+        self.id = sala_id
+        self.gestor = gestor
+        self.colores_disponibles = list(COLORES)
+        self.max_jugadores = max_jugadores
+        self.min_jugadores_para_iniciar = min_jugadores_para_iniciar
+        self.participantes_sync = [] # Jugadores a los que se pidió la hora en la ronda actual
+        self.en_lote = [] # Jugadores cuyos mensajes se están agrupando durante el comando actual
+        self.estado = EstadoVersionado() # Posiciones y turno versionados para resincronizar clientes
+        self.espera_bots = espera_bots # Segundos antes de completar la mesa con bots (None = sin bots)
+        self.pensador = pensador # PensadorBots; None = el pool compartido del proceso
+        self.gracia = gracia # Segundos que se guarda el asiento de un jugador desconectado (None = se va al instante)
+        self.limite_turno = limite_turno # Segundos para lanzar y para mover (None = sin límite)
+        self.rueda = rueda # RuedaTemporizadores; None = la compartida del proceso
+        self.plazo_turno = None # Temporizador del plazo del jugador en turno
+        self.plazos = 0 # Cambia con cada plazo cancelado para descartar los que vencen tarde
+        self.bots_creados = 0
+        self.ultimos_dados = (0, 0) # Último lanzamiento, para reenviarlo a quien se reconecta antes de mover
+        self.diario = None # diario.Diario donde se anotan los sucesos (None = sin diario)
+        self.espectadores = None # CanalEspectadores, creado con el primer espectador
+        # Contabilidad de cupos: solo se modifican con el bloqueo de GestorSalas tomado
+        self.plazas = 0 # Plazas reservadas o ocupadas
+        self.abierta = True # Si la sala acepta reservas nuevas
+
+    def antes_de_comando(self):
+        # Todo lo que genere el comando se agrupa en un único frame por destinatario
+        self.en_lote = list(self.jugadores)
+        for jugador in self.en_lote:
+            jugador.lote = []
+
+    def despues_de_comando(self):
+        if ocupacion.DEPURAR:
+            self.verificar_ocupacion()
+        self.registrar_estado()
+        if self.diario is not None:
+            # Antes de enviar: ningún cliente ve un suceso que no esté en el diario
+            if self.diario.necesita_instantanea():
+                self.diario.guardar_instantanea(self.instantanea())
+            else:
+                self.diario.confirmar()
+        for jugador in self.en_lote:
+            self.vaciar_lote(jugador)
+        self.en_lote = []
+        if self.espectadores is not None:
+            self.espectadores.confirmar() # Después de los jugadores: los espectadores nunca van por delante
+
+    def vaciar_lote(self, jugador):
+        frames, jugador.lote = jugador.lote, None
+        if not frames:
+            return
+        traza = trazas.actual()
+        if traza is None:
+            enviar_frame(jugador, codificar_lote(frames))
+            return
+        inicio = time.perf_counter()
+        frame = codificar_lote(frames)
+        enviar_frame(jugador, frame, traza)
+        traza.tramo("encolar", inicio, destinatario=jugador.nombre, frames=len(frames), bytes=len(frame))
+
+    def iniciar_partida(self):
+        """Reinicia las fichas y asigna el primer turno"""
+        self.iniciar()
+        self.anotar(diario.INICIAR)
+
+        # Notificar inicio del juego
+        self.enviar_a_todos({
+            "tipo": "info",
+            "mensaje": "¡El juego ha iniciado! Preparando el primer turno..."
+        })
+        # Tablero completo antes del primer turno: así el hash del "turno" coincide con el del cliente
+        # y un desajuste sí significa que se desincronizó
+        self.registrar_estado()
+        self.enviar_a_todos({"tipo": "estado", **self.estado.instantanea(), "hash": zobrist.formatear(self.hash)})
+
+        # Asignar primer turno
+        primer_jugador = self.jugadores[0]
+        mensaje = {
+            "tipo": "turno",
+            "mensaje": f"Es tu turno, {primer_jugador.nombre}. Lanza el dado.",
+            "es_tu_turno": True,
+            "hash": zobrist.formatear(self.hash)
+        }
+        if self.limite_turno is not None:
+            mensaje["limite"] = self.limite_turno
+        enviar_mensaje(primer_jugador, mensaje)
+
+        # Notificar a los demás
+        for j in self.jugadores[1:]:
+            enviar_mensaje(j, {
+                "tipo": "turno",
+                "mensaje": f"Turno de {primer_jugador.nombre}",
+                "es_tu_turno": False,
+                "hash": zobrist.formatear(self.hash)
+            })
+        self.publicar_turno()
+
+        registro.info("partida", "juego iniciado", self.id, primer_turno=primer_jugador.nombre,
+                      jugadores=[j.nombre for j in self.jugadores])
+        if self.gestor is not None:
+            self.gestor.cerrar_sala(self)
+        self.programar_bot()
+        self.programar_plazo()
+
+    def enviar_a_todos(self, mensaje_dict, except_jugador=None):
+        frame = codificar_mensaje(mensaje_dict) # Se serializa una sola vez para todos los destinatarios
+        destinatarios = 0
+        for jugador in self.jugadores:
+            if jugador != except_jugador:
+                enviar_frame(jugador, frame)
+                destinatarios += 1
+        metricas.contar_enviado(mensaje_dict.get("tipo"), len(frame), destinatarios)
+        if self.espectadores is not None:
+            self.espectadores.publicar(frame)
+
+    def enviar_turno(self):
+        if not self.jugadores:
+            registro.aviso("turno", "no hay jugadores para enviar turno", self.id)
+            return
+
+        en_turno = self.jugadores[self.turno_actual_idx]
+        registro.debug("turno", "turno asignado", self.id, jugador=en_turno.nombre, color=en_turno.color)
+
+        hash_posicion = zobrist.formatear(self.hash) # El cliente lo compara con el de su tablero
+        for i, jugador in enumerate(self.jugadores):
+            es_tu_turno = (i == self.turno_actual_idx)
+            mensaje ={ "tipo": "turno",
+                      "mensaje": f"Es tu turno, {jugador.nombre}." if es_tu_turno else f"Turno de {en_turno.nombre}.",
+                      "es_tu_turno": es_tu_turno,
+                      "hash": hash_posicion}
+            if es_tu_turno and self.limite_turno is not None:
+                mensaje["limite"] = self.limite_turno
+            try:
+                enviar_mensaje(jugador, mensaje)
+            except Exception as e:
+                registro.error("turno", "error enviando turno", self.id, jugador=jugador.nombre, error=repr(e))
+        self.publicar_turno()
+
+    def manejar_lanzamiento_dado(self, jugador):
+        self.lanzar_dados(jugador)
+
+    def manejar_mover_ficha(self, jugador, ficha_idx):
+        self.mover_ficha(jugador, ficha_idx)
+
+    # --- Sucesos de la partida -> mensajes ---
+
+    def al_rechazar(self, jugador, tipo, mensaje, posibles=None):
+        respuesta = {"tipo": tipo, "mensaje": mensaje}
+        if posibles is not None:
+            respuesta["reintentar_turno"] = True # Indicar al cliente que puede reintentar
+            respuesta["movible_fichas_reintentar"] = posibles
+        enviar_mensaje(jugador, respuesta)
+
+    def al_lanzar(self, jugador, dado1, dado2):
+        self.ultimos_dados = (dado1, dado2)
+        self.anotar(diario.LANZAR, self.turno_actual_idx, dado1, dado2)
+        registro.debug("dados", "dados lanzados", self.id, jugador=jugador.nombre, dado1=dado1, dado2=dado2,
+                       total=jugador.ultimo_dado)
+
+    def al_sacar_pares(self, jugador, dado1, dado2):
+        enviar_mensaje(jugador, {
+            "tipo": "info",
+            "mensaje": f"Sacaste pares ({dado1} y {dado2}), puedes lanzar de nuevo o sacar una ficha de la cárcel."
+            })
+
+    def al_sacar_tres_pares(self, jugador):
+        registro.info("dados", "tres pares consecutivos: ficha a la cárcel", self.id, jugador=jugador.nombre)
+        enviar_mensaje(jugador, {
+            "tipo": "info",
+            "mensaje": "¡Sacaste 3 pares consecutivos! Una de tus fichas irá a la cárcel (si tienes alguna en juego). Pasando turno."
+            })
+
+    def al_no_poder_mover(self, jugador):
+        enviar_mensaje(jugador, {
+            "tipo": "info",
+            "mensaje": "No tienes movimientos posibles con este dado. Pasando turno."})
+
+    def al_mostrar_dados(self, jugador, dado1, dado2, movibles):
+        # Si sacó pares, el cliente habilitará el botón de dado para re-lanzar después de mover
+        registro.debug("movimiento", "fichas movibles", self.id, jugador=jugador.nombre, movibles=movibles)
+        enviar_mensaje(jugador, {
+            "tipo": "dados",
+            "dado1": dado1,
+            "dado2": dado2,
+            "total": dado1 + dado2,
+            "movible_fichas": movibles
+            })
+        self.programar_plazo() # Ahora corre el plazo para mover
+
+    def al_mover(self, jugador, ficha_idx, desde, hasta):
+        self.anotar(diario.MOVER, self.jugadores.index(jugador), ficha_idx,
+                    jugador.ficha_estado[ficha_idx], jugador.ficha_pos[ficha_idx])
+        self.enviar_a_todos({
+            "tipo": "movimiento",
+            "color": jugador.color,
+            "ficha_idx": ficha_idx,
+            "desde": desde,
+            "hasta": hasta
+        })
+
+    def al_sacar_de_carcel(self, jugador, ficha_idx):
+        self.enviar_a_todos({"tipo": "info", "mensaje": f"¡{jugador.nombre} sacó la ficha {ficha_idx+1} de la cárcel!"})
+
+    def al_llegar_a_meta(self, jugador, ficha_idx):
+        self.enviar_a_todos({"tipo": "info", "mensaje": f"¡{jugador.nombre} ha llevado la ficha {ficha_idx+1} a la meta!"})
+
+    def al_comer(self, jugador, rival, ficha_idx, celda):
+        self.al_mover(rival, ficha_idx, celda, CARCEL)
+        self.enviar_a_todos({"tipo": "info", "mensaje": f"¡{jugador.nombre} ha comido la ficha {ficha_idx+1} de {rival.nombre}!"})
+
+    def al_cambiar_turno(self):
+        self.anotar(diario.TURNO, self.turno_actual_idx, self.jugadores[self.turno_actual_idx].pares_consecutivos)
+        self.enviar_turno()
+        self.programar_bot()
+        self.programar_plazo()
+
+    def al_ganar(self, jugador):
+        # fin: la sesión se cierra con la partida, así que el cliente no debe intentar volver al asiento
+        self.enviar_a_todos({"tipo": "info", "mensaje": f"🎉 ¡{jugador.nombre} ({jugador.color}) ha ganado la partida! 🎉",
+                             "fin": True, "ganador": jugador.nombre, "color": jugador.color})
+        registro.info("partida", "partida ganada", self.id, jugador=jugador.nombre, color=jugador.color)
+        for j in self.jugadores: # Cerrar conexiones de todos los jugadores
+            self.vaciar_lote(j) # El anuncio del ganador tiene que salir antes del cierre
+            if j.salida is not None:
+                j.salida.terminar()
+            else:
+                cerrar_conexion(j.conn)
+            self.cerrar_sesion(j)
+            if isinstance(j, JugadorBot):
+                self.liberar_plaza(j) # Los humanos la liberan al desconectarse
+        self.jugadores.clear()
+        self.ocupacion.vaciar()
+        self.hash = 0
+        self.cancelar_plazo()
+        self.cerrar_diario() # Una partida terminada no se recupera
+        self.cerrar_espectadores()
+
+    def registrar_jugador(self, jugador):
+        """Asigna color al jugador y arranca la partida si hay suficientes. Devuelve False si se rechaza"""
+        nombre = jugador.nombre
+        if not self.colores_disponibles:
+            enviar_mensaje(jugador, {"tipo": "error", "mensaje": "No hay cupos disponibles. Conexión rechazada."})
+            self.rechazar(jugador)
+            registro.info("sala", "conexión rechazada: no hay colores disponibles", self.id, jugador=nombre, addr=jugador.addr)
+            return False
+
+        if self.juego_iniciado:
+            if self.gestor is not None:
+                # La partida arrancó mientras el jugador esperaba en el buzón: se le busca otra sala
+                self.liberar_plaza(jugador)
+                self.gestor.reubicar(jugador)
+                return False
+            enviar_mensaje(jugador, {"tipo": "error", "mensaje": "El juego ya ha iniciado. No se permiten nuevas conexiones."})
+            self.rechazar(jugador)
+            registro.info("sala", "conexión rechazada: juego en curso", self.id, jugador=nombre, addr=jugador.addr)
+            return False
+
+        # Asignar color
+        color = self.colores_disponibles.pop(0)
+        jugador.color = color
+        self.jugadores.append(jugador)
+        self.anotar(diario.UNIRSE, COLORES.index(color), isinstance(jugador, JugadorBot), nombre=nombre)
+        registro.info("sala", "jugador unido", self.id, jugador=nombre, color=color, jugadores=len(self.jugadores))
+
+        if jugador.token is not None:
+            self.anotar(diario.SESION, len(self.jugadores) - 1, nombre=jugador.token)
+
+        # Enviar color al nuevo jugador
+        enviar_mensaje(jugador, self.mensaje_color(jugador))
+
+        # Notificar a los demás jugadores
+        self.enviar_a_todos({
+            "tipo": "info", 
+            "mensaje": f"{nombre} se ha unido a la partida con color {color}. ({len(self.jugadores)}/{self.max_jugadores})"
+        }, except_jugador=jugador)
+
+        if self.espera_bots is not None and self.humanos() == [jugador]:
+            # Primer humano de la mesa: si nadie más llega a tiempo, se completa con bots
+            self.programar_en(self.espera_bots, self.completar_con_bots)
+
+        # Verificar si podemos iniciar el juego
+        if len(self.jugadores) >= self.min_jugadores_para_iniciar and not self.juego_iniciado:
+            registro.debug("sala", "suficientes jugadores para iniciar", self.id, jugadores=len(self.jugadores),
+                           minimo=self.min_jugadores_para_iniciar)
+            self.iniciar_partida()
+
+        return True
+
+    def mensaje_color(self, jugador):
+        mensaje = {"tipo": "color", "color": jugador.color, "sala": self.id}
+        if jugador.token is not None:
+            mensaje["token"] = jugador.token # Para volver al asiento si se cae la conexión
+            mensaje["gracia"] = self.gracia
+        return mensaje
+
+    def rechazar(self, jugador):
+        cerrar_conexion(jugador.conn)
+        self.cerrar_sesion(jugador)
+        self.liberar_plaza(jugador)
+
+    def liberar_plaza(self, jugador):
+        """Devuelve el cupo del jugador al gestor (una sola vez por jugador)"""
+        if jugador.en_sala:
+            jugador.en_sala = False
+            if self.gestor is not None and self.gestor.liberar_plaza(self):
+                self.cerrar_diario() # La sala quedó vacía y el gestor la eliminó
+                self.cerrar_espectadores()
+
+    def eliminar_jugador(self, jugador):
+        """Libera el color del jugador y ajusta el turno o detiene la partida"""
+        self.cerrar_sesion(jugador)
+        jugador.desconectado = False
+        if (self.juego_iniciado and self.espera_bots is not None and jugador in self.jugadores
+                and len(self.humanos()) > 1):
+            self.reemplazar_con_bot(jugador) # Un bot sigue con sus fichas para no dejar un hueco en el turno
+            return
+        self.liberar_plaza(jugador)
+        if jugador in self.jugadores:
+            self.quitar_jugador(jugador)
+            self.enviar_a_todos({"tipo": "info", "mensaje": f"{jugador.nombre} ha salido del juego. ({len(self.jugadores)}/{self.max_jugadores})"})
+            registro.info("sala", "jugador salió", self.id, jugador=jugador.nombre, addr=jugador.addr)
+            if not self.humanos():
+                for bot in list(self.jugadores): # Sin humanos en la mesa los bots se retiran
+                    self.liberar_plaza(bot)
+                    self.quitar_jugador(bot)
+
+            if self.juego_iniciado and len(self.jugadores) < self.min_jugadores_para_iniciar:
+                self.juego_iniciado = False
+                self.cancelar_plazo()
+                self.anotar(diario.DETENER)
+                self.liberar_asientos_guardados()
+                self.enviar_a_todos({"tipo": "info", "mensaje": "No hay suficientes jugadores para continuar. El juego se ha detenido."})
+                registro.info("partida", "juego detenido por falta de jugadores", self.id)
+                if self.gestor is not None:
+                    self.gestor.abrir_sala(self) # Vuelve a aceptar jugadores
+            elif self.juego_iniciado and self.jugadores: # If game is still ongoing and it was their turn
+                # Adjust turn index if the current player left and it was their turn or a player before them left
+                if self.turno_actual_idx >= len(self.jugadores):
+                    self.turno_actual_idx = 0
+                elif jugador == self.jugadores[self.turno_actual_idx]:
+                    self.turno_actual_idx = (self.turno_actual_idx + 1) % len(self.jugadores) #avance al siguiente jugador
+                self.reiniciar_turno() # Avisa del turno al siguiente jugador
+
+    def liberar_asientos_guardados(self):
+        """Sin partida en curso no hay asiento que guardar: los desconectados dejan la sala.
+
+        Si no, la sala se reabriría con ellos sentados y la próxima partida le daría el turno a alguien
+        que no está. Sin humanos conectados también se retiran los bots.
+        """
+        for jugador in [j for j in self.jugadores if j.desconectado]:
+            jugador.desconectado = False # Su gracia pendiente ya no hace nada
+            self.cerrar_sesion(jugador)
+            self.liberar_plaza(jugador)
+            self.quitar_jugador(jugador)
+            registro.info("sesion", "asiento guardado liberado: la partida se detuvo", self.id, jugador=jugador.nombre)
+        if not self.humanos():
+            for bot in list(self.jugadores):
+                self.liberar_plaza(bot)
+                self.quitar_jugador(bot)
+
+    # --- Sesiones ---
+
+    def cerrar_sesion(self, jugador):
+        if self.gestor is not None:
+            self.gestor.cerrar_sesion(jugador)
+
+    def desconectar_jugador(self, jugador, conn):
+        """Se cayó la conexión conn del jugador: a mitad de partida se le guarda el asiento durante self.gracia"""
+        if jugador.conn is not conn:
+            return # Ya volvió por otra conexión
+        if not self.gracia or not self.juego_iniciado or jugador not in self.jugadores:
+            self.eliminar_jugador(jugador)
+            return
+        jugador.desconectado = True
+        jugador.conn = None
+        jugador.salida = SalidaDescartada() # Lo que se pierda lo recupera al volver, por número de secuencia
+        self.programar_gracia(jugador)
+        self.enviar_a_todos({"tipo": "info", "mensaje": f"{jugador.nombre} perdió la conexión. Se le guarda el asiento {self.gracia:g} s."},
+                            except_jugador=jugador)
+        registro.info("sesion", "conexión perdida: asiento guardado", self.id, jugador=jugador.nombre, addr=jugador.addr,
+                      gracia=self.gracia)
+
+    def programar_gracia(self, jugador):
+        self.programar_en(self.gracia or 0, self.vencer_gracia, jugador, jugador.conexiones)
+
+    def vencer_gracia(self, jugador, conexion):
+        if jugador.desconectado and jugador.conexiones == conexion and jugador in self.jugadores:
+            registro.info("sesion", "el jugador no volvió a tiempo", self.id, jugador=jugador.nombre)
+            self.eliminar_jugador(jugador)
+
+    def reconectar_jugador(self, jugador, conn, addr, salida, seq):
+        """El jugador volvió con su token: recupera el asiento y recibe solo lo que cambió desde seq"""
+        anterior = jugador.conn
+        jugador.conn, jugador.addr, jugador.salida = conn, addr, salida
+        if anterior is not None and anterior is not conn:
+            cerrar_conexion(anterior) # La conexión vieja seguía medio abierta
+        if jugador not in self.jugadores:
+            # El asiento ya no existe (venció la gracia o terminó la partida): entra como jugador nuevo
+            jugador.reiniciar_fichas()
+            jugador.color = None
+            jugador.desconectado = False
+            self.gestor.nueva_sesion(jugador)
+            self.gestor.reubicar(jugador)
+            return
+        volvio = jugador.desconectado
+        jugador.desconectado = False
+        jugador.conexiones += 1
+        enviar_mensaje(jugador, dict(self.mensaje_color(jugador), reconectado=True))
+        self.enviar_cambios(jugador, seq)
+        self.reenviar_turno(jugador)
+        if volvio:
+            self.enviar_a_todos({"tipo": "info", "mensaje": f"{jugador.nombre} volvió a la partida."}, except_jugador=jugador)
+        registro.info("sesion", "jugador reconectado", self.id, jugador=jugador.nombre, addr=addr)
+
+    def reenviar_turno(self, jugador):
+        """Turno actual para un jugador que vuelve, con sus dados si ya había lanzado"""
+        if not self.juego_iniciado or not self.jugadores:
+            return
+        en_turno = self.jugadores[self.turno_actual_idx]
+        es_tu_turno = en_turno is jugador
+        enviar_mensaje(jugador, {
+            "tipo": "turno",
+            "mensaje": f"Es tu turno, {jugador.nombre}." if es_tu_turno else f"Turno de {en_turno.nombre}.",
+            "es_tu_turno": es_tu_turno,
+            "hash": zobrist.formatear(self.hash)
+        })
+        if es_tu_turno and self.dados_lanzados:
+            dado1, dado2 = self.ultimos_dados
+            enviar_mensaje(jugador, {"tipo": "dados", "dado1": dado1, "dado2": dado2, "total": dado1 + dado2,
+                                     "movible_fichas": self.posibles_movimientos(jugador, jugador.ultimo_dado)})
+
+    def quitar_jugador(self, jugador):
+        self.anotar(diario.SALIR, self.jugadores.index(jugador))
+        self.jugadores.remove(jugador)
+        for i in range(4):
+            celda = celda_ficha(jugador.color, jugador.ficha_estado[i], jugador.ficha_pos[i])
+            self.ocupacion.quitar(jugador, i, celda)
+            self.hash ^= zobrist.clave_ficha(jugador.color, i, celda)
+        self.colores_disponibles.append(jugador.color) # Return color to available pool
+        self.colores_disponibles.sort() # Keep it sorted
+
+    # --- Plazos ---
+
+    def programar_en(self, segundos, comando, *args):
+        """Encola el comando en el buzón de la sala dentro de `segundos`. Devuelve el Temporizador"""
+        rueda = self.rueda or rueda_por_defecto()
+        return rueda.programar(segundos, self.enviar, comando, *args)
+
+    def programar_plazo(self):
+        """Arranca el plazo de la acción que espera la sala (lanzar o mover) y cancela el anterior"""
+        self.cancelar_plazo()
+        if self.limite_turno is None or not self.juego_iniciado or not self.jugadores:
+            return
+        if isinstance(self.jugadores[self.turno_actual_idx], JugadorBot):
+            return # Los bots juegan solos
+        self.plazo_turno = self.programar_en(self.limite_turno, self.vencer_plazo, self.plazos)
+
+    def cancelar_plazo(self):
+        self.plazos += 1 # Invalida también el que ya venció y espera en el buzón
+        if self.plazo_turno is not None:
+            (self.rueda or rueda_por_defecto()).cancelar(self.plazo_turno)
+            self.plazo_turno = None
+
+    def vencer_plazo(self, plazo):
+        """El jugador en turno no jugó a tiempo: se lanza por él o, si ya lanzó, pierde el turno"""
+        if plazo != self.plazos or not self.juego_iniciado:
+            return # Ya jugó: este plazo se canceló después de vencer
+        self.plazo_turno = None
+        jugador = self.jugadores[self.turno_actual_idx]
+        if not self.dados_lanzados:
+            registro.info("turno", "plazo vencido: lanzamiento automático", self.id, jugador=jugador.nombre)
+            enviar_mensaje(jugador, {"tipo": "info", "mensaje": "Se acabó tu tiempo: el servidor lanzó por ti."})
+            self.lanzar_dados(jugador) # Si tiene que mover, al_mostrar_dados programa el plazo para hacerlo
+        else:
+            registro.info("turno", "plazo vencido: pierde el turno", self.id, jugador=jugador.nombre)
+            self.enviar_a_todos({"tipo": "info", "mensaje": f"{jugador.nombre} no movió a tiempo y pierde el turno."})
+            self.pasar_turno()
+
+    # --- Espectadores ---
+
+    def mensaje_turno_publico(self):
+        en_turno = self.jugadores[self.turno_actual_idx]
+        return {"tipo": "turno", "mensaje": f"Turno de {en_turno.nombre}.", "es_tu_turno": False,
+                "hash": zobrist.formatear(self.hash)}
+
+    def publicar_turno(self):
+        if self.espectadores is not None and self.juego_iniciado and self.jugadores:
+            self.espectadores.publicar(codificar_mensaje(self.mensaje_turno_publico()))
+
+    def frame_instantanea(self, mensajes=()):
+        """Estado completo y turno actual en un solo frame: con él un espectador atrasado vuelve al flujo"""
+        frames = [codificar_mensaje(m) for m in mensajes]
+        frames.append(codificar_mensaje({"tipo": "estado", **self.estado.instantanea(), "hash": zobrist.formatear(self.hash)}))
+        if self.juego_iniciado and self.jugadores:
+            frames.append(codificar_mensaje(self.mensaje_turno_publico()))
+        return codificar_lote(frames)
+
+    def agregar_espectador(self, espectador):
+        if not self.jugadores:
+            cerrar_conexion(espectador.conn) # La sala se vació mientras el pedido esperaba en el buzón
+            return
+        if self.espectadores is None:
+            self.espectadores = CanalEspectadores(self, repartidor_por_defecto())
+        bienvenida = {"tipo": "observando", "sala": self.id,
+                      "jugadores": [{"nombre": j.nombre, "color": j.color} for j in self.jugadores]}
+        self.espectadores.agregar(espectador, self.frame_instantanea([bienvenida]))
+        registro.info("espectadores", "espectador conectado", self.id, espectador=espectador.nombre, addr=espectador.addr)
+
+    def cerrar_espectadores(self):
+        if self.espectadores is not None:
+            self.espectadores.confirmar() # Los últimos mensajes salen antes de cerrarles la conexión
+            self.espectadores.cerrar()
+            self.espectadores = None
+
+    def publicar_instantanea(self):
+        """Pedido del repartidor: algún espectador perdió frames y espera el estado completo"""
+        if self.espectadores is not None:
+            self.espectadores.publicar_instantanea(self.frame_instantanea())
+
+    # --- Bots ---
+
+    def humanos(self):
+        return [j for j in self.jugadores if not isinstance(j, JugadorBot)]
+
+    def nuevo_bot(self, color=None):
+        self.bots_creados += 1
+        bot = JugadorBot(f"Bot {self.bots_creados}", color)
+        bot.sala = self
+        return bot
+
+    def completar_con_bots(self):
+        """Vence la espera del primer humano: ocupa con bots los asientos que faltan para empezar"""
+        if self.juego_iniciado or not self.humanos():
+            return
+        while len(self.jugadores) < self.min_jugadores_para_iniciar and self.colores_disponibles:
+            if self.gestor is not None and not self.gestor.ocupar_plaza(self):
+                break
+            bot = self.nuevo_bot()
+            bot.en_sala = True
+            self.registrar_jugador(bot) # Arranca la partida al completar el mínimo
+
+    def reemplazar_con_bot(self, jugador):
+        """Un bot toma el asiento, el color y las fichas de un jugador que se fue a mitad de partida"""
+        bot = self.nuevo_bot(jugador.color)
+        bot.ficha_estado = list(jugador.ficha_estado)
+        bot.ficha_pos = list(jugador.ficha_pos)
+        bot.fichas_en_meta_final = list(jugador.fichas_en_meta_final)
+        bot.pares_consecutivos = jugador.pares_consecutivos
+        bot.en_sala, jugador.en_sala = jugador.en_sala, False # El bot se queda con su plaza
+        asiento = self.jugadores.index(jugador)
+        self.jugadores[asiento] = bot
+        self.anotar(diario.REEMPLAZAR, asiento, nombre=bot.nombre)
+        for i in range(4):
+            celda = celda_ficha(jugador.color, jugador.ficha_estado[i], jugador.ficha_pos[i])
+            self.ocupacion.quitar(jugador, i, celda)
+            self.ocupacion.colocar(bot, i, celda)
+        self.enviar_a_todos({"tipo": "info", "mensaje": f"{jugador.nombre} ha salido del juego. {bot.nombre} sigue con sus fichas ({bot.color})."})
+        registro.info("bots", "jugador reemplazado por un bot", self.id, jugador=jugador.nombre, addr=jugador.addr, bot=bot.nombre)
+        if asiento == self.turno_actual_idx:
+            self.reiniciar_turno(nuevo_jugador=False) # El bot lanza de nuevo
+
+    def programar_bot(self):
+        """Si le toca a un bot, encola su jugada: corre como un comando más del buzón, después del actual"""
+        if self.juego_iniciado and self.jugadores and isinstance(self.jugadores[self.turno_actual_idx], JugadorBot):
+            self.enviar(self.jugar_bot, self.jugadores[self.turno_actual_idx])
+
+    def jugar_bot(self, bot):
+        if not self.juego_iniciado or self.jugadores[self.turno_actual_idx] is not bot or self.dados_lanzados:
+            return
+        movibles = self.lanzar_dados(bot)
+        if not movibles:
+            return # Pasó el turno (o repite con pares): al_cambiar_turno ya programó lo siguiente
+        self.pensar_bot(bot, movibles)
+
+    def pensar_bot(self, bot, movibles):
+        bot.jugada += 1
+        if len(movibles) == 1:
+            self.mover_ficha(bot, movibles[0])
+            return
+        # La búsqueda corre en el pool de procesos; la sala sigue atendiendo su buzón mientras tanto
+        pensador = self.pensador or pensador_por_defecto()
+        futuro = pensador.pensar(posicion_de(self.jugadores), tuple(j.color for j in self.jugadores),
+                                 self.turno_actual_idx, bot.ultimo_dado, self.ultimo_dado_dobles, movibles)
+        jugada = bot.jugada
+        futuro.add_done_callback(lambda f: self.enviar(self.mover_bot, bot, jugada, f))
+
+    def mover_bot(self, bot, jugada, futuro):
+        if (bot.jugada != jugada or not self.juego_iniciado or not self.dados_lanzados
+                or self.jugadores[self.turno_actual_idx] is not bot):
+            return # La partida cambió mientras el bot pensaba
+        try:
+            ficha_idx = futuro.result()
+        except Exception as e:
+            registro.aviso("bots", "el bot no pudo pensar su jugada", self.id, bot=bot.nombre, error=repr(e))
+            ficha_idx = self.posibles_movimientos(bot, bot.ultimo_dado)[0]
+        self.mover_ficha(bot, ficha_idx)
+
+    def registrar_estado(self):
+        """Versiona el resultado del comando y avisa a los clientes del nuevo número de secuencia"""
+        fichas = {(j.color, i): celda_ficha(j.color, j.ficha_estado[i], j.ficha_pos[i])
+                  for j in self.jugadores for i in range(4)}
+        turno = self.jugadores[self.turno_actual_idx].color if self.juego_iniciado and self.jugadores else None
+        if self.estado.actualizar(fichas, turno):
+            self.anotar(diario.SEQ, self.estado.seq)
+            self.enviar_a_todos({"tipo": "seq", "seq": self.estado.seq})
+
+    def enviar_cambios(self, jugador, seq):
+        """Responde a "cambios_desde" con un delta, o con el estado completo si seq es muy antiguo"""
+        enviar_mensaje(jugador, {"tipo": "estado", **self.estado.cambios_desde(seq), "hash": zobrist.formatear(self.hash)})
+
+    # --- Diario ---
+
+    def anotar(self, tipo, *valores, nombre=None):
+        if self.diario is not None:
+            self.diario.anotar(tipo, *valores, nombre=nombre)
+
+    def cerrar_diario(self):
+        if self.diario is not None:
+            self.diario.eliminar()
+            self.diario = None
+
+    def instantanea(self):
+        """Estado completo de la sala para diario.Diario.guardar_instantanea (entre comandos)"""
+        return {
+            "jugadores": [{"nombre": j.nombre, "bot": isinstance(j, JugadorBot), "color": j.color,
+                           "estado": j.ficha_estado, "pos": j.ficha_pos,
+                           "pares": j.pares_consecutivos, "dado": j.ultimo_dado, "token": j.token}
+                          for j in self.jugadores],
+            "turno": self.turno_actual_idx,
+            "iniciado": self.juego_iniciado,
+            "dados_lanzados": self.dados_lanzados,
+            "dobles": self.ultimo_dado_dobles,
+            "dados": self.ultimos_dados,
+            "bots_creados": self.bots_creados,
+            "seq": self.estado.seq,
+        }
+
+    def restaurar(self, instantanea, registros):
+        """Reconstruye la sala desde su última instantánea y los registros posteriores del diario.
+
+        Los jugadores humanos vuelven desconectados: recuperan el asiento con su token (ver reanudar).
+        """
+        seq = 0
+        if instantanea is not None:
+            self.bots_creados = instantanea["bots_creados"]
+            for datos in instantanea["jugadores"]:
+                jugador = self.asiento_restaurado(datos["nombre"], datos["color"], datos["bot"])
+                jugador.ficha_estado = datos["estado"]
+                jugador.ficha_pos = datos["pos"]
+                jugador.fichas_en_meta_final = [estado == EN_META_FINAL for estado in datos["estado"]]
+                jugador.pares_consecutivos = datos["pares"]
+                jugador.ultimo_dado = datos["dado"]
+                jugador.token = datos["token"]
+                self.jugadores.append(jugador)
+            self.turno_actual_idx = instantanea["turno"]
+            self.juego_iniciado = instantanea["iniciado"]
+            self.dados_lanzados = instantanea["dados_lanzados"]
+            self.ultimo_dado_dobles = instantanea["dobles"]
+            self.ultimos_dados = tuple(instantanea["dados"])
+            seq = instantanea["seq"]
+        for tipo, valores, nombre in registros:
+            seq = self.aplicar_registro(tipo, valores, nombre, seq)
+
+        self.colores_disponibles = [c for c in COLORES if c not in {j.color for j in self.jugadores}]
+        self.ocupacion.vaciar()
+        fichas = [(j, i, celda_ficha(j.color, j.ficha_estado[i], j.ficha_pos[i]))
+                  for j in self.jugadores for i in range(NUM_FICHAS)]
+        for jugador, i, celda in fichas:
+            self.ocupacion.colocar(jugador, i, celda)
+        self.hash = zobrist.hash_fichas((j.color, i, celda) for j, i, celda in fichas)
+        turno = self.jugadores[self.turno_actual_idx].color if self.juego_iniciado and self.jugadores else None
+        self.estado.restaurar(seq, {(j.color, i): celda for j, i, celda in fichas}, turno)
+
+    def asiento_restaurado(self, nombre, color, es_bot):
+        if es_bot:
+            jugador = JugadorBot(nombre, color)
+        else:
+            jugador = Jugador(None, None, nombre, color, SalidaDescartada())
+            jugador.desconectado = True
+        jugador.sala = self
+        jugador.en_sala = True
+        return jugador
+
+    def aplicar_registro(self, tipo, valores, nombre, seq):
+        """Repite un registro del diario sobre el estado de la sala. Devuelve el seq vigente"""
+        if tipo == diario.LANZAR:
+            asiento, dado1, dado2 = valores
+            jugador = self.jugadores[asiento]
+            jugador.ultimo_dado = dado1 + dado2
+            self.ultimos_dados = (dado1, dado2)
+            self.dados_lanzados = True
+            self.ultimo_dado_dobles = dado1 == dado2
+            jugador.pares_consecutivos = jugador.pares_consecutivos + 1 if self.ultimo_dado_dobles else 0
+            if jugador.pares_consecutivos >= MAX_PARES_CONSECUTIVOS:
+                jugador.pares_consecutivos = 0 # La ficha que vuelve a la cárcel llega como MOVER
+        elif tipo == diario.MOVER:
+            asiento, ficha_idx, estado, pos = valores
+            jugador = self.jugadores[asiento]
+            jugador.ficha_estado[ficha_idx] = estado
+            jugador.ficha_pos[ficha_idx] = pos
+            jugador.fichas_en_meta_final[ficha_idx] = estado == EN_META_FINAL
+        elif tipo == diario.TURNO:
+            self.turno_actual_idx, pares = valores
+            jugador = self.jugadores[self.turno_actual_idx]
+            jugador.pares_consecutivos = pares
+            jugador.ultimo_dado = 0
+            self.dados_lanzados = False
+        elif tipo == diario.SEQ:
+            seq = valores[0]
+        elif tipo == diario.SESION:
+            self.jugadores[valores[0]].token = nombre
+        elif tipo == diario.UNIRSE:
+            color_idx, es_bot, _ = valores
+            if es_bot:
+                self.bots_creados += 1
+            self.jugadores.append(self.asiento_restaurado(nombre, COLORES[color_idx], es_bot))
+        elif tipo == diario.REEMPLAZAR:
+            asiento = valores[0]
+            anterior = self.jugadores[asiento]
+            self.bots_creados += 1
+            bot = self.asiento_restaurado(nombre, anterior.color, True)
+            bot.ficha_estado, bot.ficha_pos = anterior.ficha_estado, anterior.ficha_pos
+            bot.fichas_en_meta_final = anterior.fichas_en_meta_final
+            bot.pares_consecutivos = anterior.pares_consecutivos
+            self.jugadores[asiento] = bot
+        elif tipo == diario.SALIR:
+            del self.jugadores[valores[0]]
+        elif tipo == diario.INICIAR:
+            self.juego_iniciado = True
+            self.turno_actual_idx = 0
+            self.dados_lanzados = False
+            for jugador in self.jugadores:
+                jugador.reiniciar_fichas()
+        elif tipo == diario.DETENER:
+            self.juego_iniciado = False
+        return seq
+
+    def reanudar(self):
+        """Primer comando de una sala recuperada: corre el plazo de los humanos y, si le tocaba a un bot, sigue jugando"""
+        for jugador in self.jugadores:
+            if jugador.desconectado:
+                self.programar_gracia(jugador)
+        self.programar_plazo()
+        if not self.juego_iniciado or not isinstance(self.jugadores[self.turno_actual_idx], JugadorBot):
+            return
+        bot = self.jugadores[self.turno_actual_idx]
+        if self.dados_lanzados: # Cayó mientras el bot pensaba su jugada
+            self.pensar_bot(bot, self.posibles_movimientos(bot, bot.ultimo_dado))
+        else:
+            self.jugar_bot(bot)
+
+    def solicitar_tiempos(self):
+        """Primera fase del algoritmo de Berkeley: pide la hora a cada cliente"""
+        registro.debug("sync", "sincronización de relojes iniciada", self.id)
+        self.participantes_sync = [j for j in self.humanos() if not j.desconectado]
+
+        # Las respuestas llegan por el lector de cada cliente, que es el único que usa el socket
+        for jugador in self.participantes_sync:
+            jugador.tiempo_sync = None
+            enviar_mensaje(jugador, {"tipo": "sync_request"})
+
+    def registrar_tiempo(self, jugador, tiempo):
+        jugador.tiempo_sync = tiempo
+
+    def ajustar_relojes(self):
+        """Segunda fase: promedia las horas recibidas y envía a cada cliente su ajuste"""
+        participantes, self.participantes_sync = self.participantes_sync, []
+        tiempos = {j: j.tiempo_sync for j in participantes if j.tiempo_sync is not None}
+        for jugador in participantes:
+            if jugador not in tiempos:
+                registro.aviso("sync", "el cliente no respondió la hora", self.id, jugador=jugador.nombre)
+
+        hora_servidor = time.time()
+        total = hora_servidor + sum(tiempos.values())
+        promedio = total / (len(tiempos) + 1)
+
+        for jugador, tiempo in tiempos.items():
+            desfase = promedio - tiempo
+            try:
+                enviar_mensaje(jugador, {
+                    "tipo": "sync_adjust",
+                    "ajuste": desfase
+                })
+            except:
+                registro.aviso("sync", "no se pudo enviar el ajuste", self.id, jugador=jugador.nombre)
+
+        registro.debug("sync", "sincronización de relojes completada", self.id, respuestas=len(tiempos))
+
+
+class GestorSalas:
+    """Reparte a los jugadores entre salas independientes y crea salas nuevas cuando se llenan"""
+
+    def __init__(self, ejecutor=None, espera_bots=None, pensador=None, gracia=GRACIA_RECONEXION, limite_turno=None,
+                 rueda=None):
+        self.salas = {} # {sala_id: Sala}
+        self.salas_abiertas = {} # Salas que todavía pueden admitir jugadores, en orden de creación
+        self.bloqueo = metricas.BloqueoMedido("salas") # Solo protege los cupos y diccionarios de salas, nunca se toma durante el juego
+        self.siguiente_id = 1
+        self.ejecutor = ejecutor
+        self.espera_bots = espera_bots # Ver Sala.espera_bots
+        self.pensador = pensador
+        self.gracia = gracia # Ver Sala.gracia
+        self.limite_turno = limite_turno # Ver Sala.limite_turno
+        self.rueda = rueda
+        self.sesiones = {} # {token: Jugador}, con el bloqueo tomado
+        self.directorio_diario = None # Ver activar_diario
+        self.durabilidad = diario.DURABILIDAD_LOTE
+        self.instantanea_cada = diario.INSTANTANEA_CADA
+        self.sincronizador = None
+
+    def reservar_sala(self):
+        """Elige una sala con cupo (o crea una nueva) y le reserva una plaza"""
+        with self.bloqueo:
+            for sala in list(self.salas_abiertas.values()):
+                if sala.abierta and sala.plazas < sala.max_jugadores:
+                    sala.plazas += 1
+                    return sala
+                del self.salas_abiertas[sala.id]
+
+            sala = self.nueva_sala(self.siguiente_id)
+            self.siguiente_id += 1
+            self.salas[sala.id] = sala
+            self.salas_abiertas[sala.id] = sala
+            sala.plazas = 1
+            return sala
+
+    def nueva_sala(self, sala_id):
+        sala = Sala(sala_id, gestor=self, ejecutor=self.ejecutor, espera_bots=self.espera_bots, pensador=self.pensador,
+                    gracia=self.gracia, limite_turno=self.limite_turno, rueda=self.rueda)
+        if self.directorio_diario is not None:
+            sala.diario = diario.Diario(self.directorio_diario, sala_id, self.durabilidad, self.sincronizador,
+                                        self.instantanea_cada)
+        return sala
+
+    def activar_diario(self, directorio, durabilidad=diario.DURABILIDAD_LOTE, intervalo_fsync=diario.INTERVALO_FSYNC,
+                       instantanea_cada=diario.INSTANTANEA_CADA):
+        """Las salas anotan sus sucesos en directorio. Recupera las partidas que había en curso y devuelve cuántas"""
+        os.makedirs(directorio, exist_ok=True)
+        self.directorio_diario = directorio
+        self.durabilidad = durabilidad
+        self.instantanea_cada = instantanea_cada
+        if durabilidad == diario.DURABILIDAD_LOTE and self.sincronizador is None:
+            self.sincronizador = diario.SincronizadorDiarios(intervalo_fsync)
+        return self.recuperar()
+
+    def recuperar(self):
+        """Reconstruye las salas guardadas en el diario. Las que no tenían una partida en curso se descartan"""
+        recuperadas = []
+        for sala_id in diario.salas_guardadas(self.directorio_diario):
+            sala = self.nueva_sala(sala_id)
+            self.siguiente_id = max(self.siguiente_id, sala_id + 1) # Tampoco se reusa el id de una sala ilegible
+            try:
+                sala.restaurar(*sala.diario.leer())
+            except Exception as e:
+                # Un archivo dañado no impide recuperar las demás salas; se deja en disco para examinarlo
+                registro.error("diario", "no se pudo recuperar la sala", sala_id, ruta=sala.diario.ruta_log, error=repr(e))
+                sala.diario.cerrar()
+                continue
+            if not sala.juego_iniciado or len(sala.jugadores) < sala.min_jugadores_para_iniciar:
+                sala.cerrar_diario()
+                continue
+            sala.plazas = len(sala.jugadores)
+            sala.abierta = False # La partida ya empezó: no admite jugadores nuevos
+            recuperadas.append(sala)
+        with self.bloqueo:
+            for sala in recuperadas:
+                self.salas[sala.id] = sala
+                for jugador in sala.jugadores:
+                    if jugador.token is not None:
+                        self.sesiones[jugador.token] = jugador
+        for sala in recuperadas:
+            sala.enviar(sala.reanudar)
+        return len(recuperadas)
+
+    def unirse(self, conn, addr, nombre, salida=None):
+        """Reserva una plaza y encola el registro en la sala. El color llega después en el mensaje "color" """
+        jugador = Jugador(conn, addr, nombre, None, salida)
+        self.nueva_sesion(jugador)
+        self.reubicar(jugador)
+        return jugador
+
+    def nueva_sesion(self, jugador):
+        jugador.token = secrets.token_urlsafe(16)
+        with self.bloqueo:
+            self.sesiones[jugador.token] = jugador
+
+    def cerrar_sesion(self, jugador):
+        with self.bloqueo:
+            if self.sesiones.get(jugador.token) is jugador:
+                del self.sesiones[jugador.token]
+
+    def reconectar(self, token, conn, addr, salida, seq=None):
+        """Devuelve el jugador de la sesión y le encola la reconexión, o None si el token no es válido"""
+        with self.bloqueo:
+            jugador = self.sesiones.get(token)
+        if jugador is None:
+            return None
+        jugador.sala.enviar(jugador.sala.reconectar_jugador, jugador, conn, addr, salida, seq)
+        return jugador
+
+    def desconectar(self, jugador, conn):
+        """Se cayó la conexión sin que el jugador pidiera salir: la sala decide si le guarda el asiento"""
+        jugador.sala.enviar(jugador.sala.desconectar_jugador, jugador, conn)
+
+    def reubicar(self, jugador):
+        sala = self.reservar_sala()
+        jugador.sala = sala
+        jugador.en_sala = True
+        sala.enviar(sala.registrar_jugador, jugador)
+
+    def salir(self, jugador):
+        jugador.sala.enviar(jugador.sala.eliminar_jugador, jugador)
+
+    def observar(self, espectador, sala_id):
+        """Suscribe al espectador a la sala. Devuelve False si la sala no existe"""
+        with self.bloqueo:
+            sala = self.salas.get(sala_id)
+        if sala is None:
+            return False
+        sala.enviar(sala.agregar_espectador, espectador)
+        return True
+
+    def ocupar_plaza(self, sala):
+        """Reserva una plaza para un bot si la sala tiene cupo"""
+        with self.bloqueo:
+            if sala.plazas >= sala.max_jugadores:
+                return False
+            sala.plazas += 1
+            return True
+
+    def liberar_plaza(self, sala):
+        """Llamado por la sala cuando un jugador la deja. Elimina la sala si quedó vacía y devuelve si lo hizo"""
+        with self.bloqueo:
+            sala.plazas -= 1
+            if sala.plazas <= 0:
+                self.salas.pop(sala.id, None)
+                self.salas_abiertas.pop(sala.id, None)
+                return True
+            if sala.abierta and sala.id in self.salas:
+                self.salas_abiertas[sala.id] = sala
+            return False
+
+    def cerrar_sala(self, sala):
+        with self.bloqueo:
+            sala.abierta = False
+            self.salas_abiertas.pop(sala.id, None)
+
+    def abrir_sala(self, sala):
+        with self.bloqueo:
+            sala.abierta = True
+            if sala.id in self.salas:
+                self.salas_abiertas[sala.id] = sala
+
+    def listar_salas(self):
+        with self.bloqueo:
+            return list(self.salas.values())
@@ -0,0 +1,235 @@
+import abc
+import asyncio
+import collections
+import socket
+import threading
+import time
+
+import bitacora
+
+ALTA_MARCA_BYTES = 64 * 1024  # Por encima de esto el cliente se considera retrasado
+MAX_BYTES_PENDIENTES = 1024 * 1024  # Por encima de esto se aplica la política
+MAX_FRAMES_POR_ENVIO = 512  # Frames por llamada a sendmsg (por debajo de IOV_MAX)
+
+POLITICA_DESCONECTAR = "desconectar"  # Cierra la conexión del cliente que se quedó atrás
+POLITICA_DESCARTAR = "descartar"  # Descarta los frames nuevos mientras el cliente no se ponga al día
+POLITICAS = (POLITICA_DESCONECTAR, POLITICA_DESCARTAR)
+
+registro = bitacora.bitacora_por_defecto()
+
+
+class ColaSalida(abc.ABC):
+    """Cola acotada de frames pendientes de una conexión.
+
+    encolar() nunca bloquea: un escritor propio de cada conexión vacía la cola, así que un
+    cliente lento solo se retrasa a sí mismo y no a la sala que le envía mensajes. Cada subclase
+    aporta su escritor (ColaSalidaHilo, ColaSalidaAsyncio) e implementa _despertar.
+    """
+
+    def __init__(self, alta_marca=ALTA_MARCA_BYTES, max_pendiente=MAX_BYTES_PENDIENTES,
+                 politica=POLITICA_DESCONECTAR, al_desbordar=None):
+        self.alta_marca = alta_marca
+        self.max_pendiente = max_pendiente
+        self.politica = politica
+        self.al_desbordar = al_desbordar  # Callback invocado una vez cuando se aplica la política
+        self.frames = collections.deque()
+        self.bytes_pendientes = 0
+        self.bytes_enviados = 0
+        self.marcas = collections.deque() # (bytes_enviados al terminar el frame, traza, instante en que se encoló)
+        self.frames_descartados = 0
+        self.cerrada = False
+        self.terminando = False  # Cerrar la conexión en cuanto la cola quede vacía
+        self.desbordada = False
+        self.bloqueo = threading.Lock()
+
+    @property
+    def retrasada(self):
+        return self.bytes_pendientes > self.alta_marca
+
+    def encolar(self, frame, traza=None):
+        """Agrega un frame. Devuelve False si se descartó o la cola está cerrada.
+
+        Con una traza (trazas.Traza), el escritor registra cuánto tardó el frame en salir por el socket.
+        """
+        desbordar = despertar = False
+        with self.bloqueo:
+            if self.cerrada:
+                return False
+            if self.bytes_pendientes + len(frame) > self.max_pendiente:
+                if self.politica == POLITICA_DESCARTAR:
+                    self.frames_descartados += 1
+                    return False
+                desbordar = not self.desbordada
+                self.desbordada = True
+            else:
+                self.frames.append(frame)
+                self.bytes_pendientes += len(frame)
+                if traza is not None:
+                    self.marcas.append((self.bytes_enviados + self.bytes_pendientes, traza, time.perf_counter()))
+                despertar = len(self.frames) == 1
+        if desbordar:
+            self._desbordar()
+            return False
+        if despertar:
+            self._despertar()
+        return True
+
+    def _tomar_lote(self):
+        """Saca hasta MAX_FRAMES_POR_ENVIO frames para enviarlos en una sola llamada"""
+        with self.bloqueo:
+            n = min(len(self.frames), MAX_FRAMES_POR_ENVIO)
+            return [self.frames.popleft() for _ in range(n)]
+
+    def _confirmar_envio(self, num_bytes):
+        with self.bloqueo:
+            self.bytes_pendientes -= num_bytes
+            self.bytes_enviados += num_bytes
+            if not self.marcas:
+                return
+            enviadas = []
+            while self.marcas and self.marcas[0][0] <= self.bytes_enviados:
+                enviadas.append(self.marcas.popleft())
+        for _, traza, encolado in enviadas:
+            traza.tramo("salida", encolado, pendientes=self.bytes_pendientes)
+
+    def _desbordar(self):
+        registro.aviso("conexion", "cliente retrasado", bytes_pendientes=self.bytes_pendientes, politica=self.politica)
+        self.cerrar()
+        if self.al_desbordar is not None:
+            self.al_desbordar()
+
+    @abc.abstractmethod
+    def _despertar(self):
+        """Avisa al escritor de que hay frames nuevos, o de que la cola se terminó o se cerró"""
+
+    def terminar(self):
+        """Cierra la conexión después de enviar lo que ya está en la cola"""
+        with self.bloqueo:
+            self.terminando = True
+        self._despertar()
+
+    def cerrar(self):
+        with self.bloqueo:
+            self.cerrada = True
+            self.frames.clear()
+            self.bytes_pendientes = 0
+        self._despertar()
+
+
+class ColaSalidaHilo(ColaSalida):
+    """Cola drenada por un hilo escritor con sendmsg (un solo syscall para varios frames)"""
+
+    def __init__(self, conn, **kwargs):
+        super().__init__(**kwargs)
+        self.conn = conn
+        self.hay_datos = threading.Condition(self.bloqueo)
+        self.hilo = threading.Thread(target=self._escribir, daemon=True, name="escritor")
+        self.hilo.start()
+
+    def _despertar(self):
+        with self.hay_datos:
+            self.hay_datos.notify()
+
+    def _escribir(self):
+        while True:
+            with self.hay_datos:
+                while not self.frames and not self.cerrada and not self.terminando:
+                    self.hay_datos.wait()
+                if self.cerrada:
+                    return
+                if not self.frames:
+                    cerrar_conexion(self.conn)  # terminar(): ya se envió todo
+                    return
+            lote = self._tomar_lote()
+            total = sum(len(f) for f in lote)
+            try:
+                enviar_lote(self.conn, lote)
+            except OSError as e:
+                registro.info("conexion", "error en el escritor de la conexión", error=repr(e))
+                self.cerrar()
+                return
+            self._confirmar_envio(total)
+
+
+def enviar_lote(conn, frames):
+    """Envía todos los frames con sendmsg, reintentando desde donde quedó un envío parcial"""
+    buffers = [memoryview(f) for f in frames]
+    while buffers:
+        enviados = conn.sendmsg(buffers)
+        while enviados and buffers:
+            if enviados >= len(buffers[0]):
+                enviados -= len(buffers[0])
+                buffers.pop(0)
+            else:
+                buffers[0] = buffers[0][enviados:]
+                enviados = 0
+
+
+class ColaSalidaAsyncio(ColaSalida):
+    """Cola drenada por una tarea del event loop. encolar() puede llamarse desde cualquier hilo"""
+
+    def __init__(self, writer, loop, **kwargs):
+        super().__init__(**kwargs)
+        self.writer = writer
+        self.loop = loop
+        self.evento = asyncio.Event()
+        self.tarea = loop.create_task(self._escribir())
+
+    def _despertar(self):
+        try:
+            self.loop.call_soon_threadsafe(self.evento.set)
+        except RuntimeError:
+            pass  # El event loop ya se cerró
+
+    async def _escribir(self):
+        while True:
+            await self.evento.wait()
+            self.evento.clear()
+            if self.cerrada:
+                return
+            while self.frames:
+                lote = self._tomar_lote()
+                self.writer.writelines(lote)
+                try:
+                    await self.writer.drain()
+                except ConnectionError as e:
+                    registro.info("conexion", "error en el escritor de la conexión", error=repr(e))
+                    self.cerrar()
+                    return
+                self._confirmar_envio(sum(len(f) for f in lote))
+            if self.terminando:
+                self.writer.close()
+                return
+
+
+class SalidaDescartada:
+    """Salida de un asiento sin conexión (un bot): acepta los frames y los descarta"""
+
+    def encolar(self, frame, traza=None):
+        return True
+
+    def terminar(self):
+        pass
+
+    def cerrar(self):
+        pass
+
+
+def cerrar_conexion(conn):
+    """Cierra la conexión despertando también al hilo que esté bloqueado en recv sobre ella"""
+    try:
+        conn.shutdown(socket.SHUT_RDWR)
+    except (OSError, AttributeError):
+        pass
+    try:
+        conn.close()
+    except (OSError, AttributeError):
+        pass
+
+
+def configurar_socket(conn):
+    """El escritor ya agrupa los frames, así que se desactiva Nagle para no sumar latencia"""
+    try:
+        conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+    except OSError:
+        pass
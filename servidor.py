@@ -1,57 +1,44 @@
 import socket
 import threading
-import json
 import random
 import time
 from datetime import datetime
 
+import bitacora
+import ocupacion
+from actor import Actor
+from estado import EstadoVersionado
+from ocupacion import IndiceOcupacion
+from protocolo import DecodificadorMensajes, codificar_mensaje, recibir_mensajes
+from salida import ColaSalidaHilo, cerrar_conexion, configurar_socket
+from tablero import CARCEL, COLORES, ENTRADAS, INICIO_META, META_FINAL, NUM_CASILLAS, SEGURAS, avanzar, es_segura
+
+outboxes = {}  # {client_socket: ColaSalidaHilo} - las salas encolan y un hilo escritor por cliente envía
+registro = bitacora.bitacora_por_defecto()
+
 class ParquesServer:
     def __init__(self, host='localhost', port=5000):
         self.host = host
         self.port = port
-        self.clients = {}  # {client_socket: player_info}
-        self.game_state = {
-            'players': {},  # {player_id: player_data}
-            'current_turn': 0,
-            'game_started': False,
-            'board': self.initialize_board(),
-            'turn_order': [],
-            'dice_rolls': [],
-            'game_winner': None
-        }
-        self.colors = ['red', 'blue', 'green', 'yellow']
-        self.available_colors = self.colors.copy()
-        self.lock = threading.Lock()
-        
-    def initialize_board(self):
-        """Inicializa el tablero con 96 casillas"""
-        board = {
-            'squares': [None] * 96,  # None = vacío, player_id = ocupado
-            'safe_squares': [8, 16, 24, 32, 40, 48, 56, 64, 72, 80, 88, 0],  # Casillas de seguro
-            'exit_squares': [1, 25, 49, 73],  # Casillas de salida para cada color
-            'home_squares': {  # Casillas finales por color
-                'red': list(range(89, 96)),
-                'blue': list(range(89, 96)),
-                'green': list(range(89, 96)),
-                'yellow': list(range(89, 96))
-            }
-        }
-        return board
+        self.rooms = {}  # {room_id: ParquesRoom}
+        self.client_rooms = {}  # {client_socket: ParquesRoom}
+        self.next_room_id = 1
+        self.lock = threading.Lock()  # Solo protege rooms/client_rooms; el estado de cada sala lo maneja su actor
     
     def start_server(self):
         """Inicia el servidor"""
         server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
         server_socket.bind((self.host, self.port))
-        server_socket.listen(4)
+        server_socket.listen(128)
         
         print(f"Servidor de Parqués iniciado en {self.host}:{self.port}")
         print("Esperando jugadores...")
         
-        while len(self.clients) < 4:
+        while True:
             try:
                 client_socket, address = server_socket.accept()
-                print(f"Nueva conexión desde {address}")
+                registro.info("conexion", "nueva conexión", addr=address)
                 
                 # Crear hilo para manejar cliente
                 client_thread = threading.Thread(
@@ -62,21 +49,24 @@ class ParquesServer:
                 client_thread.start()
                 
             except Exception as e:
-                print(f"Error aceptando conexión: {e}")
+                registro.error("conexion", "error aceptando conexión", error=repr(e))
     
     def handle_client(self, client_socket, address):
         """Maneja la comunicación con un cliente"""
+        configurar_socket(client_socket)
+        outboxes[client_socket] = ColaSalidaHilo(client_socket, al_desbordar=lambda: cerrar_conexion(client_socket))
+        decoder = DecodificadorMensajes()
         try:
             while True:
-                data = client_socket.recv(1024).decode('utf-8')
-                if not data:
+                messages = recibir_mensajes(client_socket, decoder)
+                if messages is None:
                     break
                 
-                message = json.loads(data)
-                self.process_message(client_socket, message)
+                for message in messages:
+                    self.process_message(client_socket, message)
                 
         except Exception as e:
-            print(f"Error con cliente {address}: {e}")
+            registro.aviso("conexion", "error con el cliente", addr=address, error=repr(e))
         finally:
             self.disconnect_client(client_socket)
     
@@ -86,76 +76,180 @@ class ParquesServer:
         
         if msg_type == 'join_game':
             self.handle_join_game(client_socket, message)
-        elif msg_type == 'roll_dice':
-            self.handle_roll_dice(client_socket, message)
+            return
+        
+        room = self.client_rooms.get(client_socket)
+        if room is None:
+            return
+        
+        # La sala es un actor: los handlers se ejecutan en orden desde su buzón
+        if msg_type == 'roll_dice':
+            room.enviar(room.handle_roll_dice, client_socket, message)
         elif msg_type == 'move_piece':
-            self.handle_move_piece(client_socket, message)
+            room.enviar(room.handle_move_piece, client_socket, message)
         elif msg_type == 'get_game_state':
-            self.send_game_state(client_socket)
+            room.enviar(room.send_game_state, client_socket, message.get('since'))
     
     def handle_join_game(self, client_socket, message):
-        """Maneja la entrada de un jugador al juego"""
-        with self.lock:
-            if len(self.clients) >= 4:
-                self.send_message(client_socket, {
-                    'type': 'error',
-                    'message': 'Juego lleno'
-                })
-                return
-            
-            if self.game_state['game_started']:
-                self.send_message(client_socket, {
-                    'type': 'error',
-                    'message': 'Juego ya iniciado'
-                })
-                return
-            
-            username = message.get('username')
-            color = message.get('color')
+        """Ubica al jugador en la primera sala con cupo que acepte su color, o crea una nueva"""
+        if client_socket in self.client_rooms:
+            send_message(client_socket, {
+                'type': 'error',
+                'message': 'Ya estás en una sala'
+            })
+            return
+        
+        if message.get('color') not in ParquesRoom.COLORS:
+            send_message(client_socket, {
+                'type': 'error',
+                'message': 'Color no disponible'
+            })
+            return
+        
+        while True:
+            with self.lock:
+                candidates = [room for room in self.rooms.values() if room.is_open()]
             
-            # Verificar color disponible
-            if color not in self.available_colors:
-                self.send_message(client_socket, {
-                    'type': 'error',
-                    'message': 'Color no disponible'
-                })
-                return
+            for room in candidates:
+                if room.pedir(room.try_join, client_socket, message).result():
+                    break
+            else:
+                with self.lock:
+                    room = ParquesRoom(self.next_room_id)
+                    self.next_room_id += 1
+                    self.rooms[room.room_id] = room
+                if not room.pedir(room.try_join, client_socket, message).result():
+                    continue
             
-            # Crear jugador
-            player_id = len(self.clients)
-            player_data = {
+            with self.lock:
+                self.client_rooms[client_socket] = room
+            return
+    
+    def disconnect_client(self, client_socket):
+        """Desconecta un cliente y elimina su sala si quedó vacía"""
+        with self.lock:
+            room = self.client_rooms.pop(client_socket, None)
+        
+        if room is not None:
+            room.pedir(room.remove_client, client_socket).result()
+            with self.lock:
+                if not room.clients:
+                    self.rooms.pop(room.room_id, None)
+        
+        outbox = outboxes.pop(client_socket, None)
+        if outbox is not None:
+            outbox.cerrar()
+        try:
+            client_socket.close()
+        except:
+            pass
+
+
+def send_message(client_socket, message):
+    """Envía un mensaje a un cliente específico"""
+    send_frame(client_socket, codificar_mensaje(message))
+
+
+def send_frame(client_socket, frame):
+    """Envía un frame ya codificado (el mismo objeto bytes puede ir a varios clientes)"""
+    try:
+        outbox = outboxes.get(client_socket)
+        if outbox is not None:
+            outbox.encolar(frame)
+        else:
+            client_socket.sendall(frame)
+    except Exception as e:
+        registro.error("envio", "error enviando mensaje", error=repr(e))
+
+
+class ParquesRoom(Actor):
+    """Una mesa de Parqués con su propio estado. Sus métodos se ejecutan desde el buzón del actor"""
+    COLORS = COLORES
+    
+    def __init__(self, room_id):
+        super().__init__()
+        self.room_id = room_id
+        self.clients = {}  # {client_socket: player_info}
+        self.game_state = {
+            'players': {},  # {player_id: player_data}
+            'current_turn': 0,
+            'game_started': False,
+            'board': self.initialize_board(),
+            'turn_order': [],
+            'dice_rolls': [],
+            'game_winner': None
+        }
+        self.available_colors = self.COLORS.copy()
+        self.next_player_id = 0
+        self.state = EstadoVersionado()  # Posiciones y turno versionados para get_game_state
+        self.occupancy = IndiceOcupacion()  # Casilla -> fichas (player_id, piece_index)
+        
+    def initialize_board(self):
+        """Inicializa el tablero con las casillas de tablero.py (camino global y metas de cada color)"""
+        board = {
+            'squares': [None] * NUM_CASILLAS,  # None = vacío, player_id = ocupado
+            'safe_squares': [i for i in range(NUM_CASILLAS) if (SEGURAS >> i) & 1],  # Casillas de seguro
+            'exit_squares': [ENTRADAS[color] for color in COLORES],  # Casillas de salida para cada color
+            'home_squares': {  # Casillas finales por color
+                color: list(range(INICIO_META[color], META_FINAL[color] + 1)) for color in COLORES
+            }
+        }
+        return board
+    
+    def is_open(self):
+        """Indica si la sala todavía acepta jugadores"""
+        return len(self.clients) < 4 and not self.game_state['game_started']
+    
+    def try_join(self, client_socket, message):
+        """Agrega al jugador a la sala. Devuelve False si la sala está llena, iniciada o sin su color"""
+        if not self.is_open():
+            return False
+        
+        username = message.get('username')
+        color = message.get('color')
+        
+        # Verificar color disponible
+        if color not in self.available_colors:
+            return False
+        
+        # Crear jugador
+        player_id = self.next_player_id
+        self.next_player_id += 1
+        player_data = {
+            'id': player_id,
+            'username': username,
+            'color': color,
+            'pieces': [{'position': CARCEL, 'in_jail': True} for _ in range(4)],
+            'socket': client_socket
+        }
+        
+        self.clients[client_socket] = player_data
+        self.game_state['players'][player_id] = player_data
+        self.available_colors.remove(color)
+        
+        # Enviar confirmación
+        self.send_message(client_socket, {
+            'type': 'join_success',
+            'player_id': player_id,
+            'color': color,
+            'room_id': self.room_id
+        })
+        
+        # Broadcast a todos los jugadores
+        self.broadcast_message({
+            'type': 'player_joined',
+            'player': {
                 'id': player_id,
                 'username': username,
-                'color': color,
-                'pieces': [{'position': -1, 'in_jail': True} for _ in range(4)],  # -1 = en cárcel
-                'socket': client_socket
-            }
-            
-            self.clients[client_socket] = player_data
-            self.game_state['players'][player_id] = player_data
-            self.available_colors.remove(color)
-            
-            # Enviar confirmación
-            self.send_message(client_socket, {
-                'type': 'join_success',
-                'player_id': player_id,
                 'color': color
-            })
-            
-            # Broadcast a todos los jugadores
-            self.broadcast_message({
-                'type': 'player_joined',
-                'player': {
-                    'id': player_id,
-                    'username': username,
-                    'color': color
-                },
-                'total_players': len(self.clients)
-            })
-            
-            # Iniciar juego si hay al menos 2 jugadores
-            if len(self.clients) >= 2:
-                self.start_game()
+            },
+            'total_players': len(self.clients)
+        })
+        
+        # Iniciar juego si hay al menos 2 jugadores
+        if len(self.clients) >= 2:
+            self.start_game()
+        return True
     
     def start_game(self):
         """Inicia el juego"""
@@ -177,7 +271,7 @@ class ParquesServer:
             'current_turn': self.game_state['current_turn']
         })
         
-        print("¡Juego iniciado!")
+        registro.info("partida", "juego iniciado", self.room_id, turnos=self.game_state['turn_order'])
     
     def determine_first_player(self):
         """Determina el primer jugador tirando dados"""
@@ -234,7 +328,7 @@ class ParquesServer:
         dice2 = random.randint(1, 6)
         is_double = dice1 == dice2
 
-        print(f"[DEBUG] Jugador {player_id} lanzó los dados: {dice1}, {dice2} (doble: {is_double})")
+        registro.debug("dados", "dados lanzados", self.room_id, jugador=player_id, dado1=dice1, dado2=dice2, doble=is_double)
         
         dice_result = {
             'dice1': dice1,
@@ -269,6 +363,7 @@ class ParquesServer:
             if piece['in_jail']:
                 piece['in_jail'] = False
                 piece['position'] = self.get_start_position(player['color'])
+                self.occupancy.colocar(player_id, i, piece['position'])
                 
                 self.broadcast_message({
                     'type': 'piece_released',
@@ -280,23 +375,18 @@ class ParquesServer:
     
     def get_start_position(self, color):
         """Obtiene la posición de inicio según el color"""
-        start_positions = {
-            'red': 1,
-            'blue': 25,
-            'green': 49,
-            'yellow': 73
-        }
-        return start_positions.get(color, 1)
+        return ENTRADAS[color]
     
     def get_possible_moves(self, player_id, dice1, dice2):
         """Calcula los movimientos posibles para un jugador"""
         player = self.game_state['players'][player_id]
+        color = player['color']
         possible_moves = []
         
         for i, piece in enumerate(player['pieces']):
             if not piece['in_jail']:
-                # Movimiento con dado 1
-                new_pos1 = (piece['position'] + dice1) % 96
+                # Movimiento con dado 1 (None si se pasa de la meta)
+                new_pos1 = avanzar(color, piece['position'], dice1)
                 if self.is_valid_move(player_id, i, new_pos1):
                     possible_moves.append({
                         'piece_index': i,
@@ -305,7 +395,7 @@ class ParquesServer:
                     })
                 
                 # Movimiento con dado 2
-                new_pos2 = (piece['position'] + dice2) % 96
+                new_pos2 = avanzar(color, piece['position'], dice2)
                 if self.is_valid_move(player_id, i, new_pos2):
                     possible_moves.append({
                         'piece_index': i,
@@ -314,7 +404,7 @@ class ParquesServer:
                     })
                 
                 # Movimiento con suma de dados
-                new_pos_sum = (piece['position'] + dice1 + dice2) % 96
+                new_pos_sum = avanzar(color, piece['position'], dice1 + dice2)
                 if self.is_valid_move(player_id, i, new_pos_sum):
                     possible_moves.append({
                         'piece_index': i,
@@ -327,13 +417,12 @@ class ParquesServer:
     def is_valid_move(self, player_id, piece_index, new_position):
         """Verifica si un movimiento es válido"""
         # Verificar límites del tablero
-        if new_position < 0 or new_position >= 96:
+        if new_position is None or new_position < 0 or new_position >= NUM_CASILLAS:
             return False
         
         # Verificar si la casilla está ocupada por otra ficha del mismo jugador
-        player = self.game_state['players'][player_id]
-        for i, piece in enumerate(player['pieces']):
-            if i != piece_index and piece['position'] == new_position:
+        for owner, i in self.occupancy.fichas_en(new_position):
+            if owner == player_id and i != piece_index:
                 return False
         
         return True
@@ -352,10 +441,19 @@ class ParquesServer:
         if self.game_state['current_turn'] != player_id:
             return
         
+        if (not isinstance(piece_index, int) or not 0 <= piece_index < 4
+                or not isinstance(new_position, int) or not 0 <= new_position < NUM_CASILLAS):
+            self.send_message(client_socket, {
+                'type': 'error',
+                'message': 'Movimiento inválido'
+            })
+            return
+        
         # Mover la ficha
         player = self.game_state['players'][player_id]
         old_position = player['pieces'][piece_index]['position']
         player['pieces'][piece_index]['position'] = new_position
+        self.occupancy.mover(player_id, piece_index, old_position, new_position)
         
         # Verificar capturas
         self.check_captures(player_id, new_position)
@@ -385,24 +483,22 @@ class ParquesServer:
     def check_captures(self, player_id, position):
         """Verifica si se captura alguna ficha enemiga"""
         # Verificar si la posición es un seguro
-        if position in self.game_state['board']['safe_squares']:
+        if es_segura(position):
             return
         
         captured_pieces = []
         
-        for other_player_id, other_player in self.game_state['players'].items():
-            if other_player_id == player_id:
-                continue
-            
-            for i, piece in enumerate(other_player['pieces']):
-                if piece['position'] == position and not piece['in_jail']:
-                    # Enviar a la cárcel
-                    piece['position'] = -1
-                    piece['in_jail'] = True
-                    captured_pieces.append({
-                        'player_id': other_player_id,
-                        'piece_index': i
-                    })
+        for other_player_id, i in self.occupancy.rivales_en(position, player_id):
+            piece = self.game_state['players'][other_player_id]['pieces'][i]
+            if not piece['in_jail']:
+                # Enviar a la cárcel
+                piece['position'] = CARCEL
+                piece['in_jail'] = True
+                self.occupancy.quitar(other_player_id, i, position)
+                captured_pieces.append({
+                    'player_id': other_player_id,
+                    'piece_index': i
+                })
         
         if captured_pieces:
             self.broadcast_message({
@@ -434,53 +530,66 @@ class ParquesServer:
             'current_turn': self.game_state['current_turn']
         })
     
-    def send_game_state(self, client_socket):
-        """Envía el estado completo del juego"""
+    def despues_de_comando(self):
+        """Registra una nueva versión del estado si el comando movió fichas o cambió el turno"""
+        pieces = {(player_id, i): piece['position']
+                  for player_id, player in self.game_state['players'].items()
+                  for i, piece in enumerate(player['pieces'])}
+        if ocupacion.DEPURAR:
+            self.occupancy.verificar((player_id, i, position) for (player_id, i), position in pieces.items())
+        turn = self.game_state['current_turn'] if self.game_state['game_started'] else None
+        self.state.actualizar(pieces, turn)
+    
+    def send_game_state(self, client_socket, since=None):
+        """Envía los cambios desde la versión 'since', o el estado completo si es muy antigua"""
+        state = self.state.cambios_desde(since)
+        state['game_started'] = self.game_state['game_started']
+        state['game_winner'] = self.game_state['game_winner']
+        if state['completo']:
+            state['players'] = [
+                {'id': p['id'], 'username': p['username'], 'color': p['color']}
+                for p in self.game_state['players'].values()
+            ]
         self.send_message(client_socket, {
             'type': 'game_state',
-            'state': self.game_state
+            'state': state
         })
     
     def send_message(self, client_socket, message):
         """Envía un mensaje a un cliente específico"""
-        try:
-            message_str = json.dumps(message)
-            client_socket.send(message_str.encode('utf-8'))
-        except Exception as e:
-            print(f"Error enviando mensaje: {e}")
+        send_message(client_socket, message)
     
     def broadcast_message(self, message):
         """Envía un mensaje a todos los clientes"""
+        frame = codificar_mensaje(message)  # Se serializa una vez y se comparte el mismo frame
         for client_socket in list(self.clients.keys()):
-            self.send_message(client_socket, message)
+            send_frame(client_socket, frame)
     
-    def disconnect_client(self, client_socket):
-        """Desconecta un cliente"""
-        if client_socket in self.clients:
-            player_data = self.clients[client_socket]
-            player_id = player_data['id']
-            color = player_data['color']
-            
-            # Remover cliente
-            del self.clients[client_socket]
-            del self.game_state['players'][player_id]
-            
-            # Hacer color disponible de nuevo
-            if color not in self.available_colors:
-                self.available_colors.append(color)
-            
-            # Notificar a otros jugadores
-            self.broadcast_message({
-                'type': 'player_disconnected',
-                'player_id': player_id
-            })
-            
-            print(f"Jugador {player_id} desconectado")
+    def remove_client(self, client_socket):
+        """Saca al cliente de la sala"""
+        if client_socket not in self.clients:
+            return
+        player_data = self.clients[client_socket]
+        player_id = player_data['id']
+        color = player_data['color']
         
-        try:
-            client_socket.close()
-        except:
-            pass
+        # Remover cliente
+        del self.clients[client_socket]
+        del self.game_state['players'][player_id]
+        for i, piece in enumerate(player_data['pieces']):
+            self.occupancy.quitar(player_id, i, piece['position'])
+        
+        # Hacer color disponible de nuevo
+        if color not in self.available_colors:
+            self.available_colors.append(color)
+        
+        # Notificar a otros jugadores
+        self.broadcast_message({
+            'type': 'player_disconnected',
+            'player_id': player_id
+        })
+        
+        registro.info("conexion", "jugador desconectado", self.room_id, jugador=player_id)
 
 if __name__ == "__main__":
     server = ParquesServer()
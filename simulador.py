@@ -0,0 +1,209 @@
+"""Simulador de partidas sin red, para probar reglas y equilibrio sin jugar a mano.
+
+Juega con reglas.Partida, las mismas reglas que las salas del servidor. Cada asiento elige ficha
+con una política y los dados salen de un random.Random con semilla propia por partida, así que
+los resultados no dependen del número de procesos en que se repartan las partidas.
+
+    python simulador.py --partidas 100000 --jugadores 4 --politicas aleatoria codiciosa
+"""
+
+import argparse
+import multiprocessing
+import random
+import time
+
+from bots import elegir_ficha, posicion_de
+from reglas import FichasJugador, Partida
+from tablero import COLORES, es_segura
+from transiciones import EN_CAMINO, EN_CARCEL, EN_META_FINAL, ILEGAL, transicion
+
+MAX_LANZAMIENTOS = 5000 # Corta partidas que no terminan (no debería pasar con políticas razonables)
+PARTIDAS_POR_BLOQUE = 500 # Partidas que un proceso juega antes de devolver sus estadísticas
+
+
+# --- Políticas: (partida, jugador, movibles) -> ficha_idx ---
+
+def politica_primera(partida, jugador, movibles):
+    """Siempre la primera ficha movible, como el cliente de benchmark.py"""
+    return movibles[0]
+
+
+def politica_aleatoria(partida, jugador, movibles):
+    return movibles[0] if len(movibles) == 1 else partida.rng.choice(movibles)
+
+
+def politica_codiciosa(partida, jugador, movibles):
+    """Come si puede; si no, llega a la meta, saca fichas de la cárcel o avanza la más adelantada"""
+    mejor, mejor_puntos = movibles[0], None
+    for ficha_idx in movibles:
+        estado = jugador.ficha_estado[ficha_idx]
+        if estado == EN_CARCEL:
+            puntos = 2
+        else:
+            destino = transicion(jugador.color, estado, jugador.ficha_pos[ficha_idx], jugador.ultimo_dado)
+            if destino is ILEGAL:
+                continue
+            if destino[0] == EN_META_FINAL:
+                puntos = 3
+            elif destino[0] == EN_CAMINO and not es_segura(destino[2]) and partida.ocupacion.rivales_en(destino[2], jugador):
+                puntos = 4
+            else:
+                puntos = 1
+        if mejor_puntos is None or puntos > mejor_puntos:
+            mejor, mejor_puntos = ficha_idx, puntos
+    return mejor
+
+
+def politica_expectimax(partida, jugador, movibles):
+    """La búsqueda de los bots del servidor, a profundidad fija para que la simulación sea reproducible"""
+    return elegir_ficha(posicion_de(partida.jugadores), tuple(j.color for j in partida.jugadores), partida.turno_actual_idx,
+                        jugador.ultimo_dado, partida.ultimo_dado_dobles, movibles, presupuesto=None, profundidad_maxima=2)
+
+
+POLITICAS = {
+    "primera": politica_primera,
+    "aleatoria": politica_aleatoria,
+    "codiciosa": politica_codiciosa,
+    "expectimax": politica_expectimax,
+}
+
+
+class PartidaSimulada(Partida):
+    """Partida que solo cuenta los sucesos que interesan a las estadísticas"""
+
+    def __init__(self, rng):
+        super().__init__(rng)
+        self.capturas = 0
+        self.tres_pares = 0
+
+    def al_comer(self, jugador, rival, ficha_idx, celda):
+        self.capturas += 1
+
+    def al_sacar_tres_pares(self, jugador):
+        self.tres_pares += 1
+
+
+class Estadisticas:
+    """Totales de un conjunto de partidas; se suman entre procesos"""
+
+    def __init__(self, num_jugadores):
+        self.partidas = 0
+        self.terminadas = 0
+        self.lanzamientos = 0
+        self.movimientos = 0
+        self.capturas = 0
+        self.tres_pares = 0
+        self.victorias = [0] * num_jugadores # Por asiento, en orden de turno
+        self.segundos = 0.0
+
+    def sumar(self, otras):
+        self.partidas += otras.partidas
+        self.terminadas += otras.terminadas
+        self.lanzamientos += otras.lanzamientos
+        self.movimientos += otras.movimientos
+        self.capturas += otras.capturas
+        self.tres_pares += otras.tres_pares
+        self.victorias = [a + b for a, b in zip(self.victorias, otras.victorias)]
+        self.segundos += otras.segundos
+
+    def informe(self, duracion):
+        n = max(1, self.partidas)
+        terminadas = max(1, self.terminadas)
+        lineas = [
+            f"  partidas: {self.partidas:,} en {duracion:.2f} s ({self.partidas / duracion:,.0f} partidas/s, "
+            f"{self.partidas / max(self.segundos, 1e-9):,.0f} partidas/s por proceso)",
+            f"  terminadas: {self.terminadas:,} ({self.terminadas / n:.2%}); sin terminar: {self.partidas - self.terminadas:,}",
+            f"  duración media: {self.lanzamientos / n:.1f} lanzamientos, {self.movimientos / n:.1f} movimientos",
+            f"  capturas: {self.capturas / n:.2f} por partida ({self.capturas / max(1, self.movimientos):.2%} de los movimientos)",
+            f"  tres pares seguidos: {self.tres_pares / n:.3f} por partida",
+        ]
+        esperado = 1 / len(self.victorias)
+        for asiento, victorias in enumerate(self.victorias):
+            lineas.append(f"  victorias asiento {asiento + 1} ({COLORES[asiento]}): {victorias / terminadas:.2%}")
+        lineas.append(f"  ventaja del primer jugador: {self.victorias[0] / terminadas - esperado:+.2%} "
+                      f"sobre el {esperado:.2%} esperado")
+        return "\n".join(lineas)
+
+
+def semilla_partida(semilla, numero):
+    """Semilla de la partida número `numero`: cada partida se puede reproducir por separado"""
+    return (semilla << 32) | numero
+
+
+def jugar_partida(politicas, rng, max_lanzamientos=MAX_LANZAMIENTOS):
+    """Juega una partida con una política por asiento. Devuelve la PartidaSimulada y sus contadores"""
+    partida = PartidaSimulada(rng)
+    partida.jugadores = [FichasJugador(COLORES[i]) for i in range(len(politicas))]
+    partida.iniciar()
+    lanzamientos = movimientos = 0
+    while partida.juego_iniciado and lanzamientos < max_lanzamientos:
+        asiento = partida.turno_actual_idx
+        jugador = partida.jugadores[asiento]
+        movibles = partida.lanzar_dados(jugador)
+        lanzamientos += 1
+        if movibles:
+            partida.mover_ficha(jugador, politicas[asiento](partida, jugador, movibles))
+            movimientos += 1
+    return partida, lanzamientos, movimientos
+
+
+def simular_bloque(nombres_politicas, semilla, inicio, cantidad, max_lanzamientos=MAX_LANZAMIENTOS):
+    """Juega las partidas inicio..inicio+cantidad-1 (se ejecuta en un proceso del pool)"""
+    politicas = [POLITICAS[nombre] for nombre in nombres_politicas]
+    estadisticas = Estadisticas(len(politicas))
+    comienzo = time.perf_counter()
+    for numero in range(inicio, inicio + cantidad):
+        partida, lanzamientos, movimientos = jugar_partida(politicas, random.Random(semilla_partida(semilla, numero)), max_lanzamientos)
+        estadisticas.partidas += 1
+        estadisticas.lanzamientos += lanzamientos
+        estadisticas.movimientos += movimientos
+        estadisticas.capturas += partida.capturas
+        estadisticas.tres_pares += partida.tres_pares
+        if partida.ganador is not None:
+            estadisticas.terminadas += 1
+            estadisticas.victorias[partida.jugadores.index(partida.ganador)] += 1
+    estadisticas.segundos = time.perf_counter() - comienzo
+    return estadisticas
+
+
+def _simular_bloque(argumentos):
+    return simular_bloque(*argumentos)
+
+
+def simular(num_partidas, nombres_politicas, semilla=1, procesos=None, max_lanzamientos=MAX_LANZAMIENTOS):
+    """Reparte num_partidas entre procesos y devuelve las Estadisticas sumadas.
+
+    nombres_politicas tiene una política por asiento (de 2 a 4 jugadores). Con procesos=1 todo
+    se juega en este proceso, sin pool.
+    """
+    if not 2 <= len(nombres_politicas) <= len(COLORES):
+        raise ValueError(f"Se necesitan de 2 a {len(COLORES)} jugadores")
+    bloques = [(nombres_politicas, semilla, inicio, min(PARTIDAS_POR_BLOQUE, num_partidas - inicio), max_lanzamientos)
+               for inicio in range(0, num_partidas, PARTIDAS_POR_BLOQUE)]
+    total = Estadisticas(len(nombres_politicas))
+    if procesos == 1:
+        for bloque in bloques:
+            total.sumar(_simular_bloque(bloque))
+        return total
+    with multiprocessing.Pool(procesos) as pool:
+        for estadisticas in pool.imap_unordered(_simular_bloque, bloques):
+            total.sumar(estadisticas)
+    return total
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulador de partidas de Parqués sin red")
+    parser.add_argument("--partidas", type=int, default=10000)
+    parser.add_argument("--jugadores", type=int, default=4, help="Asientos (2-4); las políticas se repiten si hay menos")
+    parser.add_argument("--politicas", nargs="+", default=["aleatoria"], choices=sorted(POLITICAS),
+                        help="Política de cada asiento, en orden de turno")
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--procesos", type=int, default=None, help="Procesos del pool (por defecto, uno por CPU)")
+    parser.add_argument("--max-lanzamientos", type=int, default=MAX_LANZAMIENTOS)
+    args = parser.parse_args()
+
+    nombres = [args.politicas[i % len(args.politicas)] for i in range(args.jugadores)]
+    print(f"[simulador] {args.partidas:,} partidas, asientos: {', '.join(nombres)}, semilla {args.semilla}")
+    inicio = time.perf_counter()
+    resultado = simular(args.partidas, nombres, args.semilla, args.procesos, args.max_lanzamientos)
+    print(resultado.informe(time.perf_counter() - inicio))
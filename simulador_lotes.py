@@ -0,0 +1,247 @@
+"""Motor por lotes: miles de partidas avanzan a la vez, un lanzamiento por paso, con arrays de numpy.
+
+Las fichas de todas las partidas viven en arrays [partida, asiento, ficha] (ficha_estado y
+ficha_pos, como en Jugador) y cada paso aplica dados, movimientos legales, capturas y turnos a
+todas las partidas activas con operaciones vectorizadas. Las reglas son las de reglas.Partida:
+validar() juega las mismas partidas con las dos implementaciones y compara el resultado.
+
+numpy es opcional: solo lo necesita este módulo.
+
+    python simulador_lotes.py --partidas 100000 --jugadores 4
+    python simulador_lotes.py --validar 2000
+"""
+
+import argparse
+import random
+import time
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from reglas import MAX_PARES_CONSECUTIVOS, NUM_FICHAS, Partida
+from simulador import MAX_LANZAMIENTOS, Estadisticas, jugar_partida, politica_primera, semilla_partida
+from tablero import COLORES, ENTRADAS, NUM_CASILLAS_GLOBAL, es_segura
+from transiciones import EN_CAMINO, EN_CARCEL, EN_META, EN_META_FINAL, ILEGAL, MAX_DADO, TRANSICIONES
+
+POLITICAS_LOTE = ("primera", "aleatoria")
+
+_tablas = None
+
+
+def tablas():
+    """TRANSICIONES como arrays [color, total, estado, pos] (-1 = ILEGAL), compiladas la primera vez"""
+    global _tablas
+    if _tablas is None:
+        forma = (len(COLORES), MAX_DADO + 1, EN_META_FINAL + 1, NUM_CASILLAS_GLOBAL)
+        destino_estado = np.full(forma, -1, np.int8)
+        destino_pos = np.full(forma, -1, np.int16)
+        for c, color in enumerate(COLORES):
+            for total, filas in enumerate(TRANSICIONES[color]):
+                for estado, fila in enumerate(filas):
+                    for pos, destino in enumerate(fila):
+                        if destino is not ILEGAL:
+                            destino_estado[c, total, estado, pos], destino_pos[c, total, estado, pos] = destino[:2]
+        seguras = np.array([es_segura(celda) for celda in range(NUM_CASILLAS_GLOBAL)])
+        entradas = np.array([ENTRADAS[color] for color in COLORES], np.int16)
+        _tablas = (destino_estado, destino_pos, seguras, entradas)
+    return _tablas
+
+
+class DadosPorPartida:
+    """Dados de cada partida tirados con su propio random.Random, como en simulador.simular().
+
+    Lento (un bucle de Python por paso), pero reproduce exactamente las tiradas del motor escalar.
+    """
+
+    def __init__(self, semilla, num_partidas, inicio=0):
+        self.partidas = [Partida(random.Random(semilla_partida(semilla, numero)))
+                         for numero in range(inicio, inicio + num_partidas)]
+
+    def __call__(self, indices):
+        tiradas = np.array([self.partidas[i].tirar_dados() for i in indices], np.int8).reshape(-1, 2)
+        return tiradas[:, 0], tiradas[:, 1]
+
+
+class LotePartidas:
+    """num_partidas partidas de num_jugadores asientos que avanzan juntas.
+
+    dados es una función (indices de partidas activas) -> (dado1, dado2); por defecto los tira un
+    generador de numpy con la semilla dada. politica es "primera" o "aleatoria" para todos los asientos.
+    """
+
+    def __init__(self, num_partidas, num_jugadores, politica="aleatoria", semilla=1, dados=None,
+                 max_lanzamientos=MAX_LANZAMIENTOS):
+        if np is None:
+            raise RuntimeError("El motor por lotes necesita numpy (pip install numpy)")
+        if not 2 <= num_jugadores <= len(COLORES):
+            raise ValueError(f"Se necesitan de 2 a {len(COLORES)} jugadores")
+        if politica not in POLITICAS_LOTE:
+            raise ValueError(f"Política desconocida para lotes: {politica}")
+        self.num_jugadores = num_jugadores
+        self.politica = politica
+        self.max_lanzamientos = max_lanzamientos
+        self.generador = np.random.default_rng(semilla)
+        self.dados = dados or self.tirar_dados
+
+        forma = (num_partidas, num_jugadores, NUM_FICHAS)
+        self.ficha_estado = np.zeros(forma, np.int8) # Todas en la cárcel
+        self.ficha_pos = np.full(forma, -1, np.int16)
+        self.turno = np.zeros(num_partidas, np.int8) # Asiento en turno (= índice de color)
+        self.pares = np.zeros(num_partidas, np.int8) # pares_consecutivos del jugador en turno
+        self.activa = np.ones(num_partidas, bool)
+        self.ganador = np.full(num_partidas, -1, np.int8)
+        self.lanzamientos = np.zeros(num_partidas, np.int32)
+        self.movimientos = np.zeros(num_partidas, np.int32)
+        self.capturas = np.zeros(num_partidas, np.int32)
+        self.tres_pares = np.zeros(num_partidas, np.int32)
+
+    def tirar_dados(self, indices):
+        tiradas = self.generador.integers(1, 7, size=(2, len(indices)), dtype=np.int8)
+        return tiradas[0], tiradas[1]
+
+    def elegir(self, movibles):
+        """Ficha elegida en cada partida entre las movibles (filas sin movibles devuelven 0)"""
+        if self.politica == "primera":
+            return movibles.argmax(1)
+        return (self.generador.random(movibles.shape) * movibles).argmax(1)
+
+    def paso(self):
+        """Un lanzamiento (y su movimiento, si lo hay) en cada partida activa. Devuelve False si no queda ninguna"""
+        destino_estado, destino_pos, seguras, entradas = tablas()
+        g = np.flatnonzero(self.activa)
+        if not g.size:
+            return False
+        dado1, dado2 = self.dados(g)
+        actual = self.turno[g].astype(np.intp)
+        total = (dado1 + dado2).astype(np.intp)
+        dobles = dado1 == dado2
+        self.lanzamientos[g] += 1
+        pares = np.where(dobles, self.pares[g] + 1, 0)
+        estado = self.ficha_estado[g, actual] # Copias [n, ficha] de las fichas del jugador en turno
+        pos = self.ficha_pos[g, actual]
+        siguiente = ~dobles # Con pares repite el mismo jugador
+
+        # Tercer par seguido: la primera ficha en juego vuelve a la cárcel y pasa el turno
+        tres = pares >= MAX_PARES_CONSECUTIVOS
+        if tres.any():
+            en_juego = (estado == EN_CAMINO) | (estado == EN_META)
+            filas = np.flatnonzero(tres & en_juego.any(1))
+            primera = en_juego.argmax(1)[filas]
+            estado[filas, primera] = EN_CARCEL
+            pos[filas, primera] = -1
+            pares[tres] = 0
+            siguiente |= tres
+            self.tres_pares[g[tres]] += 1
+
+        # Movimientos legales: con pares y fichas en la cárcel solo se puede sacar una
+        en_carcel = estado == EN_CARCEL
+        salida = dobles & en_carcel.any(1)
+        filas_tabla = (actual[:, None], total[:, None], estado, np.maximum(pos, 0))
+        nuevo_estado, nueva_pos = destino_estado[filas_tabla], destino_pos[filas_tabla]
+        movibles = np.where(salida[:, None], en_carcel, nuevo_estado >= 0) & ~tres[:, None]
+        filas = np.flatnonzero(movibles.any(1))
+        ficha = self.elegir(movibles[filas])
+        sale = salida[filas]
+        nuevo_estado = np.where(sale, EN_CAMINO, nuevo_estado[filas, ficha])
+        nueva_pos = np.where(sale, entradas[actual[filas]], nueva_pos[filas, ficha])
+        estado[filas, ficha] = nuevo_estado
+        pos[filas, ficha] = nueva_pos
+        self.ficha_estado[g, actual] = estado
+        self.ficha_pos[g, actual] = pos
+        self.movimientos[g[filas]] += 1
+
+        # Capturas: en el camino global, fuera de casillas seguras, una ficha por rival (la de menor índice)
+        ataca = ~sale & (nuevo_estado == EN_CAMINO)
+        ataca[ataca] = ~seguras[nueva_pos[ataca]]
+        if ataca.any():
+            partidas = g[filas[ataca]]
+            celda = nueva_pos[ataca]
+            en_celda = (self.ficha_estado[partidas] == EN_CAMINO) & (self.ficha_pos[partidas] == celda[:, None, None])
+            en_celda[np.arange(len(partidas)), actual[filas[ataca]]] = False
+            comida = en_celda.any(2)
+            fila, asiento = np.nonzero(comida)
+            ficha_comida = en_celda.argmax(2)[fila, asiento]
+            self.ficha_estado[partidas[fila], asiento, ficha_comida] = EN_CARCEL
+            self.ficha_pos[partidas[fila], asiento, ficha_comida] = -1
+            self.capturas[partidas] += comida.sum(1).astype(np.int32)
+
+        # Victoria: las cuatro fichas del jugador en la meta final
+        gana = np.zeros(len(g), bool)
+        gana[filas] = (estado[filas] == EN_META_FINAL).all(1)
+        self.activa[g[gana]] = False
+        self.ganador[g[gana]] = actual[gana]
+
+        pasa = siguiente & ~gana
+        self.turno[g] = np.where(pasa, (actual + 1) % self.num_jugadores, actual)
+        self.pares[g] = np.where(pasa, 0, pares)
+        self.activa[g] &= self.lanzamientos[g] < self.max_lanzamientos
+        return True
+
+    def jugar(self):
+        while self.paso():
+            pass
+        return self
+
+    def estadisticas(self):
+        """Totales en el mismo formato que simulador.simular()"""
+        estadisticas = Estadisticas(self.num_jugadores)
+        estadisticas.partidas = len(self.ganador)
+        estadisticas.terminadas = int((self.ganador >= 0).sum())
+        estadisticas.lanzamientos = int(self.lanzamientos.sum())
+        estadisticas.movimientos = int(self.movimientos.sum())
+        estadisticas.capturas = int(self.capturas.sum())
+        estadisticas.tres_pares = int(self.tres_pares.sum())
+        estadisticas.victorias = np.bincount(self.ganador[self.ganador >= 0], minlength=self.num_jugadores).tolist()
+        return estadisticas
+
+
+def validar(num_partidas, num_jugadores=4, semilla=1, max_lanzamientos=MAX_LANZAMIENTOS):
+    """Juega las mismas partidas con reglas.Partida y con el lote y devuelve las que difieren.
+
+    Ambos motores usan la política "primera" y las mismas tiradas por partida, así que cada
+    partida debe terminar igual: ganador, contadores y posición final de todas las fichas.
+    """
+    lote = LotePartidas(num_partidas, num_jugadores, politica="primera",
+                        dados=DadosPorPartida(semilla, num_partidas), max_lanzamientos=max_lanzamientos).jugar()
+    politicas = [politica_primera] * num_jugadores
+    diferentes = []
+    for numero in range(num_partidas):
+        partida, lanzamientos, movimientos = jugar_partida(politicas, random.Random(semilla_partida(semilla, numero)), max_lanzamientos)
+        ganador = partida.jugadores.index(partida.ganador) if partida.ganador is not None else -1
+        escalar = (ganador, lanzamientos, movimientos, partida.capturas, partida.tres_pares,
+                   [j.ficha_estado for j in partida.jugadores], [j.ficha_pos for j in partida.jugadores])
+        vectorial = (int(lote.ganador[numero]), int(lote.lanzamientos[numero]), int(lote.movimientos[numero]),
+                     int(lote.capturas[numero]), int(lote.tres_pares[numero]),
+                     lote.ficha_estado[numero].tolist(), lote.ficha_pos[numero].tolist())
+        if escalar != vectorial:
+            diferentes.append((numero, escalar, vectorial))
+    return diferentes
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Simulación de partidas de Parqués por lotes con numpy")
+    parser.add_argument("--partidas", type=int, default=100000)
+    parser.add_argument("--jugadores", type=int, default=4)
+    parser.add_argument("--politica", default="aleatoria", choices=POLITICAS_LOTE)
+    parser.add_argument("--semilla", type=int, default=1)
+    parser.add_argument("--max-lanzamientos", type=int, default=MAX_LANZAMIENTOS)
+    parser.add_argument("--validar", type=int, metavar="N", help="Compara N partidas con el motor escalar y termina")
+    args = parser.parse_args()
+
+    if args.validar:
+        diferentes = validar(args.validar, args.jugadores, args.semilla, args.max_lanzamientos)
+        for numero, escalar, vectorial in diferentes[:5]:
+            print(f"  partida {numero}:\n    escalar:  {escalar}\n    vectorial: {vectorial}")
+        print(f"[validar] {args.validar - len(diferentes)}/{args.validar} partidas idénticas al motor escalar")
+        raise SystemExit(1 if diferentes else 0)
+
+    print(f"[lotes] {args.partidas:,} partidas de {args.jugadores} jugadores, política {args.politica}, semilla {args.semilla}")
+    inicio = time.perf_counter()
+    lote = LotePartidas(args.partidas, args.jugadores, args.politica, args.semilla,
+                        max_lanzamientos=args.max_lanzamientos).jugar()
+    duracion = time.perf_counter() - inicio
+    estadisticas = lote.estadisticas()
+    estadisticas.segundos = duracion
+    print(estadisticas.informe(duracion))
@@ -0,0 +1,133 @@
+"""Topología del tablero compartida por servidor y cliente.
+
+Las coordenadas (fila, columna) se compilan una sola vez en identificadores enteros de casilla:
+0..NUM_CASILLAS_GLOBAL-1 son el camino global (el id coincide con el índice en CAMINO_GLOBAL)
+y después vienen los caminos de meta de cada color, uno tras otro. CARCEL (-1) representa
+una ficha en la cárcel. Las comprobaciones de juego pasan a ser operaciones con enteros.
+"""
+
+COLORES = ["red", "blue", "green", "yellow"]
+
+# CAMINO_GLOBAL: Lista de tuplas (fila, columna) que representan el camino principal del tablero.
+CAMINO_GLOBAL = [
+    (7,0),(7,1),(7,2),(7,3),(7,4),(7,5),(7,6),(7,7), # Camino horizontal rojo/verde
+    (6,7),(5,7),(4,7),(3,7),(2,7),(1,7),(0,7), # Camino vertical rojo/azul
+    (0,8),(0,9),(0,10), # Esquinas superiores
+    (1,10),(2,10),(3,10),(4,10),(5,10),(6,10),(7,10), # Camino vertical azul/amarillo
+    (7,11),(7,12),(7,13),(7,14),(7,15),(7,16),(7,17), # Camino horizontal azul/amarillo
+    (8,17),(9,17),(10,17), # Esquinas derechas
+    (10,16),(10,15),(10,14),(10,13),(10,12),(10,11),(10,10), # Camino horizontal verde/amarillo
+    (11,10),(12,10),(13,10),(14,10),(15,10),(16,10),(17,10), # Camino vertical verde/amarillo
+    (17,9),(17,8),(17,7), # Esquinas inferiores
+    (16,7),(15,7),(14,7),(13,7),(12,7),(11,7),(10,7), # Camino vertical verde/rojo
+    (10,6),(10,5),(10,4),(10,3),(10,2),(10,1),(10,0), # Camino horizontal verde/rojo
+    (9,0),(8,0) # Esquinas izquierdas
+]
+
+# Casilla por la que entra a la partida cada ficha que sale de la cárcel
+COORDENADAS_ENTRADA = {
+    "red":    (7,0),
+    "blue":   (0,10),
+    "green":  (10,17),
+    "yellow": (17,7)
+}
+
+# Caminos de meta (casa) para cada color. La última posición es el centro (8,8)
+CAMINOS_META = {
+    "red":    [(8,1), (8,2), (8,3), (8,4), (8,5), (8,6), (8,7), (8,8)],
+    "blue":   [(1,8), (2,8), (3,8), (4,8), (5,8), (6,8), (7,8), (8,8)],
+    "green":  [(9,16), (9,15), (9,14), (9,13), (9,12), (9,11), (9,10), (8,8)],
+    "yellow": [(16,9), (15,9), (14,9), (13,9), (12,9), (11,9), (10,9), (8,8)]
+}
+
+# Casillas seguras donde las fichas no pueden ser "comidas"
+CASILLAS_SEGURAS = [
+    (7,0), (0,7), (0,8), (0,9), (0,10), (7,10), (7,17), (8,17), (9,17), (10,17),
+    (10,10), (10,0), (9,0), (8,0), (17,7), (17,8), (17,9), (17,10),
+    # Las salidas también son seguras
+    (4,7), (7,13), (10,4), (13,10)
+]
+
+# Coordenadas de las cárceles (solo para referencia visual en el cliente)
+CARCELES_COORDS = {
+    "red":    [(1, 1), (1, 2), (2, 1), (2, 2)],
+    "blue":   [(1, 15), (1, 16), (2, 15), (2, 16)],
+    "green":  [(15, 1), (15, 2), (16, 1), (16, 2)],
+    "yellow": [(15, 15), (15, 16), (16, 15), (16, 16)]
+}
+
+# --- Tablero compilado ---
+
+CARCEL = -1
+NUM_CASILLAS_GLOBAL = len(CAMINO_GLOBAL)
+LARGO_META = len(CAMINOS_META[COLORES[0]])
+
+# Primer id del camino de meta de cada color: la casilla k de la meta es INICIO_META[color] + k
+INICIO_META = {color: NUM_CASILLAS_GLOBAL + i * LARGO_META for i, color in enumerate(COLORES)}
+META_FINAL = {color: INICIO_META[color] + LARGO_META - 1 for color in COLORES}
+NUM_CASILLAS = NUM_CASILLAS_GLOBAL + len(COLORES) * LARGO_META
+
+# COORDENADAS[celda] -> (fila, columna)
+COORDENADAS = list(CAMINO_GLOBAL) + [coord for color in COLORES for coord in CAMINOS_META[color]]
+CELDA_GLOBAL = {coord: celda for celda, coord in enumerate(CAMINO_GLOBAL)}  # (fila, columna) -> celda
+
+ENTRADAS = {color: CELDA_GLOBAL[coord] for color, coord in COORDENADAS_ENTRADA.items()}
+
+
+def _compilar_seguras():
+    bits = 0
+    for coord in CASILLAS_SEGURAS:
+        if coord not in CELDA_GLOBAL:
+            raise ValueError(f"La casilla segura {coord} no está en el camino global")
+        bits |= 1 << CELDA_GLOBAL[coord]
+    return bits
+
+
+SEGURAS = _compilar_seguras()  # Bit i encendido si la casilla i es segura
+
+
+def _compilar_accesos_meta():
+    """Casilla del camino global desde la que se entra a la meta: un paso antes, en la dirección de la meta"""
+    accesos = {}
+    for color in COLORES:
+        (f0, c0), (f1, c1) = CAMINOS_META[color][:2]
+        acceso = (2 * f0 - f1, 2 * c0 - c1)
+        if acceso not in CELDA_GLOBAL:
+            raise ValueError(f"La meta de {color} no empieza junto al camino global: {acceso}")
+        accesos[color] = CELDA_GLOBAL[acceso]
+    return accesos
+
+
+ACCESOS_META = _compilar_accesos_meta()
+
+
+def es_segura(celda):
+    return celda >= 0 and (SEGURAS >> celda) & 1 == 1
+
+
+def celda_meta(color, paso):
+    return INICIO_META[color] + paso
+
+
+def celda_ficha(color, estado, pos):
+    """Id de casilla de una ficha a partir de (ficha_estado, ficha_pos) de Jugador"""
+    if estado == 0:
+        return CARCEL
+    if estado == 1:
+        return pos
+    return INICIO_META[color] + pos
+
+
+def avanzar(color, celda, pasos):
+    """Recorrido natural de un color: da la vuelta al camino global y entra a su meta por ACCESOS_META.
+
+    Devuelve la casilla de destino o None si la ficha se pasaría de la meta final.
+    """
+    if celda >= NUM_CASILLAS_GLOBAL:
+        destino = celda + pasos
+        return destino if destino <= META_FINAL[color] else None
+    hasta_acceso = (ACCESOS_META[color] - celda) % NUM_CASILLAS_GLOBAL
+    if pasos <= hasta_acceso:
+        return (celda + pasos) % NUM_CASILLAS_GLOBAL
+    paso_meta = pasos - hasta_acceso - 1
+    return celda_meta(color, paso_meta) if paso_meta < LARGO_META else None
@@ -0,0 +1,149 @@
+"""Rueda de temporizadores jerárquica: un solo hilo vence los plazos de todas las salas.
+
+Los plazos se cuentan en ticks de RESOLUCION segundos. La rueda tiene NIVELES ruedas de
+RANURAS ranuras; la del nivel n avanza una ranura cada RANURAS**n ticks. Un temporizador va
+al nivel más bajo donde su tick de vencimiento comparte con el tick actual todos los dígitos
+de los niveles superiores, así que programar y cancelar es O(1) (agregar o quitar de un set).
+Cuando la rueda de un nivel da la vuelta, la ranura siguiente del nivel de arriba baja de
+nivel (cascada) y sus temporizadores quedan más cerca de vencer.
+
+Sin temporizadores el hilo duerme sin plazo; si el nivel 0 está vacío salta directo a la
+próxima cascada en lugar de despertarse en cada tick.
+"""
+
+import threading
+import time
+
+import bitacora
+
+RESOLUCION = 0.01 # Segundos por tick
+BITS_RANURAS = 8
+RANURAS = 1 << BITS_RANURAS
+NIVELES = 4 # 2**32 ticks: más de un año con la resolución por defecto
+MASCARA = RANURAS - 1
+
+registro = bitacora.bitacora_por_defecto()
+
+
+class Temporizador:
+    __slots__ = ("vence", "funcion", "args", "ranura", "nivel")
+
+    def __init__(self, vence, funcion, args):
+        self.vence = vence # Tick de vencimiento
+        self.funcion = funcion
+        self.args = args
+        self.ranura = None # Set donde está guardado (None = vencido o cancelado)
+        self.nivel = 0
+
+
+class RuedaTemporizadores:
+    """programar() y cancelar() se pueden llamar desde cualquier hilo.
+
+    Las funciones vencidas corren en el hilo de la rueda, de a una: tienen que ser breves
+    (típicamente sala.enviar(...), que solo encola en el buzón de la sala).
+    """
+
+    def __init__(self, resolucion=RESOLUCION):
+        self.resolucion = resolucion
+        self.ruedas = [[set() for _ in range(RANURAS)] for _ in range(NIVELES)]
+        self.por_nivel = [0] * NIVELES # Temporizadores pendientes en cada nivel
+        self.tick = 0 # Último tick procesado
+        self.inicio = time.monotonic()
+        self.condicion = threading.Condition()
+        self.hilo = threading.Thread(target=self._ejecutar, name="temporizadores", daemon=True)
+        self.hilo.start()
+
+    def __len__(self):
+        return sum(self.por_nivel)
+
+    def programar(self, segundos, funcion, *args):
+        """Llama a funcion(*args) dentro de `segundos`. Devuelve el Temporizador para cancelarlo"""
+        with self.condicion:
+            vence = int((time.monotonic() - self.inicio + max(segundos, 0)) / self.resolucion) + 1
+            temporizador = Temporizador(max(vence, self.tick + 1), funcion, args)
+            self._ubicar(temporizador)
+            if self.por_nivel[temporizador.nivel] == 1 and (temporizador.nivel == 0 or len(self) == 1):
+                self.condicion.notify() # El hilo duerme sin plazo o hasta la próxima cascada
+        return temporizador
+
+    def cancelar(self, temporizador):
+        """Quita el temporizador si todavía no venció. Cancelar dos veces no hace nada"""
+        if temporizador is None:
+            return
+        with self.condicion:
+            if temporizador.ranura is not None:
+                temporizador.ranura.discard(temporizador)
+                temporizador.ranura = None
+                self.por_nivel[temporizador.nivel] -= 1
+
+    def _ubicar(self, temporizador):
+        vence = max(temporizador.vence, self.tick + 1) # Si ya venció, sale en el próximo tick
+        diferencia = vence ^ self.tick
+        nivel = 0
+        while nivel < NIVELES - 1 and diferencia >> (BITS_RANURAS * (nivel + 1)):
+            nivel += 1 # Más allá del último nivel baja antes de tiempo y se vuelve a ubicar
+        ranura = self.ruedas[nivel][(vence >> (BITS_RANURAS * nivel)) & MASCARA]
+        ranura.add(temporizador)
+        temporizador.ranura = ranura
+        temporizador.nivel = nivel
+        self.por_nivel[nivel] += 1
+
+    def _avanzar(self):
+        """Procesa el tick siguiente y devuelve los temporizadores vencidos"""
+        self.tick += 1
+        for nivel in range(1, NIVELES):
+            if self.tick & ((1 << (BITS_RANURAS * nivel)) - 1):
+                break
+            indice = (self.tick >> (BITS_RANURAS * nivel)) & MASCARA
+            bajan, self.ruedas[nivel][indice] = self.ruedas[nivel][indice], set()
+            self.por_nivel[nivel] -= len(bajan)
+            for temporizador in bajan:
+                self._ubicar(temporizador)
+        indice = self.tick & MASCARA
+        vencidos, self.ruedas[0][indice] = self.ruedas[0][indice], set()
+        self.por_nivel[0] -= len(vencidos)
+        for temporizador in vencidos:
+            temporizador.ranura = None
+        return vencidos
+
+    def _proximo_tick(self):
+        """Próximo tick en el que puede pasar algo, o None si no hay temporizadores"""
+        if self.por_nivel[0]:
+            return self.tick + 1
+        if not any(self.por_nivel):
+            return None
+        return (self.tick | MASCARA) + 1 # Nada vence antes de la próxima cascada
+
+    def _ejecutar(self):
+        while True:
+            with self.condicion:
+                while True:
+                    proximo = self._proximo_tick()
+                    ahora = time.monotonic() - self.inicio
+                    if proximo is None:
+                        self.tick = int(ahora / self.resolucion) # Sin temporizadores el reloj salta sin procesar ticks
+                        self.condicion.wait()
+                    elif proximo * self.resolucion <= ahora:
+                        break
+                    else:
+                        self.condicion.wait(proximo * self.resolucion - ahora)
+                if not self.por_nivel[0]:
+                    self.tick = proximo - 1 # Los ticks intermedios no tienen nada que procesar
+                vencidos = self._avanzar()
+            for temporizador in vencidos:
+                try:
+                    temporizador.funcion(*temporizador.args)
+                except Exception as e:
+                    registro.error("temporizadores", "error en un temporizador", error=repr(e))
+
+
+_rueda_por_defecto = None
+_bloqueo_rueda = threading.Lock()
+
+
+def rueda_por_defecto():
+    global _rueda_por_defecto
+    with _bloqueo_rueda:
+        if _rueda_por_defecto is None:
+            _rueda_por_defecto = RuedaTemporizadores()
+        return _rueda_por_defecto
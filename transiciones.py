@@ -0,0 +1,74 @@
+"""Tabla de transiciones de las fichas, precalculada al importar.
+
+TRANSICIONES[color][dado_total][ficha_estado][ficha_pos] es ILEGAL (None) o la tupla
+(estado_destino, pos_destino, celda_destino). Generar los movimientos posibles y aplicarlos
+son consultas a la misma tabla, así que no pueden contradecirse. El total va antes que la
+ficha para que las cuatro fichas de un jugador se consulten sobre la misma subtabla.
+
+Salir de la cárcel depende de haber sacado pares, no del total, así que no está en la tabla:
+la fila del estado 0 es siempre ILEGAL y la salida usa SALIDAS.
+"""
+
+from tablero import COLORES, ENTRADAS, LARGO_META, NUM_CASILLAS_GLOBAL, celda_meta
+
+EN_CARCEL, EN_CAMINO, EN_META, EN_META_FINAL = 0, 1, 2, 3  # Valores de Jugador.ficha_estado
+MAX_DADO = 12
+ILEGAL = None
+
+
+def _destino(color, estado, pos, total):
+    if estado == EN_CAMINO:
+        nueva = pos + total
+        if nueva < NUM_CASILLAS_GLOBAL:
+            return (EN_CAMINO, nueva, nueva)
+        estado, nueva = EN_META, nueva - NUM_CASILLAS_GLOBAL  # Entra a la meta al completar el camino
+    elif estado == EN_META:
+        nueva = pos + total
+    else:
+        return ILEGAL
+    if nueva < LARGO_META - 1:
+        return (EN_META, nueva, celda_meta(color, nueva))
+    if nueva == LARGO_META - 1:  # Cae exactamente en la casilla final
+        return (EN_META_FINAL, nueva, celda_meta(color, nueva))
+    return ILEGAL  # Se pasaría de la meta
+
+
+def _compilar():
+    filas_por_estado = {EN_CARCEL: 1, EN_CAMINO: NUM_CASILLAS_GLOBAL, EN_META: LARGO_META, EN_META_FINAL: LARGO_META}
+    tabla = {}
+    for color in COLORES:
+        tabla[color] = [
+            [[_destino(color, estado, pos, total) if total >= 2 else ILEGAL for pos in range(filas_por_estado[estado])]
+             for estado in (EN_CARCEL, EN_CAMINO, EN_META, EN_META_FINAL)]
+            for total in range(MAX_DADO + 1)
+        ]
+    return tabla
+
+
+TRANSICIONES = _compilar()
+
+# Destino de una ficha que sale de la cárcel con pares
+SALIDAS = {color: (EN_CAMINO, ENTRADAS[color], ENTRADAS[color]) for color in COLORES}
+
+
+def transicion(color, estado, pos, total):
+    """Destino (estado, pos, celda) de una ficha o ILEGAL. En la cárcel pos es -1 y cae en la única fila"""
+    return TRANSICIONES[color][total][estado][pos]
+
+
+def fichas_movibles(color, ficha_estado, ficha_pos, total):
+    """Índices de las fichas que pueden avanzar dado_total casillas"""
+    filas = TRANSICIONES[color][total]
+    e0, e1, e2, e3 = ficha_estado
+    p0, p1, p2, p3 = ficha_pos
+    # Desenrollado a mano: se llama en cada lanzamiento y en cada validación de movimiento
+    movibles = []
+    if filas[e0][p0] is not ILEGAL:
+        movibles.append(0)
+    if filas[e1][p1] is not ILEGAL:
+        movibles.append(1)
+    if filas[e2][p2] is not ILEGAL:
+        movibles.append(2)
+    if filas[e3][p3] is not ILEGAL:
+        movibles.append(3)
+    return movibles
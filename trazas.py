@@ -0,0 +1,160 @@
+"""Trazas por comando en el formato JSON de eventos de trazas de Chrome (chrome://tracing, ui.perfetto.dev).
+
+Una fracción de los mensajes de los clientes se muestrea al recibirlos. Cada mensaje muestreado
+deja estos tramos:
+- decodificar: en el hilo de E/S.
+- procesar: despacho y encolado en el buzón.
+- buzon: espera hasta que el actor de la sala lo toma. Es lo que antes era la espera del bloqueo de la sala.
+- el comando: las reglas. Dentro va un "encolar" por destinatario.
+- salida: cuánto tardó cada frame en irse por el socket, medido en el hilo escritor de la conexión.
+  Un cliente lento se ve aquí.
+
+Todos los tramos llevan la sala, el jugador y el id de la traza. Una flecha une el hilo de E/S con
+el del actor.
+
+Los mensajes no muestreados solo pagan la comparación de muestrear() y la lectura de la traza
+actual al encolar. Los eventos se escriben en un hilo aparte, como en bitacora.py. El archivo es un
+arreglo JSON sin cerrar, que los visores aceptan tal cual; así se puede abrir mientras el servidor
+sigue escribiendo.
+
+    python prueba.py --trazas /tmp/parques.json --muestreo-trazas 0.01
+"""
+
+import atexit
+import itertools
+import json
+import os
+import queue
+import random
+import threading
+import time
+
+MUESTREO_TRAZAS = 0.01 # Fracción de mensajes trazados cuando se da --trazas
+
+_local = threading.local()
+_codificador = json.JSONEncoder(default=str, check_circular=False, separators=(",", ":"))
+
+
+def actual():
+    """Traza del comando que se está ejecutando en este hilo (None si no se muestreó)"""
+    return getattr(_local, "traza", None)
+
+
+def activar(traza):
+    """Marca la traza como la actual de este hilo y devuelve la anterior, para restaurarla"""
+    anterior = getattr(_local, "traza", None)
+    _local.traza = traza
+    return anterior
+
+
+def microsegundos(instante):
+    return round(instante * 1e6, 3)
+
+
+class Traza:
+    """Un mensaje muestreado. Sus tramos se pueden registrar desde cualquier hilo"""
+    __slots__ = ("trazador", "id", "sala", "jugador")
+
+    def __init__(self, trazador, traza_id, sala, jugador):
+        self.trazador = trazador
+        self.id = traza_id
+        self.sala = sala
+        self.jugador = jugador
+
+    def tramo(self, nombre, inicio, fin=None, **args):
+        """Tramo entre dos instantes de time.perf_counter() (fin=None: ahora) en el hilo actual"""
+        if fin is None:
+            fin = time.perf_counter()
+        args["traza"] = self.id
+        args["sala"] = self.sala
+        args["jugador"] = self.jugador
+        self.trazador.emitir({"name": nombre, "cat": "parques", "ph": "X", "ts": microsegundos(inicio),
+                              "dur": microsegundos(fin - inicio), "args": args})
+
+    def flecha(self, fase, instante):
+        """Une el tramo abierto en este hilo con el de otro hilo: fase "s" sale, "f" llega"""
+        evento = {"name": "comando", "cat": "parques", "ph": fase, "id": self.id, "ts": microsegundos(instante)}
+        if fase == "f":
+            evento["bp"] = "e" # Se engancha al tramo que empieza en ese instante
+        self.trazador.emitir(evento)
+
+
+class Trazador:
+    def __init__(self, fraccion=0.0, destino=None):
+        self.fraccion = fraccion # 0 = ningún mensaje trazado
+        self.destino = destino # Archivo abierto; sin destino no se muestrea nada
+        self.ids = itertools.count(1)
+        self.hilos_nombrados = set() # Hilos cuyo nombre ya se escribió (evento de metadatos)
+        self._arrancar()
+        atexit.register(self.vaciar)
+        os.register_at_fork(after_in_child=self._arrancar)
+
+    def _arrancar(self):
+        self.pid = os.getpid()
+        self.hilos_nombrados = set()
+        self.cola = queue.SimpleQueue()
+        self.hilo = threading.Thread(target=self._escribir, name="trazas", daemon=True)
+        self.hilo.start()
+
+    def configurar(self, fraccion=None, destino=None):
+        if destino is not None:
+            destino.write("[\n")
+            self.destino = destino
+        if fraccion is not None:
+            self.fraccion = fraccion
+
+    def muestrear(self, sala, jugador):
+        """Traza nueva para un mensaje, o None si no le toca"""
+        if not self.fraccion or self.destino is None or random.random() >= self.fraccion:
+            return None
+        return Traza(self, next(self.ids), sala, jugador)
+
+    def emitir(self, evento):
+        hilo = threading.get_ident()
+        evento["pid"] = self.pid
+        evento["tid"] = hilo
+        if hilo not in self.hilos_nombrados:
+            self.hilos_nombrados.add(hilo)
+            self.cola.put({"name": "thread_name", "ph": "M", "pid": self.pid, "tid": hilo,
+                           "args": {"name": threading.current_thread().name}})
+        self.cola.put(evento)
+
+    def vaciar(self, espera=2.0):
+        listo = threading.Event()
+        self.cola.put(listo)
+        listo.wait(espera)
+
+    def _escribir(self):
+        while True:
+            tanda = [self.cola.get()]
+            while len(tanda) < 1000:
+                try:
+                    tanda.append(self.cola.get_nowait())
+                except queue.Empty:
+                    break
+            listos = [e for e in tanda if isinstance(e, threading.Event)]
+            lineas = [_codificador.encode(e) + ",\n" for e in tanda if not isinstance(e, threading.Event)]
+            if lineas and self.destino is not None:
+                try:
+                    self.destino.write("".join(lineas))
+                    self.destino.flush()
+                except (OSError, ValueError):
+                    pass
+            for listo in listos:
+                listo.set()
+
+
+def abrir_destino(ruta):
+    return open(ruta, "w", encoding="utf-8", buffering=1024 * 1024)
+
+
+_trazador_por_defecto = None
+_bloqueo_trazador = threading.Lock()
+
+
+def trazador_por_defecto():
+    global _trazador_por_defecto
+    with _bloqueo_trazador:
+        if _trazador_por_defecto is None:
+            _trazador_por_defecto = Trazador()
+        return _trazador_por_defecto
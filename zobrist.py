@@ -0,0 +1,46 @@
+"""Hash Zobrist de 64 bits de la posición de las fichas, compartido por servidor, cliente y bots.
+
+Cada (color, ficha, casilla) tiene una clave aleatoria fija; el hash de una posición es el XOR
+de las claves de todas sus fichas, así que mover una ficha cuesta dos XOR. Las claves salen de
+un random.Random con semilla fija para que el cliente calcule exactamente el mismo valor.
+"""
+
+import random
+
+from tablero import COLORES, NUM_CASILLAS
+
+SEMILLA = 20240611
+FICHAS_POR_COLOR = 4
+
+
+def _generar_claves():
+    rng = random.Random(SEMILLA)
+    # CLAVES[color][ficha_idx][celda + 1]: el índice 0 es la cárcel (CARCEL = -1)
+    return {color: [[rng.getrandbits(64) for _ in range(NUM_CASILLAS + 1)] for _ in range(FICHAS_POR_COLOR)]
+            for color in COLORES}
+
+
+CLAVES = _generar_claves()
+
+
+def clave_ficha(color, ficha_idx, celda):
+    return CLAVES[color][ficha_idx][celda + 1]
+
+
+def cambio(color, ficha_idx, desde, hasta):
+    """Valor a aplicar con XOR al hash cuando una ficha pasa de la casilla desde a hasta"""
+    claves = CLAVES[color][ficha_idx]
+    return claves[desde + 1] ^ claves[hasta + 1]
+
+
+def hash_fichas(fichas):
+    """Hash completo de [(color, ficha_idx, celda), ...]"""
+    valor = 0
+    for color, ficha_idx, celda in fichas:
+        valor ^= CLAVES[color][ficha_idx][celda + 1]
+    return valor
+
+
+def formatear(valor):
+    """Los mensajes llevan el hash en hexadecimal: 64 bits no caben exactos en un número JSON de doble precisión"""
+    return f"{valor:016x}"